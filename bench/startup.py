@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+# Measures cold-start time of cheap subcommands and checks that they do not
+# import modules they have no use for. Exits with a non-zero status if a
+# budget is exceeded or a forbidden module is imported.
+#
+# Usage: python bench/startup.py [-r RUNS] [--budget-scale SCALE]
+
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_TEMPLATE_YAML = """description: Startup benchmark template
+template-values:
+  greeting: Hello
+files:
+  - README.md
+"""
+
+# Reports the modules imported by a ptool invocation on stderr
+_PROBE = """
+import sys
+sys.argv = ["ptool"] + sys.argv[1:]
+import ptool.__main__
+try:
+    ptool.__main__._main(sys.argv[1:])
+except SystemExit:
+    pass
+sys.stderr.write("\\n".join(sorted(sys.modules.keys())) + "\\n")
+"""
+
+_HEAVY_MODULES = ["jinja2", "inflection", "yaml", "pysimplevcs", "pyprelude"]
+
+# (arguments, budget in seconds, top-level modules that must not be imported)
+_CASES = [
+    (["--version"], 0.15, _HEAVY_MODULES + ["ptool.config"]),
+    (["templates"], 0.25, ["jinja2", "inflection", "yaml", "pysimplevcs"]),
+    (["values", "bench"], 0.5, ["jinja2", "inflection", "yaml"])
+]
+
+def _git(cwd, *args):
+    subprocess.check_call(
+        ["git", "-c", "user.name=bench", "-c", "user.email=bench@example.com"] + list(args),
+        cwd=cwd,
+        stdout=open(os.devnull, "w"))
+
+def _make_config_dir(root_dir):
+    source_dir = os.path.join(root_dir, "src")
+    os.makedirs(os.path.join(source_dir, "bench"))
+    with open(os.path.join(source_dir, "bench", "_ptool.yaml"), "wt") as f:
+        f.write(_TEMPLATE_YAML)
+    with open(os.path.join(source_dir, "bench", "README.md"), "wt") as f:
+        f.write("{{ greeting }}, {{ project_name }}\n")
+    _git(source_dir, "init", "-q", ".")
+    _git(source_dir, "add", "-A")
+    _git(source_dir, "commit", "-q", "-m", "Initial")
+
+    config_dir = os.path.join(root_dir, "ptool")
+    os.makedirs(config_dir)
+    _git(root_dir, "clone", "-q", source_dir, os.path.join(config_dir, "ptool-templates"))
+    return config_dir
+
+def _run(args, env, probe=False):
+    command = [sys.executable, "-c", _PROBE] if probe else [sys.executable, "-m", "ptool"]
+    start = time.time()
+    process = subprocess.Popen(
+        command + args,
+        cwd=_REPO_ROOT,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE)
+    _, stderr = process.communicate()
+    elapsed = time.time() - start
+    if process.returncode != 0:
+        raise RuntimeError("Command \"ptool {}\" failed: {}".format(" ".join(args), stderr))
+    return elapsed, stderr.decode("utf-8")
+
+def _forbidden_imports(module_names, forbidden):
+    result = set()
+    for module_name in module_names:
+        for name in forbidden:
+            if module_name == name or module_name.startswith(name + "."):
+                result.add(name)
+    return sorted(result)
+
+def _main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure ptool cold-start time")
+    parser.add_argument("-r", "--runs", type=int, default=10, help="Number of timed runs per command")
+    parser.add_argument("--budget-scale", type=float, default=1.0, help="Multiply every time budget by this factor")
+    args = parser.parse_args(argv)
+
+    root_dir = tempfile.mkdtemp()
+    try:
+        env = dict(os.environ)
+        env["PTOOL_DIR"] = _make_config_dir(root_dir)
+        env["PYTHONDONTWRITEBYTECODE"] = "1"
+
+        # Warm the template catalog and YAML cache so that commands are
+        # measured on their common path
+        _run(["templates"], env)
+        _run(["values", "bench"], env)
+
+        failures = []
+        for case_args, budget, forbidden in _CASES:
+            budget *= args.budget_scale
+            best = min(_run(case_args, env)[0] for _ in range(args.runs))
+
+            _, module_names = _run(case_args, env, probe=True)
+            imported = _forbidden_imports(module_names.splitlines(), forbidden)
+
+            print("ptool {}: {:.3f}s (budget {:.3f}s)".format(" ".join(case_args), best, budget))
+            if best > budget:
+                failures.append("ptool {} took {:.3f}s".format(" ".join(case_args), best))
+            if len(imported) > 0:
+                failures.append("ptool {} imported {}".format(" ".join(case_args), ", ".join(imported)))
+    finally:
+        shutil.rmtree(root_dir)
+
+    for failure in failures:
+        print("FAILED: {}".format(failure))
+    sys.exit(1 if len(failures) > 0 else 0)
+
+if __name__ == "__main__":
+    _main()
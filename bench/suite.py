@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+# Times ptool subcommands against a synthetic template repository whose
+# upstream is a local bare Git repository, and writes the results as JSON.
+# Passing a previous result file with --compare reports the change for each
+# benchmark and exits with a non-zero status if any got slower than the
+# allowed tolerance.
+#
+# Usage: python bench/suite.py [-t TEMPLATES] [-m FILES] [-r RUNS] [-j JOBS]
+#            [-o OUTPUT] [--compare BASELINE] [--tolerance FRACTION]
+
+from __future__ import print_function
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic import git, make_template_repo, push_change, template_names
+
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_RESULT_VERSION = 1
+
+class _Runner(object):
+    def __init__(self, config_dir):
+        self._env = dict(os.environ)
+        self._env["PTOOL_DIR"] = config_dir
+        self._cache_dir = os.path.join(config_dir, "cache")
+
+    def clear_cache(self):
+        if os.path.isdir(self._cache_dir):
+            shutil.rmtree(self._cache_dir)
+
+    def run(self, *args):
+        start = time.time()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "ptool"] + list(args),
+            cwd=_REPO_ROOT,
+            env=self._env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT)
+        output, _ = process.communicate()
+        elapsed = time.time() - start
+        if process.returncode != 0:
+            raise RuntimeError("Command \"ptool {}\" failed:\n{}".format(" ".join(args), output))
+        return elapsed
+
+def _summary(times):
+    times = sorted(times)
+    return {
+        "min": times[0],
+        "median": times[len(times) // 2],
+        "max": times[-1],
+        "runs": times
+    }
+
+def _git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=_REPO_ROOT).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _run_benchmarks(root_dir, args):
+    source_dir, bare_dir = make_template_repo(root_dir, args.templates, args.files)
+    config_dir = os.path.join(root_dir, "ptool")
+    os.makedirs(config_dir)
+    git(root_dir, "clone", "-q", bare_dir, os.path.join(config_dir, "ptool-templates"))
+
+    runner = _Runner(config_dir)
+    names = template_names(args.templates)
+    output_dir = os.path.join(root_dir, "output")
+    new_args = ["new", "-f", "-j", str(args.jobs), names[0], output_dir]
+
+    # Each benchmark is a name and a function returning the elapsed time of
+    # one run
+    def new_cold():
+        runner.clear_cache()
+        return runner.run(*new_args)
+
+    def templates_cold():
+        runner.clear_cache()
+        return runner.run("templates")
+
+    # Each update run pushes a new revision of the next template
+    revisions = itertools.count(1)
+    def update():
+        revision = next(revisions)
+        push_change(source_dir, names[revision % len(names)], revision)
+        return runner.run("update")
+
+    benchmarks = [
+        ("new-cold", new_cold),
+        ("new-warm", lambda: runner.run(*new_args)),
+        ("templates-cold", templates_cold),
+        ("templates-warm", lambda: runner.run("templates")),
+        ("values", lambda: runner.run("values", names[-1])),
+        ("update-noop", lambda: runner.run("update")),
+        ("update", update)
+    ]
+
+    results = {}
+    for name, func in benchmarks:
+        # One untimed run warms the file system and any caches the benchmark
+        # does not clear itself
+        func()
+        results[name] = _summary([func() for _ in range(args.runs)])
+        print("{}: median {:.3f}s, min {:.3f}s".format(name.ljust(16), results[name]["median"], results[name]["min"]))
+
+    return results
+
+def _compare(results, baseline, tolerance):
+    regressions = []
+    for name in sorted(results.keys()):
+        baseline_result = baseline["results"].get(name)
+        if baseline_result is None:
+            continue
+
+        ratio = results[name]["median"] / baseline_result["median"]
+        print("{}: {:.3f}s -> {:.3f}s ({:+.1f}%)".format(
+            name.ljust(16),
+            baseline_result["median"],
+            results[name]["median"],
+            (ratio - 1.0) * 100.0))
+        if ratio > 1.0 + tolerance:
+            regressions.append(name)
+    return regressions
+
+def _main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ptool against a synthetic template repository")
+    parser.add_argument("-t", "--templates", type=int, default=20, help="Number of templates")
+    parser.add_argument("-m", "--files", type=int, default=50, help="Number of files per template")
+    parser.add_argument("-r", "--runs", type=int, default=5, help="Number of timed runs per benchmark")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Jobs passed to ptool new")
+    parser.add_argument("-o", "--output", default=None, help="Write results as JSON to this file")
+    parser.add_argument("--compare", default=None, help="Compare against results previously written with --output")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed slowdown as a fraction of the baseline median")
+    args = parser.parse_args(argv)
+
+    root_dir = tempfile.mkdtemp()
+    try:
+        results = _run_benchmarks(root_dir, args)
+    finally:
+        shutil.rmtree(root_dir)
+
+    obj = {
+        "version": _RESULT_VERSION,
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "parameters": {
+            "templates": args.templates,
+            "files": args.files,
+            "runs": args.runs,
+            "jobs": args.jobs
+        },
+        "results": results
+    }
+
+    if args.output is not None:
+        with open(args.output, "wt") as f:
+            json.dump(obj, f, indent=2, sort_keys=True)
+
+    if args.compare is not None:
+        with open(args.compare, "rt") as f:
+            baseline = json.load(f)
+        if baseline.get("version") != _RESULT_VERSION or baseline.get("parameters") != obj["parameters"]:
+            print("WARNING: Baseline {} was recorded with different parameters".format(args.compare))
+
+        regressions = _compare(results, baseline, args.tolerance)
+        if len(regressions) > 0:
+            print("FAILED: Slower than baseline: {}".format(", ".join(regressions)))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    _main()
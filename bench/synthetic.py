@@ -0,0 +1,114 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+# Builds synthetic ptool-templates repositories for benchmarking. Every
+# template has a mix of small rendered files, larger rendered files, literal
+# files with no template syntax and binary files that are not preprocessed,
+# plus a _ptool.py extension and exec and symlink commands.
+
+import os
+import random
+import subprocess
+
+_TEMPLATE_EXTENSION = """def ptool_register(ctx):
+    ctx.filters["shout"] = lambda s: s.upper() + "!"
+"""
+
+_RENDERED_LINE = "{{ project_name | camelize }} by {{ author }} <{{ author_email }}>: {{ greeting | shout }}\n"
+_LITERAL_LINE = "This line has no template syntax and is copied as it is.\n"
+
+def git(cwd, *args):
+    with open(os.devnull, "w") as devnull:
+        subprocess.check_call(
+            ["git", "-c", "user.name=bench", "-c", "user.email=bench@example.com"] + list(args),
+            cwd=cwd,
+            stdout=devnull,
+            stderr=devnull)
+
+def _write(path, content, mode="wt"):
+    dir = os.path.dirname(path)
+    if not os.path.isdir(dir):
+        os.makedirs(dir)
+    with open(path, mode) as f:
+        f.write(content)
+
+# File sizes grow geometrically so that every template has a long tail of
+# large files as well as many small ones
+def _file_size(rng, index):
+    return min(256 * (2 ** (index % 12)), 1024 * 1024) + rng.randint(0, 255)
+
+def _make_template(rng, template_dir, template_name, file_count):
+    file_lines = []
+    for i in range(file_count):
+        size = _file_size(rng, i)
+        kind = i % 4
+        if kind == 0:
+            path = "src/module{}.txt".format(i)
+            _write(os.path.join(template_dir, path), _RENDERED_LINE * max(1, size // len(_RENDERED_LINE)))
+            file_lines.append("  - path: {}\n    output-path: \"src/{{{{ project_name | underscore }}}}_{}.txt\"".format(path, i))
+        elif kind == 1:
+            path = "docs/page{}.md".format(i)
+            _write(os.path.join(template_dir, path), "# {{ project_name }}\n" + _LITERAL_LINE * max(1, size // 64))
+            file_lines.append("  - {}".format(path))
+        elif kind == 2:
+            path = "data/blob{}.bin".format(i)
+            _write(os.path.join(template_dir, path), bytearray(rng.getrandbits(8) for _ in range(min(size, 4096))) * max(1, size // 4096), "wb")
+            file_lines.append("  - path: {}\n    preprocess: false".format(path))
+        else:
+            path = "notes/literal{}.txt".format(i)
+            _write(os.path.join(template_dir, path), _LITERAL_LINE * max(1, size // len(_LITERAL_LINE)))
+            file_lines.append("  - {}".format(path))
+
+    _write(os.path.join(template_dir, "run.sh"), "#!/bin/sh\necho {{ project_name }}\n")
+    file_lines.append("  - run.sh")
+
+    _write(os.path.join(template_dir, "_ptool.py"), _TEMPLATE_EXTENSION)
+    _write(os.path.join(template_dir, "_ptool.yaml"), """description: Synthetic template {}
+template-values:
+  greeting: Hello
+files:
+{}
+commands:
+  - git init -q
+  - git add -A
+  - git-execute-attribute:
+      path: run.sh
+  - git-symlink:
+      source-path: run.sh
+      target-path: bin/run-link.sh
+""".format(template_name, "\n".join(file_lines)))
+
+def template_names(template_count):
+    return ["template{:04d}".format(i) for i in range(template_count)]
+
+# Creates a working repository with the given number of templates and a bare
+# clone of it standing in for the upstream repository. Returns the paths of
+# both.
+def make_template_repo(root_dir, template_count, file_count, seed=0):
+    rng = random.Random(seed)
+    source_dir = os.path.join(root_dir, "source")
+    os.makedirs(source_dir)
+    for template_name in template_names(template_count):
+        _make_template(rng, os.path.join(source_dir, template_name), template_name, file_count)
+
+    git(source_dir, "init", "-q", ".")
+    git(source_dir, "add", "-A")
+    git(source_dir, "commit", "-q", "-m", "Initial")
+
+    bare_dir = os.path.join(root_dir, "upstream.git")
+    git(root_dir, "clone", "-q", "--bare", source_dir, bare_dir)
+    git(source_dir, "remote", "add", "origin", bare_dir)
+    return source_dir, bare_dir
+
+# Pushes a commit touching one template so that the next update has work to
+# do
+def push_change(source_dir, template_name, revision):
+    _write(
+        os.path.join(source_dir, template_name, "CHANGES.txt"),
+        "Revision {}\n".format(revision))
+    git(source_dir, "add", "-A")
+    git(source_dir, "commit", "-q", "-m", "Revision {}".format(revision))
+    git(source_dir, "push", "-q", "origin", "HEAD")
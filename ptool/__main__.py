@@ -7,80 +7,192 @@
 
 from __future__ import print_function
 import argparse
+import os
 import sys
 
-from pyprelude.file_system import *
-from pyprelude.temp_util import *
-from pysimplevcs.git import *
-
 from ptool import __description__, __project_name__, __version__
-from ptool.arg_util import parse_key_value_pair
-from ptool.config import Config
+from ptool.arg_util import parse_job_count, parse_key_value_pair, parse_path
 from ptool.exceptions import Informational
-from ptool.template_spec import TemplateSpec
-from ptool.template_util import TemplateContext
-from ptool.value_source import ValueSource
+
+# Subcommands import their dependencies on first use so that cheap commands
+# such as --version and templates do not pay for Jinja2, YAML or Git
 
 def _do_new(config, args):
-    if os.path.exists(args.output_dir):
-        if args.force_overwrite:
-            remove_dir(args.output_dir)
+    from ptool.generator import ProjectGenerator
+
+    # Files read from Git objects have no path in the working tree to link to
+    link = args.link
+    if link and args.rev is not None:
+        sys.stderr.write("WARNING: --link has no effect with --rev: files are copied from revision {}\n".format(args.rev))
+        link = False
+
+    generator = ProjectGenerator(config, args.template_name, jobs=args.jobs, rev=args.rev)
+    if args.dry_run:
+        plan = generator.plan(args.output_dir, project_name=args.project_name, key_value_pairs=args.key_value_pairs)
+        problems = list(plan.problems)
+        warnings = list(plan.warnings)
+        if args.archive is not None:
+            # Commands do not run when writing an archive
+            problems.extend(warnings)
+            warnings = []
+        elif os.path.exists(args.output_dir) and not args.force_overwrite:
+            problems.append("Output directory \"{}\" already exists: force overwrite with --force".format(args.output_dir))
+        _print_plan(args.template_name, plan, problems, warnings)
+        if len(problems) > 0:
+            raise Informational("Found {} problem(s)".format(len(problems)))
+        return
+
+    if args.archive is not None:
+        results = generator.generate_archive(
+            args.archive,
+            args.output_dir,
+            project_name=args.project_name,
+            key_value_pairs=args.key_value_pairs)
+    else:
+        results = generator.generate(
+            args.output_dir,
+            project_name=args.project_name,
+            key_value_pairs=args.key_value_pairs,
+            force_overwrite=args.force_overwrite,
+            link=link)
+
+    if args.copy_stats:
+        # Standard output may be carrying the archive
+        _print_copy_stats(results, sys.stderr if args.archive == "-" else sys.stdout)
+
+def _do_regen(config, args):
+    from ptool.generator import ProjectGenerator
+    from ptool.manifest import MANIFEST_FILE_NAME, Manifest
+    from ptool.regen import regenerate_files
+    from ptool.value_source import ValueSource, without_sources
+
+    manifest = Manifest.try_read(args.output_dir)
+    if manifest is None:
+        raise Informational("No {} found in {}: create project with \"ptool new\"".format(MANIFEST_FILE_NAME, args.output_dir))
+
+    generator = ProjectGenerator(config, manifest.template_name)
+    template_spec = generator.template_spec
+
+    manifest_value_source = ValueSource(os.path.join(args.output_dir, MANIFEST_FILE_NAME), manifest.overrides)
+    command_line_value_source = ValueSource.command_line(args.key_value_pairs)
+    values = generator.merge_values(
+        ValueSource.project(os.path.basename(args.output_dir)),
+        manifest_value_source,
+        command_line_value_source)
+
+    generator.check_values(values)
+
+    values_without_sources = without_sources(values)
+    ctx = generator.context(values_without_sources)
+
+    result = regenerate_files(
+        template_spec,
+        ctx,
+        values_without_sources,
+        args.output_dir,
+        manifest,
+        force=args.force_overwrite)
+
+    Manifest(
+        template_spec.name,
+        generator.commit,
+        values_without_sources,
+        without_sources(ValueSource.merge_values(manifest_value_source, command_line_value_source)),
+        result.files).write(args.output_dir)
+
+    for relpath in result.updated:
+        print("Updated {}".format(relpath))
+    for relpath in result.conflicts:
+        print("Skipped {}: file has local modifications (overwrite with --force)".format(relpath))
+    for relpath in result.stale:
+        print("No longer generated by template: {}".format(relpath))
+    print("{} file(s) updated, {} unchanged, {} conflict(s)".format(
+        len(result.updated),
+        len(result.unchanged),
+        len(result.conflicts)))
+
+def _do_batch(config, args):
+    from ptool.batch import read_batch_manifest, run_batch
+
+    entries = read_batch_manifest(args.manifest_path)
+
+    failed_count = 0
+    for entry, error in run_batch(config, entries, args.jobs):
+        if error is None:
+            print("OK        {} -> {}".format(entry.template_name, entry.output_dir))
         else:
-            raise Informational("Output directory \"{}\" already exists: force overwrite with --force".format(args.output_dir))
-
-    template_spec = TemplateSpec.try_read(config.repo_dir, args.template_name)
-    if template_spec is None:
-        raise Informational("No template \"{}\" found in {}".format(args.template_name, config.repo_dir))
-
-    project_name = os.path.basename(args.output_dir) if args.project_name is None else args.project_name
-
-    values = ValueSource.merge_values(
-        ValueSource.project(project_name),
-        template_spec.value_source,
-        config.value_source,
-        ValueSource.command_line(args.key_value_pairs))
-
-    unsorted_keys = []
-    for file in template_spec.files:
-        unsorted_keys.extend(file.keys)
-    for command in template_spec.commands:
-        unsorted_keys.extend(command.keys)
-
-    keys = sorted(list(set(unsorted_keys)))
-
-    missing_keys = []
-    for key in keys:
-        if key not in values:
-            missing_keys.append(key)
-
-    if len(missing_keys) > 0:
-        raise Informational(
-            "Provide values for {} in {} or via command line".format(
-                ", ".join(map(lambda k: "\"{}\"".format(k), missing_keys)),
-                config.config_yaml_path))
-
-    if config.repo_dir not in sys.path:
-        sys.path.append(config.repo_dir)
-
-    values_without_sources = { key : value for key, (value, _) in values.iteritems() }
-    ctx = TemplateContext(
-        [template_spec.template_dir, config.repo_dir],
-        template_spec.template_dir,
-        values_without_sources)
-
-    for file in template_spec.files:
-        file.generate(ctx, values_without_sources, args.output_dir)
-
-    with temp_cwd(args.output_dir):
-        for command in template_spec.commands:
-            command.run(ctx, values_without_sources)
+            failed_count += 1
+            print("FAILED    {} -> {}: {}".format(entry.template_name, entry.output_dir, error.rstrip()))
+
+    print("{} project(s) generated, {} failed".format(len(entries) - failed_count, failed_count))
+    if failed_count > 0:
+        raise Informational("{} of {} project(s) failed".format(failed_count, len(entries)))
+
+def _print_plan(template_name, plan, problems, warnings):
+    print("Plan for {} in {}".format(template_name, plan.output_dir))
+
+    print("Directories:")
+    for relpath in plan.dirs:
+        print("  {}/".format(relpath))
+
+    print("Files:")
+    for planned_file in plan.files:
+        print("  {}{}  {}{}".format(
+            str(planned_file.size).rjust(12),
+            " " if planned_file.is_size_exact else "~",
+            planned_file.relpath,
+            " (executable)" if planned_file.relpath in plan.executable_paths else ""))
+
+    if len(plan.symlinks) > 0:
+        print("Symbolic links:")
+        for relpath in sorted(plan.symlinks.keys()):
+            print("  {} -> {}".format(relpath, plan.symlinks[relpath]))
+
+    if len(plan.commands) > 0:
+        print("Commands:")
+        for command in plan.commands:
+            print("  {}".format(command.display))
+
+    if len(warnings) > 0:
+        print("Warnings:")
+        for warning in warnings:
+            print("  {}".format(warning))
+
+    if len(problems) > 0:
+        print("Problems:")
+        for problem in problems:
+            print("  {}".format(problem))
+
+    print("Total: {} file(s), {} directory(ies), about {} byte(s) (~ marks sizes estimated from templates)".format(
+        len(plan.files),
+        len(plan.dirs),
+        plan.estimated_bytes))
+
+def _print_copy_stats(results, output=sys.stdout):
+    from ptool.copy_util import CopyStats
+
+    copy_stats = CopyStats()
+    for result in results:
+        if result.copy_method is not None:
+            copy_stats.record(result.target_path, result.copy_method, result.size)
+
+    for target_path, method, size in sorted(copy_stats.files):
+        print("{}    {}    {}".format(method.ljust(15), str(size).rjust(12), target_path), file=output)
+
+    totals = copy_stats.method_totals()
+    for method in sorted(totals.keys()):
+        count, size = totals[method]
+        print("{}: {} file(s), {} byte(s)".format(method, count, size), file=output)
+    print("Total: {} file(s), {} byte(s)".format(len(copy_stats.files), copy_stats.total_bytes), file=output)
 
 def _do_templates(config, args):
-    templates = []
-    for item in sorted(os.listdir(config.repo_dir)):
-        template_spec = TemplateSpec.try_read(config.repo_dir, item)
-        if template_spec is not None:
-            templates.append((template_spec.name, template_spec.description))
+    from ptool.catalog import merged_catalog_entries
+
+    repositories = config.repositories
+    templates = [
+        (entry.name, entry.description if len(repositories) == 1 else "{} [{}]".format(entry.description, repository.name))
+        for repository, entry in merged_catalog_entries(repositories, config.yaml_cache)
+    ]
 
     width = 0
     for project_name, _ in templates:
@@ -92,9 +204,10 @@ def _do_templates(config, args):
         print("{}    {}".format(project_name.ljust(width), description))
 
 def _do_values(config, args):
-    template_spec = TemplateSpec.try_read(config.repo_dir, args.template_name)
-    if template_spec is None:
-        raise Informational("No template \"{}\" found in {}".format(args.template_name, config.repo_dir))
+    from ptool.template_spec import read_template_spec
+    from ptool.value_source import ValueSource
+
+    template_spec = read_template_spec(config, args.template_name, args.rev)
 
     values = ValueSource.merge_values(
         ValueSource.project("example-project-name-ABC"),
@@ -127,27 +240,113 @@ def _do_values(config, args):
         print()
 
 def _do_update(config, args):
-    git = Git(config.repo_dir)
-    original_commit = git.rev_parse("HEAD")
-    git.pull("--rebase")
-    new_commit = git.rev_parse("HEAD")
-
-    if original_commit == new_commit:
-        print("Repository already at latest revision {}".format(new_commit))
+    from ptool.catalog import TemplateCatalog
+    from ptool.template_repo import update_template_repos
+
+    results = update_template_repos(config.repositories, args.jobs, args.timeout)
+
+    failed = []
+    for result in results:
+        repository = result.repository
+        if result.error is not None:
+            failed.append(repository.name)
+            print("{}: failed after {:.1f}s: {}".format(repository.name, result.elapsed, result.error))
+            continue
+
+        if result.is_changed:
+            TemplateCatalog(repository.repo_dir, repository.catalog_path, config.yaml_cache).entries()
+
+            # Keep a previously compiled archive in step with the new revision
+            if os.path.isfile(repository.template_archive_path):
+                from ptool.template_archive import compile_template_repo
+                compile_template_repo(repository, config.yaml_cache)
+
+        print("{}: {} {} in {:.1f}s, fetched {} objects ({} bytes)".format(
+            repository.name,
+            "cloned at revision" if result.old_commit is None else
+                "updated to latest revision" if result.is_changed else
+                "already at latest revision",
+            result.new_commit,
+            result.elapsed,
+            result.objects_fetched,
+            result.bytes_fetched))
+
+    if len(failed) > 0:
+        raise Informational("Failed to update {} of {} repositories: {}".format(len(failed), len(results), ", ".join(failed)))
+
+def _do_cache(config, args):
+    from ptool.bytecode_cache import BytecodeCache
+
+    bytecode_cache = BytecodeCache(config.bytecode_cache_dir)
+    if args.cache_action == "stats":
+        count, size = bytecode_cache.stats()
+        print("Bytecode cache {}: {} template(s), {} byte(s)".format(bytecode_cache.cache_dir, count, size))
+    elif args.cache_action == "clear":
+        count, _ = bytecode_cache.stats()
+        bytecode_cache.clear()
+        print("Removed {} template(s) from bytecode cache {}".format(count, bytecode_cache.cache_dir))
     else:
-        print("Repository updated to latest revision {}".format(new_commit))
+        raise RuntimeError("Unsupported cache action {}".format(args.cache_action))
+
+def _do_compile(config, args):
+    from ptool.template_archive import compile_template_repo
+
+    for repository in config.repositories:
+        names, errors = compile_template_repo(repository, config.yaml_cache)
+        for name in sorted(errors.keys()):
+            print("Skipped {}: {}".format(name, errors[name]))
+        print("Compiled {} template(s) into {}".format(len(names), repository.template_archive_path))
+
+def _do_serve(config, args):
+    from ptool.server import serve
+
+    socket_path = args.socket_path
+    if socket_path is None:
+        socket_path = os.path.join(config.config_dir, "serve.sock")
+    serve(config, socket_path)
+
+def _write_trace(tracer, args):
+    if args.trace_path is not None:
+        tracer.write(args.trace_path)
+
+    if args.timings:
+        for line in tracer.summary_lines():
+            sys.stderr.write(line + "\n")
+
+        # Only report filter caches if templates were rendered at all
+        if "ptool.filters" in sys.modules:
+            from ptool.filters import filter_cache_stats
+            stats = filter_cache_stats()
+            if len(stats) > 0:
+                sys.stderr.write("Filter caches\n")
+            for name, hits, misses, size in stats:
+                sys.stderr.write("  {}: {} hit(s), {} miss(es), {:.0f}% hit rate, {} cached\n".format(
+                    name,
+                    hits,
+                    misses,
+                    100.0 * hits / (hits + misses),
+                    size))
 
 def _main(argv=None):
     if argv is None:
         argv = sys.argv[1:]
 
-    config_dir = make_path(os.path.expanduser(os.environ.get("PTOOL_DIR", "~/.ptool")))
-    config = Config(config_dir)
-
     parser = argparse.ArgumentParser(prog=__project_name__, description=__description__)
     parser.add_argument("--version", action="version", version="{} version {}".format(__project_name__, __version__))
+    parser.add_argument(
+        "--trace",
+        dest="trace_path",
+        metavar="FILE",
+        type=parse_path,
+        default=None,
+        help="Write timings of each phase, file and command to FILE in Chrome trace-event format")
+    parser.add_argument(
+        "--timings",
+        dest="timings",
+        action="store_true",
+        help="Show a summary of phase timings and the slowest files and commands on stderr")
 
-    subparsers = parser.add_subparsers(help="subcommand help")
+    subparsers = parser.add_subparsers(dest="subcommand", help="subcommand help")
 
     new_parser = subparsers.add_parser("new", help="Create new project from template")
     new_parser.set_defaults(func=_do_new)
@@ -157,6 +356,38 @@ def _main(argv=None):
         dest="force_overwrite",
         action="store_true",
         help="Force overwrite of existing output directory")
+    new_parser.add_argument(
+        "-j",
+        "--jobs",
+        metavar="JOBS",
+        type=parse_job_count,
+        default=1,
+        help="Number of worker processes used to scan and render files and to run independent commands (0 for one per CPU)")
+    new_parser.add_argument(
+        "--link",
+        dest="link",
+        action="store_true",
+        help="Hard-link non-preprocessed files from the template repository instead of copying them")
+    new_parser.add_argument(
+        "--copy-stats",
+        dest="copy_stats",
+        action="store_true",
+        help="Show how each copied (non-preprocessed or literal) file was copied")
+    new_parser.add_argument(
+        "--rev",
+        metavar="REV",
+        default=None,
+        help="Read templates from this commit of the template repository instead of its working tree")
+    new_parser.add_argument(
+        "--dry-run",
+        dest="dry_run",
+        action="store_true",
+        help="Show the files, directories and commands the project would have, and any conflicts, without writing anything")
+    new_parser.add_argument(
+        "--archive",
+        metavar="ARCHIVE",
+        default=None,
+        help="Write the project to a .tar.gz, .tgz, .tar.bz2, .tar or .zip archive, or a .tar.gz stream on standard output for \"-\", with entries under a directory named after OUTPUTDIR")
     new_parser.add_argument(
         "template_name",
         metavar="TEMPLATENAME",
@@ -165,7 +396,7 @@ def _main(argv=None):
     new_parser.add_argument(
         "output_dir",
         metavar="OUTPUTDIR",
-        type=make_path,
+        type=parse_path,
         help="Project output directory")
     new_parser.add_argument(
         "--project-name",
@@ -182,6 +413,41 @@ def _main(argv=None):
         nargs="*",
         help="Key-value pairs for substitutions in templates")
 
+    regen_parser = subparsers.add_parser("regen", help="Regenerate project, rewriting only files whose content changed")
+    regen_parser.set_defaults(func=_do_regen)
+    regen_parser.add_argument(
+        "-f",
+        "--force",
+        dest="force_overwrite",
+        action="store_true",
+        help="Overwrite files with local modifications")
+    regen_parser.add_argument(
+        "output_dir",
+        metavar="OUTPUTDIR",
+        type=parse_path,
+        help="Project output directory")
+    regen_parser.add_argument(
+        "key_value_pairs",
+        metavar="KEYVALUEPAIRS",
+        type=parse_key_value_pair,
+        nargs="*",
+        help="Key-value pairs for substitutions in templates")
+
+    batch_parser = subparsers.add_parser("batch", help="Create multiple projects from a YAML or JSON manifest")
+    batch_parser.set_defaults(func=_do_batch)
+    batch_parser.add_argument(
+        "-j",
+        "--jobs",
+        metavar="JOBS",
+        type=parse_job_count,
+        default=1,
+        help="Number of worker processes used to generate projects (0 for one per CPU)")
+    batch_parser.add_argument(
+        "manifest_path",
+        metavar="MANIFEST",
+        type=parse_path,
+        help="Path to YAML or JSON list of entries with template, output-dir and optional values, project-name and force")
+
     templates_parser = subparsers.add_parser("templates", help="List available templates")
     templates_parser.set_defaults(func=_do_templates)
 
@@ -191,6 +457,11 @@ def _main(argv=None):
         metavar="TEMPLATENAME",
         type=str,
         help="Template name")
+    values_parser.add_argument(
+        "--rev",
+        metavar="REV",
+        default=None,
+        help="Read templates from this commit of the template repository instead of its working tree")
     values_parser.add_argument(
         "key_value_pairs",
         metavar="KEYVALUEPAIRS",
@@ -199,8 +470,21 @@ def _main(argv=None):
         help="Key-value pairs for substitutions in templates")
     values_parser.set_defaults(func=_do_values)
 
-    update_parser = subparsers.add_parser("update", help="Update local template repository")
+    update_parser = subparsers.add_parser("update", help="Update local template repositories")
     update_parser.set_defaults(func=_do_update)
+    update_parser.add_argument(
+        "-j",
+        "--jobs",
+        metavar="JOBS",
+        type=parse_job_count,
+        default=4,
+        help="Number of template repositories to update concurrently (0 for one per CPU)")
+    update_parser.add_argument(
+        "--timeout",
+        metavar="SECONDS",
+        type=float,
+        default=None,
+        help="Time allowed for updating each repository that has no timeout in config.yaml")
     # TODO: Implement version checks and repairs
     """
     update_parser.add_argument(
@@ -211,13 +495,51 @@ def _main(argv=None):
         help="Repair templates by overwriting existing Git repo")
     """
 
-    args = parser.parse_args()
+    cache_parser = subparsers.add_parser("cache", help="Inspect or clear compiled template cache")
+    cache_parser.add_argument(
+        "cache_action",
+        metavar="ACTION",
+        choices=["stats", "clear"],
+        help="Cache action (stats or clear)")
+    cache_parser.set_defaults(func=_do_cache)
+
+    compile_parser = subparsers.add_parser("compile", help="Precompile all templates into an archive used by new until the repository changes")
+    compile_parser.set_defaults(func=_do_compile)
+
+    serve_parser = subparsers.add_parser("serve", help="Serve generate, values and templates requests over a Unix socket")
+    serve_parser.add_argument(
+        "--socket",
+        dest="socket_path",
+        metavar="PATH",
+        type=parse_path,
+        default=None,
+        help="Path of Unix socket to listen on (default: serve.sock in ptool directory)")
+    serve_parser.set_defaults(func=_do_serve)
+
+    args = parser.parse_args(argv)
+
+    from ptool.config import Config
+    config = Config(parse_path(os.environ.get("PTOOL_DIR", "~/.ptool")))
+
+    tracer = None
+    if args.trace_path is not None or args.timings:
+        from ptool.trace import span, start_tracing, stop_tracing
+        tracer = start_tracing()
 
     try:
-        args.func(config, args)
+        if tracer is None:
+            args.func(config, args)
+        else:
+            with span("ptool {}".format(args.subcommand)):
+                args.func(config, args)
     except Informational as e:
         print(e.message)
         sys.exit(1)
+    finally:
+        config.save_caches()
+        if tracer is not None:
+            stop_tracing()
+            _write_trace(tracer, args)
 
 if __name__ == "__main__":
     _main()
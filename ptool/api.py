@@ -0,0 +1,101 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+# Generates projects from Python instead of the command line:
+#
+#     from ptool.api import ProjectRenderer
+#
+#     renderer = ProjectRenderer()
+#     project = renderer.render("demo", "my-proj", { "greeting": "Hi" })
+#     print(project.files["README.md"])
+#
+# Rendered projects are returned as a MemoryProject, and nothing is written
+# to or run in a project directory. Template repositories are cloned and
+# caches under the ptool directory are used exactly as by "ptool new".
+
+import os
+import threading
+
+from ptool.arg_util import parse_path
+from ptool.config import Config
+from ptool.git_util import read_head_commit
+
+# Projects are rendered relative to this directory, which is never created,
+# so that output paths resolve as they would in a real project directory
+_VIRTUAL_OUTPUT_DIR = os.path.abspath(os.path.join(os.sep, "ptool-project"))
+
+def _stat_key(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime, st.st_size
+
+def default_config_dir():
+    return parse_path(os.environ.get("PTOOL_DIR", "~/.ptool"))
+
+# Keeps configuration, template specifications and template contexts warm
+# between projects. Everything is discarded when the template repositories'
+# HEADs or config.yaml change, for example after "ptool update". Renderers
+# may be used from several threads at once.
+class ProjectRenderer(object):
+    def __init__(self, config_dir=None):
+        self._config_dir = default_config_dir() if config_dir is None else config_dir
+        self._lock = threading.Lock()
+        self._key = None
+        self._config = None
+        self._generators = {}
+
+    def config(self):
+        with self._lock:
+            self._refresh()
+            return self._config
+
+    # Returns the generator for a template with a lock that must be held
+    # while using it, since a generator renders one project at a time
+    def generator(self, template_name, rev=None):
+        from ptool.generator import ProjectGenerator
+
+        with self._lock:
+            self._refresh()
+            entry = self._generators.get((template_name, rev))
+            if entry is None:
+                entry = ProjectGenerator(self._config, template_name, rev=rev), threading.Lock()
+                self._generators[(template_name, rev)] = entry
+            return entry
+
+    # Renders a project from a template, with values taking precedence over
+    # config.yaml and the template's own values like values given to
+    # "ptool new" on the command line. Templates are read from commit rev of
+    # the template repository if one is given.
+    def render(self, template_name, project_name, values=None, rev=None):
+        generator, lock = self.generator(template_name, rev)
+        with lock:
+            project = generator.generate_in_memory(
+                _VIRTUAL_OUTPUT_DIR,
+                project_name=project_name,
+                key_value_pairs=sorted((values or {}).items()))
+        self.save_caches()
+        return project
+
+    def save_caches(self):
+        with self._lock:
+            config = self._config
+        if config is not None:
+            config.save_caches()
+
+    def _refresh(self):
+        config = Config(self._config_dir)
+        key = _stat_key(config.config_yaml_path), tuple(read_head_commit(r.repo_dir) for r in config.repositories)
+        if key != self._key:
+            self._key = key
+            self._config = config
+            self._generators = {}
+
+# Renders a single project. Use a ProjectRenderer to render many, since it
+# reuses each template's compiled templates.
+def render_project(template_name, project_name, values=None, rev=None, config_dir=None):
+    return ProjectRenderer(config_dir).render(template_name, project_name, values, rev)
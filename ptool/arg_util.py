@@ -5,9 +5,25 @@
 # -----------------------------------------------------------------------------
 
 import argparse
+import os
 
 def parse_key_value_pair(s):
     fragments = s.split("=")
     if len(fragments) != 2 or len(fragments[0]) < 1:
         raise argparse.ArgumentTypeError("Must be a key-value pair")
     return fragments[0], fragments[1]
+
+def parse_job_count(s):
+    try:
+        value = int(s)
+    except ValueError:
+        raise argparse.ArgumentTypeError("Must be an integer")
+    if value < 0:
+        raise argparse.ArgumentTypeError("Must not be negative")
+    if value == 0:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    return value
+
+def parse_path(s):
+    return os.path.abspath(os.path.expanduser(s))
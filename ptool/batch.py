@@ -0,0 +1,137 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import json
+import multiprocessing
+import traceback
+
+from pyprelude.file_system import *
+
+from ptool.config import Config
+from ptool.exceptions import Informational
+from ptool.generator import ProjectGenerator
+from ptool.util import read_yaml_file
+
+class BatchEntry(object):
+    @staticmethod
+    def from_obj(obj):
+        if not isinstance(obj, dict):
+            raise Informational("Batch entry must be a mapping: {}".format(obj))
+
+        for key in ["template", "output-dir"]:
+            if key not in obj:
+                raise Informational("Batch entry is missing \"{}\": {}".format(key, obj))
+
+        values = obj.get("values", {})
+        if not isinstance(values, dict):
+            raise Informational("Batch entry values must be a mapping: {}".format(obj))
+
+        return BatchEntry(
+            obj["template"],
+            make_path(obj["output-dir"]),
+            sorted((str(key), value) for key, value in values.iteritems()),
+            obj.get("project-name"),
+            obj.get("force", False))
+
+    def __init__(self, template_name, output_dir, key_value_pairs, project_name, force_overwrite):
+        self._template_name = template_name
+        self._output_dir = output_dir
+        self._key_value_pairs = key_value_pairs
+        self._project_name = project_name
+        self._force_overwrite = force_overwrite
+
+    @property
+    def template_name(self): return self._template_name
+
+    @property
+    def output_dir(self): return self._output_dir
+
+    @property
+    def key_value_pairs(self): return self._key_value_pairs
+
+    @property
+    def project_name(self): return self._project_name
+
+    @property
+    def force_overwrite(self): return self._force_overwrite
+
+def read_batch_manifest(path):
+    if path.endswith(".json"):
+        with open(path, "rt") as f:
+            obj = json.load(f)
+    else:
+        obj = read_yaml_file(path)
+
+    if not isinstance(obj, list):
+        raise Informational("Batch manifest {} must contain a list of entries".format(path))
+
+    return map(BatchEntry.from_obj, obj)
+
+# Generates projects while keeping one ProjectGenerator per template, so each
+# template's specification and compiled templates are only built once
+class _BatchRunner(object):
+    def __init__(self, config):
+        self._config = config
+        self._generators = {}
+
+    def run(self, entry):
+        try:
+            generator = self._generators.get(entry.template_name)
+            if generator is None:
+                generator = ProjectGenerator(self._config, entry.template_name)
+                self._generators[entry.template_name] = generator
+
+            generator.generate(
+                entry.output_dir,
+                project_name=entry.project_name,
+                key_value_pairs=entry.key_value_pairs,
+                force_overwrite=entry.force_overwrite)
+            return None
+        except Informational as e:
+            return str(e)
+        except Exception:
+            return traceback.format_exc()
+
+_WORKER_CONFIG = None
+_WORKER_RUNNER = None
+
+def _init_worker(config_dir):
+    global _WORKER_CONFIG
+    global _WORKER_RUNNER
+    _WORKER_CONFIG = Config(config_dir)
+    _WORKER_RUNNER = _BatchRunner(_WORKER_CONFIG)
+
+# Workers have no exit hook, so caches are saved after each entry; this only
+# writes when the entry read files that were not already cached
+def _run_worker(args):
+    index, entry = args
+    error = _WORKER_RUNNER.run(entry)
+    _WORKER_CONFIG.save_caches()
+    return index, error
+
+# Yields (entry, error) for each entry as it completes, where error is None on
+# success; a failed entry does not stop the rest of the batch
+def run_batch(config, entries, jobs=1):
+    # Group entries by template so that workers tend to reuse generators
+    tasks = sorted(enumerate(entries), key=lambda t: t[1].template_name)
+
+    if jobs <= 1 or len(tasks) <= 1:
+        runner = _BatchRunner(config)
+        for _, entry in tasks:
+            yield entry, runner.run(entry)
+        return
+
+    pool = multiprocessing.Pool(jobs, _init_worker, (config.config_dir,))
+    try:
+        chunk_size = max(1, len(tasks) // (jobs * 4))
+        for index, error in pool.imap_unordered(_run_worker, tasks, chunk_size):
+            yield entries[index], error
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
@@ -0,0 +1,44 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import fnmatch
+import jinja2
+import os
+
+from ptool.util import atomic_write, ensure_dir
+
+_CACHE_FILE_PATTERN = "__ptool_%s.cache"
+
+class BytecodeCache(jinja2.FileSystemBytecodeCache):
+    def __init__(self, directory):
+        ensure_dir(directory)
+        super(BytecodeCache, self).__init__(directory, _CACHE_FILE_PATTERN)
+
+    @property
+    def cache_dir(self): return self.directory
+
+    def load_bytecode(self, bucket):
+        try:
+            super(BytecodeCache, self).load_bytecode(bucket)
+        except Exception:
+            # Treat truncated or incompatible entries as cache misses
+            bucket.reset()
+
+    def dump_bytecode(self, bucket):
+        with atomic_write(self._get_cache_filename(bucket)) as f:
+            bucket.write_bytecode(f)
+
+    def entries(self):
+        for file_name in fnmatch.filter(os.listdir(self.directory), _CACHE_FILE_PATTERN % "*"):
+            yield os.path.join(self.directory, file_name)
+
+    def stats(self):
+        count = 0
+        size = 0
+        for path in self.entries():
+            count += 1
+            size += os.path.getsize(path)
+        return count, size
@@ -0,0 +1,178 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import json
+import os
+
+from ptool.git_util import is_sparse_checkout, read_head_commit
+from ptool.template_spec import TemplateSpec, template_yaml_path
+from ptool.util import atomic_write, ensure_dir
+
+_CATALOG_VERSION = 1
+
+class CatalogEntry(object):
+    @staticmethod
+    def from_template_spec(template_spec, stat_key):
+        return CatalogEntry(
+            template_spec.name,
+            template_spec.description,
+            sorted(template_spec.value_source.values.keys()),
+            len(template_spec.files),
+            stat_key)
+
+    @staticmethod
+    def from_obj(name, obj):
+        return CatalogEntry(name, obj["description"], obj["value_keys"], obj["file_count"], tuple(obj["stat_key"]))
+
+    def __init__(self, name, description, value_keys, file_count, stat_key):
+        self._name = name
+        self._description = description
+        self._value_keys = value_keys
+        self._file_count = file_count
+        self._stat_key = stat_key
+
+    @property
+    def name(self): return self._name
+
+    @property
+    def description(self): return self._description
+
+    @property
+    def value_keys(self): return self._value_keys
+
+    @property
+    def file_count(self): return self._file_count
+
+    @property
+    def stat_key(self): return self._stat_key
+
+    def to_obj(self):
+        return {
+            "description": self._description,
+            "value_keys": self._value_keys,
+            "file_count": self._file_count,
+            "stat_key": list(self._stat_key)
+        }
+
+def _stat_key(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime, st.st_size
+
+def _changed_template_names(repo_dir, old_commit, new_commit):
+    from pysimplevcs.git import Git
+    try:
+        output = Git(repo_dir).diff("--name-only", old_commit, new_commit)
+    except RuntimeError:
+        return None
+    return set(line.split("/", 1)[0] for line in output.splitlines() if len(line) > 0)
+
+class TemplateCatalog(object):
+    def __init__(self, repo_dir, index_path, yaml_cache=None):
+        self._repo_dir = repo_dir
+        self._index_path = index_path
+        self._yaml_cache = yaml_cache
+
+    @property
+    def index_path(self): return self._index_path
+
+    def entries(self):
+        head = read_head_commit(self._repo_dir)
+        cached_entries, dirty = self._read_index(head)
+
+        # Templates missing from a sparse checkout are read from Git objects
+        # and keyed by the hash of their specification
+        revision = None
+        names = set(os.listdir(self._repo_dir))
+        if head is not None and is_sparse_checkout(self._repo_dir):
+            from ptool.git_objects import read_git_revision
+            revision = read_git_revision(self._repo_dir, head)
+            names.update(revision.listdir(self._repo_dir))
+
+        entries = []
+        for name in sorted(names):
+            path = template_yaml_path(self._repo_dir, name)
+            stat_key = _stat_key(path)
+            template_revision = None
+            if stat_key is None and revision is not None and revision.isfile(path):
+                stat_key = "git", revision.hash(path)
+                template_revision = revision
+
+            if stat_key is None:
+                if name in cached_entries:
+                    dirty = True
+                continue
+
+            entry = cached_entries.get(name)
+            if entry is None or entry.stat_key != stat_key:
+                template_spec = TemplateSpec.try_read(self._repo_dir, name, self._yaml_cache, template_revision)
+                if template_spec is None:
+                    continue
+                entry = CatalogEntry.from_template_spec(template_spec, stat_key)
+                dirty = True
+
+            entries.append(entry)
+
+        if dirty or len(entries) != len(cached_entries):
+            self._write_index(head, entries)
+
+        return entries
+
+    def _read_index(self, head):
+        if not os.path.isfile(self._index_path):
+            return {}, True
+
+        try:
+            with open(self._index_path, "rt") as f:
+                obj = json.load(f)
+        except ValueError:
+            return {}, True
+
+        if obj.get("version") != _CATALOG_VERSION or obj.get("repo_dir") != self._repo_dir:
+            return {}, True
+
+        cached_entries = {
+            name : CatalogEntry.from_obj(name, o)
+            for name, o in obj["templates"].iteritems()
+        }
+
+        old_head = obj.get("head")
+        if old_head == head:
+            return cached_entries, False
+
+        # Only templates touched between the two commits need to be reread
+        changed_names = None \
+            if old_head is None or head is None \
+            else _changed_template_names(self._repo_dir, old_head, head)
+        if changed_names is None:
+            return {}, True
+
+        return { name : entry for name, entry in cached_entries.iteritems() if name not in changed_names }, True
+
+    def _write_index(self, head, entries):
+        obj = {
+            "version": _CATALOG_VERSION,
+            "repo_dir": self._repo_dir,
+            "head": head,
+            "templates": { entry.name : entry.to_obj() for entry in entries }
+        }
+        ensure_dir(os.path.dirname(self._index_path))
+        with atomic_write(self._index_path, "wt") as f:
+            json.dump(obj, f, indent=2, sort_keys=True)
+
+# Returns the repository and catalog entry of each template, sorted by name.
+# When several repositories contain a template with the same name, the one
+# listed first wins. Each repository's catalog is only reread where its
+# templates changed.
+def merged_catalog_entries(repositories, yaml_cache=None):
+    entries = {}
+    for repository in repositories:
+        for entry in TemplateCatalog(repository.repo_dir, repository.catalog_path, yaml_cache).entries():
+            if entry.name not in entries:
+                entries[entry.name] = repository, entry
+    return [entries[name] for name in sorted(entries.keys())]
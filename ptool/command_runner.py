@@ -0,0 +1,116 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import sys
+import threading
+
+from ptool.trace import SPAN_COMMAND, span
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+# Blocking on a queue without a timeout cannot be interrupted by Ctrl+C in
+# Python 2
+_WAIT_TIMEOUT = 365 * 24 * 60 * 60
+
+def _run_process(index, process, cwd, completed):
+    try:
+        with span(process.display, SPAN_COMMAND) as s:
+            result = process.run(cwd)
+            s.set("returncode", result.returncode)
+        completed.put((index, result, None))
+    except Exception as e:
+        completed.put((index, None, e))
+
+def _failure_message(process, result, error):
+    if error is not None:
+        return "Command \"{}\" failed: {}".format(process.display, error)
+    if result.timed_out:
+        return "Command \"{}\" timed out after {} second(s)".format(process.display, process.timeout)
+    return "Command \"{}\" failed with exit code {}".format(process.display, result.returncode)
+
+# Runs commands as a dependency graph: each command starts once every command
+# in its "after" list has finished, with at most "jobs" processes running at
+# a time. Git index operations are queued on the calling thread and flushed
+# before the next process starts, since processes may depend on the index,
+# once no other process is running.
+# Processes run in cwd rather than changing the working directory of this
+# process, so that projects can be generated on several threads at once.
+def run_commands(commands, ctx, values, git_batch, jobs=1, cwd=None, output=sys.stdout):
+    indices = { command.name : i for i, command in enumerate(commands) }
+    dependents = [[] for _ in commands]
+    remaining = [len(command.after) for command in commands]
+    for i, command in enumerate(commands):
+        for name in command.after:
+            dependents[indices[name]].append(i)
+
+    ready = [i for i, count in enumerate(remaining) if count == 0]
+    completed = queue.Queue()
+    processes = {}
+    finished_count = 0
+    failures = []
+
+    def finish(index):
+        for i in dependents[index]:
+            remaining[i] -= 1
+            if remaining[i] == 0:
+                ready.append(i)
+
+    # Processes run in their own process groups, so they would outlive this
+    # process if it stopped because of Ctrl+C or an error
+    try:
+        while finished_count < len(commands):
+            while len(ready) > 0 and len(failures) == 0 and len(processes) < max(1, jobs):
+                command = commands[ready[0]]
+                # Flushing writes the Git index, which running processes may
+                # also be writing, so queued operations wait for them
+                if hasattr(command, "prepare") and git_batch.has_pending_operations and len(processes) > 0:
+                    break
+
+                index = ready.pop(0)
+                if hasattr(command, "prepare"):
+                    git_batch.flush()
+                    process = command.prepare(ctx, values)
+                    processes[index] = process
+                    thread = threading.Thread(target=_run_process, args=(index, process, cwd, completed))
+                    thread.daemon = True
+                    thread.start()
+                else:
+                    with span("{} {}".format(command.TOOL_NAME, command.name), SPAN_COMMAND):
+                        command.run(ctx, values, git_batch)
+                    finished_count += 1
+                    finish(index)
+
+            if len(processes) == 0:
+                if len(failures) > 0:
+                    break
+                if len(ready) == 0 and finished_count < len(commands):
+                    names = [command.name for i, command in enumerate(commands) if remaining[i] > 0]
+                    raise RuntimeError("Commands have circular dependencies: {}".format(", ".join(names)))
+                continue
+
+            # Output is captured per command and written once it finishes so
+            # that output from concurrent commands is not interleaved
+            index, result, error = completed.get(True, _WAIT_TIMEOUT)
+            process = processes.pop(index)
+            finished_count += 1
+            if result is not None and len(result.output) > 0:
+                output.write(result.output)
+                output.flush()
+
+            if error is not None or result.timed_out or result.returncode != 0:
+                failures.append(_failure_message(process, result, error))
+            else:
+                finish(index)
+    except:
+        for process in processes.values():
+            process.kill()
+        raise
+
+    if len(failures) > 0:
+        raise RuntimeError("\n".join(failures))
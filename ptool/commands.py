@@ -5,55 +5,249 @@
 # -----------------------------------------------------------------------------
 
 import os
+import shlex
+import signal
+import subprocess
+import threading
+import time
 
-from ptool.git_util import git_execute_attribute, git_symlink
-from ptool.template_util import template_tokens
+_SHELL_CHARS = "|&;<>()$`*?[]{}~#\n"
+
+# Commands given as a plain string keep working as they did under os.system:
+# only those using shell syntax are handed to a shell
+def _needs_shell(command):
+    if any(c in _SHELL_CHARS for c in command):
+        return True
+    fragments = command.split()
+    return len(fragments) > 0 and "=" in fragments[0]
+
+def _kill(process):
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except OSError:
+        pass
+
+class ProcessResult(object):
+    def __init__(self, returncode, output, elapsed, timed_out):
+        self._returncode = returncode
+        self._output = output
+        self._elapsed = elapsed
+        self._timed_out = timed_out
+
+    @property
+    def returncode(self): return self._returncode
+
+    @property
+    def output(self): return self._output
+
+    @property
+    def elapsed(self): return self._elapsed
+
+    @property
+    def timed_out(self): return self._timed_out
+
+# A rendered command ready to be executed on any thread
+class CommandProcess(object):
+    def __init__(self, args, shell, timeout):
+        self._args = args
+        self._shell = shell
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._process = None
+        self._killed = False
+
+    # A string if run through the shell, otherwise an argument list
+    @property
+    def args(self): return self._args
+
+    @property
+    def shell(self): return self._shell
+
+    # Rendered commands are unicode, so check for any string type rather than
+    # joining the characters of a shell command
+    @property
+    def display(self):
+        return self._args if isinstance(self._args, basestring) else " ".join(self._args)
+
+    @property
+    def timeout(self): return self._timeout
+
+    def run(self, cwd=None):
+        start = time.time()
+        # Run in a new process group so that a timeout also kills any
+        # processes started by the command
+        with self._lock:
+            if self._killed:
+                raise RuntimeError("Command was cancelled")
+            process = subprocess.Popen(
+                self._args,
+                shell=self._shell,
+                cwd=cwd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                preexec_fn=os.setsid if os.name == "posix" else None)
+            self._process = process
+
+        timed_out = []
+        timer = None
+        if self._timeout is not None:
+            def on_timeout():
+                timed_out.append(True)
+                _kill(process)
+            timer = threading.Timer(self._timeout, on_timeout)
+            timer.start()
+
+        try:
+            output, _ = process.communicate()
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+        return ProcessResult(process.returncode, output, time.time() - start, len(timed_out) > 0)
+
+    # Kills the command and every process it started, from any thread, or
+    # stops it from starting if it has not started yet
+    def kill(self):
+        with self._lock:
+            self._killed = True
+            if self._process is not None and self._process.poll() is None:
+                _kill(self._process)
+
+# A rendered command that has not been run, together with the names of the
+# commands that must finish before it starts
+class PlannedCommand(object):
+    def __init__(self, name, after, process):
+        self._name = name
+        self._after = after
+        self._process = process
+
+    @property
+    def name(self): return self._name
+
+    @property
+    def after(self): return self._after
+
+    @property
+    def args(self): return self._process.args
+
+    @property
+    def shell(self): return self._process.shell
+
+    @property
+    def timeout(self): return self._process.timeout
+
+    @property
+    def display(self): return self._process.display
+
+    # Runs the command in the project directory cwd, returning a
+    # ProcessResult
+    def run(self, cwd):
+        return self._process.run(cwd)
 
 class SimpleCommandInfo(object):
-    def __init__(self, command_template):
+    def __init__(self, command_template, shell=None, timeout=None, name=None, after=None):
         self._command_template = command_template
+        self._shell = shell
+        self._timeout = timeout
+        self._name = name
+        self._after = after
         self._keys = None
 
+    @property
+    def name(self): return self._name
+
+    @property
+    def after(self): return self._after
+
+    @property
+    def templates(self):
+        return self._command_template if isinstance(self._command_template, list) else [self._command_template]
+
     @property
     def keys(self):
         if self._keys is None:
-            self._keys = template_tokens(self._command_template)
+            from ptool.template_util import template_tokens
+            self._keys = template_tokens(*self.templates)
         return self._keys
 
-    def run(self, ctx, values):
+    def prepare(self, ctx, values):
+        if isinstance(self._command_template, list):
+            args = [ctx.render_from_template_string(t, values) for t in self._command_template]
+            if self._shell:
+                return CommandProcess(" ".join(args), True, self._timeout)
+            return CommandProcess(args, False, self._timeout)
+
         command = ctx.render_from_template_string(self._command_template, values)
-        if os.system(command) != 0:
-            raise RuntimeError("Command \"{}\" failed".format(command))
+        shell = _needs_shell(command) if self._shell is None else self._shell
+        return CommandProcess(command if shell else shlex.split(command), shell, self._timeout)
 
 class GitExecuteAttributeCommandInfo(object):
-    def __init__(self, path_template):
+    TOOL_NAME = "git-execute-attribute"
+
+    def __init__(self, path_template, name=None, after=None):
         self._path_template = path_template
+        self._name = name
+        self._after = after
         self._keys = None
 
+    @property
+    def name(self): return self._name
+
+    @property
+    def after(self): return self._after
+
+    @property
+    def templates(self): return [self._path_template]
+
     @property
     def keys(self):
         if self._keys is None:
-            self._keys = template_tokens(self._path_template)
+            from ptool.template_util import template_tokens
+            self._keys = template_tokens(*self.templates)
         return self._keys
 
-    def run(self, ctx, values):
-        path = ctx.render_from_template_string(self._path_template, values)
-        git_execute_attribute(os.getcwd(), path)
+    # Relative to the project directory
+    def path(self, ctx, values):
+        return ctx.render_from_template_string(self._path_template, values)
+
+    def run(self, ctx, values, git_batch):
+        git_batch.execute_attribute(self.path(ctx, values))
 
 class GitSymlinkCommandInfo(object):
-    def __init__(self, source_path_template, target_path_template):
+    TOOL_NAME = "git-symlink"
+
+    def __init__(self, source_path_template, target_path_template, name=None, after=None):
         self._source_path_template = source_path_template
         self._target_path_template = target_path_template
+        self._name = name
+        self._after = after
         self._keys = None
 
+    @property
+    def name(self): return self._name
+
+    @property
+    def after(self): return self._after
+
+    @property
+    def templates(self): return [self._source_path_template, self._target_path_template]
+
     @property
     def keys(self):
         if self._keys is None:
-            self._keys = template_tokens(self._source_path_template, self._target_path_template)
+            from ptool.template_util import template_tokens
+            self._keys = template_tokens(*self.templates)
         return self._keys
 
-    def run(self, ctx, values):
-        source_path = ctx.render_from_template_string(self._source_path_template, values)
-        target_path = ctx.render_from_template_string(self._target_path_template, values)
-        git_symlink(os.getcwd(), source_path, target_path)
+    # Source and target paths relative to the project directory
+    def paths(self, ctx, values):
+        return \
+            ctx.render_from_template_string(self._source_path_template, values), \
+            ctx.render_from_template_string(self._target_path_template, values)
 
+    def run(self, ctx, values, git_batch):
+        source_path, target_path = self.paths(ctx, values)
+        git_batch.symlink(source_path, target_path)
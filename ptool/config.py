@@ -5,15 +5,13 @@
 # -----------------------------------------------------------------------------
 
 import os
-import yaml
 
 from pyprelude.file_system import *
-from pysimplevcs.git import *
-from pysimplevcs.git_util import *
 
 from ptool.exceptions import Informational
-from ptool.util import read_yaml_file
+from ptool.util import atomic_write, ensure_dir
 from ptool.value_source import ValueSource
+from ptool.yaml_cache import YamlCache
 
 _CONFIG_YAML_FILE_NAME = "config.yaml"
 _DEFAULT_CONFIG = {
@@ -27,23 +25,24 @@ _DEFAULT_CONFIG = {
 }
 _TEMPLATES_URL = "https://github.com/rcook/ptool-templates.git"
 
+# Settings for ptool itself rather than values for templates
+_REPOSITORY_KEY = "template-repository"
+_REPOSITORIES_KEY = "template-repositories"
+_SETTINGS_KEYS = (_REPOSITORY_KEY, _REPOSITORIES_KEY)
+
+_DEFAULT_REPOSITORY_NAME = "default"
+
+# Nothing is created, written or cloned until it is first needed, so that
+# cheap subcommands start quickly and never touch the network
 class Config(object):
     def __init__(self, config_dir):
         self._config_dir = config_dir
-
-        if not os.path.isdir(self._config_dir):
-            os.makedirs(self._config_dir)
-
         self._config_yaml_path = make_path(self._config_dir, "config.yaml")
-        if not os.path.isfile(self._config_yaml_path):
-            with open(self._config_yaml_path, "wt") as f:
-                f.write(yaml.dump(_DEFAULT_CONFIG))
-
-        self._repo_dir = make_path(self._config_dir, "ptool-templates")
-        if not os.path.isdir(self._repo_dir):
-            git_clone(_TEMPLATES_URL, self._repo_dir)
-
+        self._cache_dir = make_path(self._config_dir, "cache")
+        self._config_obj = None
+        self._repositories = None
         self._value_source = None
+        self._yaml_cache = None
 
     @property
     def config_dir(self): return self._config_dir
@@ -52,15 +51,85 @@ class Config(object):
     def config_yaml_path(self): return self._config_yaml_path
 
     @property
-    def repo_dir(self): return self._repo_dir
+    def cache_dir(self): return self._cache_dir
+
+    @property
+    def bytecode_cache_dir(self): return make_path(self._cache_dir, "bytecode")
+
+    @property
+    def scan_cache_path(self): return make_path(self._cache_dir, "scan.json")
+
+    @property
+    def yaml_cache_path(self): return make_path(self._cache_dir, "yaml.pickle")
+
+    @property
+    def yaml_cache(self):
+        if self._yaml_cache is None:
+            self._yaml_cache = YamlCache(self.yaml_cache_path)
+        return self._yaml_cache
+
+    def save_caches(self):
+        if self._yaml_cache is not None:
+            self._yaml_cache.save()
+
+    # Template repositories in priority order: when several contain a
+    # template with the same name, the first one is used. A single repository
+    # keeps the directory and cache paths used before several were supported.
+    @property
+    def repositories(self):
+        if self._repositories is None:
+            from ptool.template_repo import RepositorySettings, TemplateRepository
+
+            obj = self._read_config_obj()
+            objs = obj.get(_REPOSITORIES_KEY)
+            if objs is None:
+                settings = RepositorySettings.from_obj(obj.get(_REPOSITORY_KEY), _DEFAULT_REPOSITORY_NAME, _TEMPLATES_URL)
+                self._repositories = [
+                    TemplateRepository(
+                        settings,
+                        make_path(self._config_dir, "ptool-templates"),
+                        self._cache_dir,
+                        make_path(self._config_dir, "snapshots", settings.name),
+                        make_path(self._config_dir, "locks", "{}.lock".format(settings.name)))
+                ]
+            else:
+                if not isinstance(objs, list) or len(objs) == 0:
+                    raise Informational("{} in {} must be a non-empty list".format(_REPOSITORIES_KEY, self._config_yaml_path))
+
+                repositories = []
+                for o in objs:
+                    settings = RepositorySettings.from_obj(o)
+                    if any(r.name == settings.name for r in repositories):
+                        raise Informational("Duplicate template repository name \"{}\" in {}".format(settings.name, self._config_yaml_path))
+                    repositories.append(TemplateRepository(
+                        settings,
+                        make_path(self._config_dir, "repos", settings.name),
+                        make_path(self._cache_dir, "repos", settings.name),
+                        make_path(self._config_dir, "snapshots", settings.name),
+                        make_path(self._config_dir, "locks", "{}.lock".format(settings.name))))
+                self._repositories = repositories
+        return self._repositories
 
     @property
     def value_source(self):
         if self._value_source is None:
-            values = read_yaml_file(self._config_yaml_path)
+            values = { key : value for key, value in self._read_config_obj().iteritems() if key not in _SETTINGS_KEYS }
             self._value_source = ValueSource(self._config_yaml_path, values)
         return self._value_source
 
+    def _read_config_obj(self):
+        if self._config_obj is None:
+            # Concurrent processes may all find config.yaml missing, so
+            # write it atomically: each writes the same content
+            if not os.path.isfile(self._config_yaml_path):
+                import yaml
+                ensure_dir(self._config_dir)
+                with atomic_write(self._config_yaml_path, "wt") as f:
+                    f.write(yaml.dump(_DEFAULT_CONFIG))
+
+            self._config_obj = self.yaml_cache.read(self._config_yaml_path) or {}
+        return self._config_obj
+
 # TODO: Implement version checks and repairs
 """
 def _perform_version_check(ptool_repo_dir, repo_dir):
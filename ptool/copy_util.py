@@ -0,0 +1,137 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import errno
+import os
+import sys
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Linux ioctl request number for FICLONE (_IOW(0x94, 9, int))
+_FICLONE = 0x40049409
+_CHUNK_SIZE = 1024 * 1024
+
+COPY_METHOD_HARDLINK = "hardlink"
+COPY_METHOD_REFLINK = "reflink"
+COPY_METHOD_COPY_FILE_RANGE = "copy_file_range"
+COPY_METHOD_SENDFILE = "sendfile"
+COPY_METHOD_BUFFERED = "buffered"
+
+def _errnos(*names):
+    return tuple(getattr(errno, name) for name in names if hasattr(errno, name))
+
+_KERNEL_COPY_UNSUPPORTED_ERRNOS = _errnos("EINVAL", "ENOSYS", "EXDEV", "EOPNOTSUPP", "ENOTSUP", "EBADF")
+_HARDLINK_UNSUPPORTED_ERRNOS = _errnos("EXDEV", "EPERM", "EMLINK", "EOPNOTSUPP", "ENOTSUP")
+
+def _try_reflink(source_fd, target_fd):
+    if fcntl is None or not sys.platform.startswith("linux"):
+        return False
+    try:
+        fcntl.ioctl(target_fd, _FICLONE, source_fd)
+        return True
+    except (IOError, OSError):
+        return False
+
+def _try_kernel_copy(copy_func, source_fd, target_fd, size):
+    if copy_func is None:
+        return False
+
+    offset = 0
+    while offset < size:
+        try:
+            n = copy_func(source_fd, target_fd, offset, size - offset)
+        except OSError as e:
+            # Only fall back before anything has been written
+            if offset == 0 and e.errno in _KERNEL_COPY_UNSUPPORTED_ERRNOS:
+                return False
+            raise
+        if n == 0:
+            break
+        offset += n
+
+    return True
+
+def _copy_file_range(source_fd, target_fd, offset, count):
+    return os.copy_file_range(source_fd, target_fd, count, offset, offset)
+
+def _sendfile(source_fd, target_fd, offset, count):
+    return os.sendfile(target_fd, source_fd, offset, count)
+
+def _buffered_copy(source_file, target_file, size):
+    remaining = size
+    while remaining > 0:
+        buf = source_file.read(min(_CHUNK_SIZE, remaining))
+        if len(buf) == 0:
+            break
+        target_file.write(buf)
+        remaining -= len(buf)
+
+def _try_hardlink(source_path, target_path):
+    link_func = getattr(os, "link", None)
+    if link_func is None:
+        return False
+    try:
+        link_func(source_path, target_path)
+        return True
+    except OSError as e:
+        if e.errno in _HARDLINK_UNSUPPORTED_ERRNOS:
+            return False
+        raise
+
+# Copies the first size bytes (default: all) of a file using the cheapest
+# mechanism available, returning the method used and the number of bytes
+# copied
+def copy_file(source_path, target_path, link=False, size=None):
+    source_size = os.path.getsize(source_path)
+    if size is None:
+        size = source_size
+
+    # Whole-file clones are only possible when copying the entire file
+    is_whole_file = size == source_size
+
+    if link and is_whole_file and _try_hardlink(source_path, target_path):
+        return COPY_METHOD_HARDLINK, size
+
+    with open(source_path, "rb") as source_file, open(target_path, "wb") as target_file:
+        source_fd = source_file.fileno()
+        target_fd = target_file.fileno()
+
+        if is_whole_file and _try_reflink(source_fd, target_fd):
+            return COPY_METHOD_REFLINK, size
+
+        copy_file_range = _copy_file_range if hasattr(os, "copy_file_range") else None
+        if _try_kernel_copy(copy_file_range, source_fd, target_fd, size):
+            return COPY_METHOD_COPY_FILE_RANGE, size
+
+        sendfile = _sendfile if hasattr(os, "sendfile") and sys.platform.startswith("linux") else None
+        if _try_kernel_copy(sendfile, source_fd, target_fd, size):
+            return COPY_METHOD_SENDFILE, size
+
+        _buffered_copy(source_file, target_file, size)
+        return COPY_METHOD_BUFFERED, size
+
+class CopyStats(object):
+    def __init__(self):
+        self._files = []
+
+    @property
+    def files(self): return self._files
+
+    @property
+    def total_bytes(self): return sum(size for _, _, size in self._files)
+
+    def record(self, target_path, method, size):
+        self._files.append((target_path, method, size))
+
+    def method_totals(self):
+        totals = {}
+        for _, method, size in self._files:
+            count, total = totals.get(method, (0, 0))
+            totals[method] = count + 1, total + size
+        return totals
@@ -4,49 +4,172 @@
 #
 # -----------------------------------------------------------------------------
 
+import hashlib
+import io
+
 from pyprelude.file_system import *
 
-from ptool.template_util import template_tokens
+from ptool.copy_util import COPY_METHOD_BUFFERED, copy_file
+from ptool.trace import SPAN_FILE, span
+
+class GenerationResult(object):
+    def __init__(self, target_path, copy_method, size, sha1):
+        self._target_path = target_path
+        self._copy_method = copy_method
+        self._size = size
+        self._sha1 = sha1
+
+    @property
+    def target_path(self): return self._target_path
+
+    # None for rendered templates
+    @property
+    def copy_method(self): return self._copy_method
+
+    @property
+    def size(self): return self._size
+
+    @property
+    def sha1(self): return self._sha1
 
 class FileInfo(object):
     def __init__(self, source_path, output_path_template, is_template):
         self._source_path = source_path
         self._output_path_template = output_path_template
         self._is_template = is_template
-        self._content = None
+        self._literal_size = None
+        self._copy_sha1 = None
         self._keys = None
 
+    @property
+    def source_path(self): return self._source_path
+
+    @property
+    def output_path_template(self): return self._output_path_template
+
+    @property
+    def is_template(self): return self._is_template
+
+    # Number of bytes of the source file to copy verbatim if this template
+    # contains no template syntax, otherwise None
+    @property
+    def literal_size(self): return self._literal_size
+
+    @property
+    def is_copied(self): return not self._is_template or self._literal_size is not None
+
+    # Hash of the output of a copied file, if known from scanning
+    @property
+    def copy_sha1(self): return self._copy_sha1
+
+    def set_scan_info(self, literal_size, copy_sha1):
+        self._literal_size = literal_size
+        self._copy_sha1 = copy_sha1
+
     @property
     def keys(self):
         if self._keys is None:
+            from ptool.template_util import template_tokens
             self._keys = template_tokens(self._output_path_template, self.content if self._is_template else "")
         return self._keys
 
+    # Not cached: template bodies can be large and are only needed briefly
     @property
     def content(self):
         if not self._is_template:
             raise RuntimeError("Not a template")
 
-        if self._content is None:
-            with open(self._source_path, "rt") as f:
-                self._content = f.read()
-
-        return self._content
+        with open(self._source_path, "rt") as f:
+            return f.read()
 
-    def generate(self, ctx, values, output_dir):
-        unresolved_path = ctx.render_from_template_string(self._output_path_template, values)
+    # Not checked to be inside output_dir
+    def output_path(self, ctx, values, output_dir):
+        return make_path(output_dir, ctx.render_from_template_string(self._output_path_template, values))
 
-        target_path = make_path(output_dir, unresolved_path)
-        target_dir = os.path.dirname(target_path)
+    def target_path(self, ctx, values, output_dir):
+        target_path = self.output_path(ctx, values, output_dir)
 
         if output_dir != os.path.commonprefix([output_dir, target_path]):
             raise RuntimeError("Must set output-path for out-of-tree file {}".format(self._output_path_template))
 
-        if not os.path.isdir(target_dir):
-            os.makedirs(target_dir)
+        return target_path
+
+    # Returns the size of the output and whether it is exact, which it is
+    # unless the file must be rendered, in which case the size of the
+    # template is given instead
+    def estimate_size(self, revision=None):
+        if self._literal_size is not None:
+            return self._literal_size, True
+
+        size = os.path.getsize(self._source_path) \
+            if revision is None \
+            else len(revision.read(self._source_path))
+        return size, not self._is_template
+
+    # Writes this file's output to path, returning the copy method (None for
+    # rendered templates), the number of bytes written and their hash
+    def write(self, ctx, values, path, link=False):
+        if self.is_copied and ctx.revision is not None:
+            content = ctx.revision.read(self._source_path)
+            if self._literal_size is not None:
+                content = content[:self._literal_size]
+            with open(path, "wb") as f:
+                f.write(content)
+            return COPY_METHOD_BUFFERED, len(content), self._copy_sha1
+
+        if self.is_copied:
+            method, size = copy_file(self._source_path, path, link=link, size=self._literal_size)
+            return method, size, self._copy_sha1
+
+        # Write chunks as Jinja produces them instead of building the whole
+        # rendered file in memory
+        h = hashlib.sha1()
+        with open(path, "wt") as f:
+            for chunk in ctx.generate_from_template_file(self._source_path, values):
+                f.write(chunk)
+                h.update(chunk.encode("utf-8"))
+            size = f.tell()
+
+        return None, size, h.hexdigest()
+
+    # Adds this file's output to archive as relpath, returning the same as
+    # write
+    def write_to_archive(self, ctx, values, archive, relpath):
+        if self.is_copied and ctx.revision is not None:
+            content = ctx.revision.read(self._source_path)
+            if self._literal_size is not None:
+                content = content[:self._literal_size]
+            archive.add_file(relpath, io.BytesIO(content), len(content))
+            return COPY_METHOD_BUFFERED, len(content), self._copy_sha1
+
+        if self.is_copied:
+            with open(self._source_path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size if self._literal_size is None else self._literal_size
+                archive.add_file(relpath, f, size)
+            return COPY_METHOD_BUFFERED, size, self._copy_sha1
+
+        # Archive entries are preceded by their size, so rendered output is
+        # spooled first
+        h = hashlib.sha1()
+        with archive.spool() as f:
+            for chunk in ctx.generate_from_template_file(self._source_path, values):
+                data = chunk.encode("utf-8")
+                f.write(data)
+                h.update(data)
+            size = f.tell()
+            f.seek(0)
+            archive.add_file(relpath, f, size)
+
+        return None, size, h.hexdigest()
 
-        if self._is_template:
-            with open(target_path, "wt") as f:
-                f.write(ctx.render_from_template_file(self._source_path, values))
-        else:
-            shutil.copyfile(self._source_path, target_path)
+    # Writes the output to target_path, whose directory must already exist,
+    # or to archive as relpath if one is given
+    def generate(self, ctx, values, target_path, relpath, link=False, archive=None):
+        with span(self._source_path, SPAN_FILE) as s:
+            if archive is not None:
+                method, size, sha1 = self.write_to_archive(ctx, values, archive, relpath)
+            else:
+                method, size, sha1 = self.write(ctx, values, target_path, link=link)
+            s.set("bytes", size)
+            s.set("method", "render" if method is None else method)
+        return GenerationResult(target_path, method, size, sha1)
@@ -0,0 +1,101 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import contextlib
+import errno
+import os
+import time
+
+from ptool.util import ensure_dir
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_POLL_INTERVAL = 0.05
+
+# Child processes such as "git cat-file --batch" can outlive the block holding
+# a lock, so they must not inherit its descriptor: a lock is held for as long
+# as any descriptor for it stays open
+def _open_lock_file(path):
+    ensure_dir(os.path.dirname(path))
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+    if fcntl is not None:
+        fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+    return fd
+
+def _try_lock(fd, shared=False):
+    if fcntl is None:
+        import msvcrt
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except IOError:
+            return False
+
+    try:
+        fcntl.flock(fd, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+        return True
+    except IOError as e:
+        if e.errno not in (errno.EAGAIN, errno.EACCES):
+            raise
+        return False
+
+# Holds an exclusive lock on path, creating it if necessary, while the block
+# runs. Locks are advisory and only exclude other processes that take the
+# same lock. They are released by the operating system if the process dies,
+# so a crashed writer never leaves one held. Waiting gives up with an error
+# at deadline, a time.time() value, if one is given.
+@contextlib.contextmanager
+def file_lock(path, deadline=None):
+    fd = _open_lock_file(path)
+    try:
+        while not _try_lock(fd):
+            if deadline is not None and time.time() >= deadline:
+                raise RuntimeError("Timed out waiting for lock {}".format(path))
+            time.sleep(_POLL_INTERVAL)
+        yield
+    finally:
+        # Closing the file releases the lock
+        os.close(fd)
+
+# Holds an exclusive lock on path while the block runs if it can be taken
+# without waiting, yielding whether it was
+@contextlib.contextmanager
+def try_file_lock(path):
+    fd = _open_lock_file(path)
+    try:
+        yield _try_lock(fd)
+    finally:
+        os.close(fd)
+
+# A shared lock on path, waiting for any exclusive holder, that is held until
+# release is called or the object is garbage-collected. Any number of
+# processes can hold a shared lock at once. Windows has no shared locks, so
+# there the object holds nothing.
+class SharedFileLock(object):
+    def __init__(self, path):
+        self._fd = None
+        if fcntl is None:
+            return
+
+        fd = _open_lock_file(path)
+        try:
+            while not _try_lock(fd, shared=True):
+                time.sleep(_POLL_INTERVAL)
+        except:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    def __del__(self):
+        self.release()
+
+    def release(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
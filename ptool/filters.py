@@ -0,0 +1,137 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import inflection
+
+_MAX_CACHE_SIZE = 1024
+
+# Inflections whose results depend only on their arguments and the current
+# inflection rules: anything else inflection exports, such as functions that
+# add rules, is registered without memoization
+_MEMOIZED_INFLECTIONS = frozenset([
+    "camelize",
+    "dasherize",
+    "humanize",
+    "ordinal",
+    "ordinalize",
+    "parameterize",
+    "pluralize",
+    "singularize",
+    "tableize",
+    "titleize",
+    "transliterate",
+    "underscore"
+])
+
+def _public_callable_attrs(cls):
+    for f in dir(cls):
+        attr = getattr(cls, f)
+        if not f.startswith("_") and callable(attr):
+            yield attr
+
+def _git_clone_url_filter(project_name, git_server):
+    protocol = git_server["protocol"]
+    if protocol == "https":
+        host = git_server["host"]
+        group = git_server["group"]
+        return "{}://{}/{}/{}.git".format(protocol, host, group, project_name)
+    else:
+        raise RuntimeError("Unsupported Git protocol {}".format(protocol))
+
+def _git_url_filter(project_name, git_server):
+    protocol = git_server["protocol"]
+    if protocol == "https":
+        host = git_server["host"]
+        group = git_server["group"]
+        return "{}://{}/{}/{}".format(protocol, host, group, project_name)
+    else:
+        raise RuntimeError("Unsupported Git protocol {}".format(protocol))
+
+def _git_group_filter(git_server):
+    return git_server["group"]
+
+_MISSING = object()
+
+# Caches up to max_size results of a pure filter. The cache is emptied when
+# it fills up, which keeps lookups as cheap as a dictionary access.
+class MemoizedFilter(object):
+    def __init__(self, func, max_size=_MAX_CACHE_SIZE):
+        self._func = func
+        self._max_size = max_size
+        self._results = {}
+        self._hits = 0
+        self._misses = 0
+        self.__name__ = func.__name__
+
+    @property
+    def func(self): return self._func
+
+    @property
+    def hits(self): return self._hits
+
+    @property
+    def misses(self): return self._misses
+
+    @property
+    def size(self): return len(self._results)
+
+    def clear(self):
+        self._results.clear()
+
+    def __call__(self, *args, **kwargs):
+        key = (args, frozenset(kwargs.iteritems())) if kwargs else args
+        try:
+            result = self._results.get(key, _MISSING)
+        except TypeError:
+            return self._func(*args, **kwargs)
+
+        if result is not _MISSING:
+            self._hits += 1
+            return result
+
+        self._misses += 1
+        result = self._func(*args, **kwargs)
+        if len(self._results) >= self._max_size:
+            self._results.clear()
+        self._results[key] = result
+        return result
+
+_FILTER_REGISTRY = None
+
+# Built once per process and shared by every template context
+def filter_registry():
+    global _FILTER_REGISTRY
+    if _FILTER_REGISTRY is None:
+        # Building a cache key from the git_server dictionary costs more than
+        # the Git filters themselves, so only the inflections are memoized
+        filters = {
+            "git_clone_url": _git_clone_url_filter,
+            "git_url": _git_url_filter,
+            "git_group": _git_group_filter
+        }
+        for f in _public_callable_attrs(inflection):
+            filters[f.__name__] = MemoizedFilter(f) if f.__name__ in _MEMOIZED_INFLECTIONS else f
+        _FILTER_REGISTRY = filters
+    return _FILTER_REGISTRY
+
+# Template modules may change the inflection rules, so results computed under
+# the previous rules are discarded once a module has been registered
+def clear_filter_caches():
+    if _FILTER_REGISTRY is None:
+        return
+    for f in _FILTER_REGISTRY.itervalues():
+        if isinstance(f, MemoizedFilter):
+            f.clear()
+
+# Returns name, hits, misses and cache size for each filter that was used
+def filter_cache_stats():
+    if _FILTER_REGISTRY is None:
+        return []
+    return [
+        (name, f.hits, f.misses, f.size)
+        for name, f in sorted(_FILTER_REGISTRY.iteritems())
+        if isinstance(f, MemoizedFilter) and f.hits + f.misses > 0
+    ]
@@ -0,0 +1,187 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import os
+
+from pyprelude.file_system import *
+
+from ptool.commands import GitExecuteAttributeCommandInfo, GitSymlinkCommandInfo, PlannedCommand
+from ptool.exceptions import Informational
+from ptool.manifest import MANIFEST_FILE_NAME
+from ptool.util import ensure_dir
+
+def _relpath(path):
+    return os.path.normpath(path).replace(os.sep, "/")
+
+class PlannedFile(object):
+    def __init__(self, index, file, relpath, target_path, revision):
+        self._index = index
+        self._file = file
+        self._relpath = relpath
+        self._target_path = target_path
+        self._revision = revision
+        self._size = None
+
+    # Position of the file in the template specification
+    @property
+    def index(self): return self._index
+
+    @property
+    def file(self): return self._file
+
+    # Relative to the project directory, using "/" separators
+    @property
+    def relpath(self): return self._relpath
+
+    @property
+    def target_path(self): return self._target_path
+
+    # Number of bytes the file will have, which for rendered templates is
+    # estimated as the size of the template. Only computed when asked for,
+    # so that generating from a plan does not stat every source file.
+    @property
+    def size(self): return self._estimate()[0]
+
+    @property
+    def is_size_exact(self): return self._estimate()[1]
+
+    def _estimate(self):
+        if self._size is None:
+            self._size = self._file.estimate_size(self._revision)
+        return self._size
+
+# Everything that generating a project will do, worked out before anything
+# is written: the output path of every file, the directories they need and
+# what the commands will do. Problems such as two files with the same output
+# path are collected rather than raised so that all of them can be reported.
+class GenerationPlan(object):
+    def __init__(self, output_dir, files, dirs, executable_paths, symlinks, commands, problems, warnings):
+        self._output_dir = output_dir
+        self._files = files
+        self._dirs = dirs
+        self._executable_paths = executable_paths
+        self._symlinks = symlinks
+        self._commands = commands
+        self._problems = problems
+        self._warnings = warnings
+
+    @property
+    def output_dir(self): return self._output_dir
+
+    # A PlannedFile for each file in the template specification, in order
+    @property
+    def files(self): return self._files
+
+    # Directories to create, relative to the project directory, each after
+    # its parent
+    @property
+    def dirs(self): return self._dirs
+
+    # Paths set executable by git-execute-attribute
+    @property
+    def executable_paths(self): return self._executable_paths
+
+    # Map of link paths from git-symlink to link targets
+    @property
+    def symlinks(self): return self._symlinks
+
+    # A PlannedCommand for every other command
+    @property
+    def commands(self): return self._commands
+
+    @property
+    def problems(self): return self._problems
+
+    # Things that are only problems if commands do not run, such as setting
+    # the execute attribute on a file that no template file generates, which
+    # an earlier command may create
+    @property
+    def warnings(self): return self._warnings
+
+    @property
+    def estimated_bytes(self): return sum(planned_file.size for planned_file in self._files)
+
+    # Pass commands_run=False when the output is not a project directory in
+    # which commands will run, such as an archive
+    def check(self, commands_run=True):
+        problems = self._problems if commands_run else self._problems + self._warnings
+        if len(problems) > 0:
+            raise Informational("\n".join(problems))
+
+    # Creates the output directory and every directory below it, making one
+    # call per directory
+    def create_dirs(self):
+        ensure_dir(self._output_dir)
+        for relpath in self._dirs:
+            os.mkdir(make_path(self._output_dir, *relpath.split("/")))
+
+# Renders the commands without running them. git-execute-attribute and
+# git-symlink become a set of executable paths and a map from link path to
+# link target, all relative to the project directory, and every other
+# command becomes a PlannedCommand.
+def _plan_commands(commands, ctx, values):
+    executable_paths = set()
+    symlinks = {}
+    planned_commands = []
+    applied_names = set()
+    for command in commands:
+        if isinstance(command, GitExecuteAttributeCommandInfo):
+            executable_paths.add(_relpath(command.path(ctx, values)))
+            applied_names.add(command.name)
+        elif isinstance(command, GitSymlinkCommandInfo):
+            source_path, target_path = command.paths(ctx, values)
+            symlinks[_relpath(target_path)] = os.path.relpath(source_path, os.path.dirname(target_path)).replace(os.sep, "/")
+            applied_names.add(command.name)
+        else:
+            planned_commands.append(PlannedCommand(
+                command.name,
+                # Links and executable bits are already in place
+                [name for name in command.after if name not in applied_names],
+                command.prepare(ctx, values)))
+    return executable_paths, symlinks, planned_commands
+
+def plan_generation(template_spec, ctx, values, output_dir):
+    files = []
+    problems = []
+    sources = { MANIFEST_FILE_NAME : ["(manifest)"] }
+    dirs = set()
+    for i, file in enumerate(template_spec.files):
+        target_path = file.output_path(ctx, values, output_dir)
+        relpath = os.path.relpath(target_path, output_dir)
+        if relpath == os.curdir or relpath == os.pardir or relpath.startswith(os.pardir + os.sep):
+            problems.append("Must set output-path for out-of-tree file {}".format(file.output_path_template))
+            continue
+
+        relpath = relpath.replace(os.sep, "/")
+        sources.setdefault(relpath, []).append(os.path.relpath(file.source_path, template_spec.template_dir))
+        files.append(PlannedFile(i, file, relpath, target_path, ctx.revision))
+
+        fragments = relpath.split("/")
+        for j in range(1, len(fragments)):
+            dirs.add("/".join(fragments[:j]))
+
+    for relpath in sorted(sources.keys()):
+        if len(sources[relpath]) > 1:
+            problems.append("Output path {} is generated by more than one file: {}".format(relpath, ", ".join(sources[relpath])))
+        if relpath in dirs:
+            problems.append("Output path {} of {} is also a directory".format(relpath, ", ".join(sources[relpath])))
+
+    executable_paths, symlinks, planned_commands = _plan_commands(template_spec.commands, ctx, values)
+    warnings = [
+        "{} is set executable but is not generated by a template file".format(path)
+        for path in sorted(executable_paths)
+        if path not in sources
+    ]
+
+    return GenerationPlan(
+        output_dir,
+        files,
+        sorted(dirs, key=lambda d: d.split("/")),
+        executable_paths,
+        symlinks,
+        planned_commands,
+        problems,
+        warnings)
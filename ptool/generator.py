@@ -0,0 +1,253 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import io
+import sys
+
+from pyprelude.file_system import *
+
+from ptool.bytecode_cache import BytecodeCache
+from ptool.command_runner import run_commands
+from ptool.exceptions import Informational
+from ptool.generation_plan import plan_generation
+from ptool.git_util import GitBatch, read_head_commit
+from ptool.key_scanner import scan_template_spec
+from ptool.manifest import MANIFEST_FILE_NAME, Manifest, file_sha1, file_stat, manifest_relpath
+from ptool.pipeline import generate_files
+from ptool.project_archive import archive_writer_factory, open_project_archive
+from ptool.scan_cache import ScanCache
+from ptool.template_spec import find_template
+from ptool.template_archive import read_archive_section
+from ptool.template_util import TemplateContext
+from ptool.trace import span
+from ptool.value_source import ValueSource, without_sources
+
+# Holds the state for one template that can be reused across projects: the
+# parsed specification, the keys it references and a template context whose
+# compiled templates are kept between projects
+class ProjectGenerator(object):
+    # Templates are read from the working tree, or from the Git objects of
+    # commit rev without touching the working tree
+    def __init__(self, config, template_name, jobs=1, rev=None):
+        self._config = config
+        self._repository, self._template_spec = find_template(config, template_name, rev)
+        self._revision = self._template_spec.revision
+        self._repo_dir = self._template_spec.repo_dir
+        self._jobs = jobs
+        self._keys = None
+        self._ctx = None
+
+    @property
+    def template_spec(self): return self._template_spec
+
+    @property
+    def repository(self): return self._repository
+
+    @property
+    def commit(self):
+        return read_head_commit(self._repo_dir) \
+            if self._template_spec.commit is None \
+            else self._template_spec.commit
+
+    def merge_values(self, project_value_source, *value_sources):
+        return ValueSource.merge_values(
+            [project_value_source, self._template_spec.value_source, self._config.value_source] + list(value_sources))
+
+    def check_values(self, values):
+        if self._keys is None:
+            with span("Scan template keys"):
+                self._keys = scan_template_spec(
+                    self._template_spec,
+                    [self._template_spec.template_dir, self._repo_dir],
+                    ScanCache(self._config.scan_cache_path),
+                    self._jobs)
+
+        missing_keys = []
+        for key in self._keys:
+            if key not in values:
+                missing_keys.append(key)
+
+        if len(missing_keys) > 0:
+            raise Informational(
+                "Provide values for {} in {} or via command line".format(
+                    ", ".join(map(lambda k: "\"{}\"".format(k), missing_keys)),
+                    self._config.config_yaml_path))
+
+    def context(self, values):
+        if self._ctx is None:
+            if self._repo_dir not in sys.path:
+                sys.path.append(self._repo_dir)
+
+            with span("Create template context"):
+                self._ctx = TemplateContext(
+                    [self._template_spec.template_dir, self._repo_dir],
+                    self._template_spec.template_dir,
+                    values,
+                    bytecode_cache=BytecodeCache(self._config.bytecode_cache_dir),
+                    archive_section=None if self._revision is not None else read_archive_section(
+                        self._repository.template_archive_path,
+                        self._repo_dir,
+                        self._template_spec.name),
+                    revision=self._revision)
+        else:
+            self._ctx.set_globals(values)
+
+        return self._ctx
+
+    def _project_values(self, output_dir, project_name, key_value_pairs):
+        if project_name is None:
+            project_name = os.path.basename(output_dir)
+
+        project_value_source = ValueSource.project(project_name)
+        command_line_value_source = ValueSource.command_line(key_value_pairs)
+        values = self.merge_values(project_value_source, command_line_value_source)
+
+        self.check_values(values)
+
+        overrides = without_sources(ValueSource.merge_values(project_value_source, command_line_value_source))
+        return without_sources(values), overrides
+
+    def _manifest(self, values, overrides, output_dir, results):
+        return Manifest(
+            self._template_spec.name,
+            self.commit,
+            values,
+            overrides,
+            { manifest_relpath(output_dir, result.target_path) : result.sha1 for result in results })
+
+    def _plan(self, ctx, values, output_dir):
+        with span("Plan generation"):
+            return plan_generation(self._template_spec, ctx, values, output_dir)
+
+    # Works out what generating the project would do without writing
+    # anything, for "ptool new --dry-run"
+    def plan(self, output_dir, project_name=None, key_value_pairs=[]):
+        values_without_sources, _ = self._project_values(output_dir, project_name, key_value_pairs)
+        return self._plan(self.context(values_without_sources), values_without_sources, output_dir)
+
+    def generate(self, output_dir, project_name=None, key_value_pairs=[], force_overwrite=False, link=False):
+        if os.path.exists(output_dir) and not force_overwrite:
+            raise Informational("Output directory \"{}\" already exists: force overwrite with --force".format(output_dir))
+
+        values_without_sources, overrides = self._project_values(output_dir, project_name, key_value_pairs)
+        ctx = self.context(values_without_sources)
+
+        # Conflicts are found before anything is removed or written
+        plan = self._plan(ctx, values_without_sources, output_dir)
+        plan.check()
+
+        if os.path.exists(output_dir):
+            remove_dir(output_dir)
+
+        with span("Create directories"):
+            plan.create_dirs()
+
+        # Render workers read the specification from the saved cache
+        if self._jobs > 1:
+            self._config.save_caches()
+
+        with span("Generate files") as s:
+            results = generate_files(
+                self._repo_dir,
+                self._template_spec,
+                ctx,
+                values_without_sources,
+                plan,
+                self._jobs,
+                self._config.bytecode_cache_dir,
+                self._config.yaml_cache_path,
+                None if self._revision is not None else self._repository.template_archive_path,
+                link=link)
+            s.set("bytes", sum(result.size for result in results))
+
+        # Written before commands run so that they can add it to a
+        # repository, and again afterwards with the hashes of any files they
+        # changed so that regenerating does not report those as conflicts
+        with span("Write manifest"):
+            manifest = self._manifest(values_without_sources, overrides, output_dir, results)
+            manifest.write(output_dir)
+            file_stats = [file_stat(result.target_path) for result in results]
+
+        with span("Run commands"):
+            git_batch = GitBatch(output_dir)
+            run_commands(self._template_spec.commands, ctx, values_without_sources, git_batch, self._jobs, output_dir)
+            git_batch.flush()
+
+        with span("Update manifest"):
+            changed = False
+            for result, before in zip(results, file_stats):
+                after = file_stat(result.target_path)
+                if after is None or after == before:
+                    continue
+                sha1 = file_sha1(result.target_path)
+                if sha1 != result.sha1:
+                    manifest.files[manifest_relpath(output_dir, result.target_path)] = sha1
+                    changed = True
+            if changed:
+                manifest.write(output_dir)
+
+        return results
+
+    # Generates every file in plan into sink, which has the interface of
+    # ProjectArchive, followed by the manifest and symbolic links
+    def _generate_entries(self, sink, plan, ctx, values, overrides):
+        results = []
+        with span("Generate files") as s:
+            for planned_file in plan.files:
+                # Replaced by a symbolic link, as checking out the link
+                # would replace the file
+                if planned_file.relpath in plan.symlinks:
+                    continue
+                results.append(planned_file.file.generate(ctx, values, planned_file.target_path, planned_file.relpath, archive=sink))
+            s.set("bytes", sum(result.size for result in results))
+
+        with span("Write manifest"):
+            data = self._manifest(values, overrides, plan.output_dir, results).dumps()
+            if not isinstance(data, bytes):
+                data = data.encode("utf-8")
+            sink.add_file(MANIFEST_FILE_NAME, io.BytesIO(data), len(data))
+
+        for relpath in sorted(plan.symlinks.keys()):
+            sink.add_symlink(relpath, plan.symlinks[relpath])
+
+        return results
+
+    # Writes the project to an archive at archive_path, or to standard output
+    # if it is "-", with every entry under a directory named after output_dir.
+    # Nothing is written to output_dir itself. Executable bits and symbolic
+    # links from git-execute-attribute and git-symlink are stored in the
+    # archive entries. Other commands need a project directory to run in, so
+    # they are reported on stderr and skipped. Files are rendered one at a
+    # time into the archive, so memory use does not grow with the project.
+    def generate_archive(self, archive_path, output_dir, project_name=None, key_value_pairs=[], output=sys.stderr):
+        archive_writer_factory(archive_path)
+
+        values_without_sources, overrides = self._project_values(output_dir, project_name, key_value_pairs)
+        ctx = self.context(values_without_sources)
+
+        plan = self._plan(ctx, values_without_sources, output_dir)
+        plan.check(commands_run=False)
+        for command in plan.commands:
+            output.write("Skipping command \"{}\": commands do not run when writing an archive\n".format(command.display))
+
+        with open_project_archive(archive_path, os.path.basename(output_dir), plan.executable_paths) as archive:
+            return self._generate_entries(archive, plan, ctx, values_without_sources, overrides)
+
+    # Renders the project into memory without writing to or running anything
+    # in a project directory. output_dir is used only to name the project and
+    # resolve output paths.
+    def generate_in_memory(self, output_dir, project_name=None, key_value_pairs=[]):
+        from ptool.memory_project import MemoryProject
+
+        values_without_sources, overrides = self._project_values(output_dir, project_name, key_value_pairs)
+        ctx = self.context(values_without_sources)
+
+        plan = self._plan(ctx, values_without_sources, output_dir)
+        plan.check(commands_run=False)
+
+        project = MemoryProject(plan.executable_paths, plan.commands)
+        self._generate_entries(project, plan, ctx, values_without_sources, overrides)
+        return project
@@ -0,0 +1,237 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import collections
+import errno
+import os
+import posixpath
+import subprocess
+import threading
+
+from ptool.exceptions import Informational
+from ptool.trace import span
+
+_MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+_TYPE_TREE = "tree"
+_TYPE_COMMIT = "commit"
+_MODE_TREE = "40000"
+_MODE_SYMLINK = "120000"
+_MODE_SUBMODULE = "160000"
+
+# The limit Linux places on following links when resolving a path
+_MAX_SYMLINKS = 40
+
+# Reads objects from a Git repository through a single long-lived
+# "git cat-file --batch" process. Objects are cached by hash, least recently
+# used first out, up to a total of max_cache_bytes.
+class GitObjectReader(object):
+    def __init__(self, repo_dir, max_cache_bytes=_MAX_CACHE_BYTES):
+        self._repo_dir = repo_dir
+        self._max_cache_bytes = max_cache_bytes
+        self._lock = threading.Lock()
+        self._process = None
+        self._cache = collections.OrderedDict()
+        self._cache_bytes = 0
+
+    @property
+    def repo_dir(self): return self._repo_dir
+
+    @property
+    def cache_bytes(self): return self._cache_bytes
+
+    # Returns the hash, type and content of the named object, or None if
+    # there is no such object. The name may be anything "git rev-parse"
+    # accepts, such as "v1.0^{commit}".
+    def read(self, name):
+        with self._lock:
+            entry = self._cache.pop(name, None)
+            if entry is not None:
+                self._cache[name] = entry
+                return (name,) + entry
+
+            result = self._read_object(name)
+            if result is not None:
+                self._put(*result)
+            return result
+
+    def close(self):
+        with self._lock:
+            if self._process is not None:
+                self._process.stdin.close()
+                self._process.wait()
+                self._process = None
+
+    def _read_object(self, name):
+        if self._process is None:
+            self._process = subprocess.Popen(
+                ["git", "cat-file", "--batch"],
+                cwd=self._repo_dir,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE)
+
+        with span("Read Git object", "git", object=name):
+            self._process.stdin.write(name + "\n")
+            self._process.stdin.flush()
+
+            header = self._process.stdout.readline()
+            if len(header) == 0:
+                raise RuntimeError("Git object reader for {} exited unexpectedly".format(self._repo_dir))
+
+            fragments = header.split()
+            if len(fragments) != 3:
+                return None
+
+            hash, object_type, size = fragments
+            content = self._process.stdout.read(int(size))
+            self._process.stdout.read(1)
+            return hash, object_type, content
+
+    def _put(self, hash, object_type, content):
+        if len(content) > self._max_cache_bytes:
+            return
+
+        if hash not in self._cache:
+            self._cache[hash] = object_type, content
+            self._cache_bytes += len(content)
+
+        while self._cache_bytes > self._max_cache_bytes:
+            _, (_, evicted) = self._cache.popitem(last=False)
+            self._cache_bytes -= len(evicted)
+
+def _parse_tree(content):
+    entries = {}
+    i = 0
+    while i < len(content):
+        space = content.index(" ", i)
+        nul = content.index("\0", space)
+        mode = content[i : space]
+        name = content[space + 1 : nul]
+        entries[name] = mode, content[nul + 1 : nul + 21].encode("hex")
+        i = nul + 21
+    return entries
+
+# The files of a template repository at one commit, read from Git objects
+# instead of a working tree. Paths are absolute paths under the repository
+# directory, exactly as they would be for a checkout, so that template
+# specifications, output paths and includes resolve the same way.
+class GitRevision(object):
+    def __init__(self, reader, rev):
+        result = reader.read("{}^{{{}}}".format(rev, _TYPE_COMMIT))
+        if result is None:
+            raise Informational("No revision \"{}\" found in {}".format(rev, reader.repo_dir))
+
+        self._reader = reader
+        self._commit = result[0]
+        self._tree = self._commit_tree(result[2])
+        self._trees = {}
+
+    @property
+    def repo_dir(self): return self._reader.repo_dir
+
+    @property
+    def commit(self): return self._commit
+
+    def isfile(self, path):
+        entry = self._entry(path)
+        return entry is not None and entry[0] not in (_MODE_TREE, _MODE_SUBMODULE)
+
+    # Returns the hash of the blob at path, which identifies its content, or
+    # None if there is no such file
+    def hash(self, path):
+        entry = self._entry(path)
+        return None if entry is None or entry[0] == _MODE_TREE else entry[1]
+
+    def isdir(self, path):
+        entry = self._entry(path)
+        return entry is not None and entry[0] == _MODE_TREE
+
+    def listdir(self, path):
+        if os.path.relpath(path, self._reader.repo_dir) == os.curdir:
+            return sorted(self._tree_entries("", self._tree).keys())
+
+        entry = self._entry(path)
+        if entry is None or entry[0] != _MODE_TREE:
+            raise OSError(errno.ENOENT, "No such directory in revision {}".format(self._commit), path)
+
+        relpath = os.path.relpath(path, self._reader.repo_dir).replace(os.sep, "/")
+        return sorted(self._tree_entries(relpath, entry[1]).keys())
+
+    def read(self, path):
+        entry = self._entry(path)
+        if entry is None or entry[0] == _MODE_TREE:
+            raise IOError(errno.ENOENT, "No such file in revision {}".format(self._commit), path)
+
+        # A submodule's commit is not an object in this repository
+        if entry[0] == _MODE_SUBMODULE:
+            raise IOError(errno.ENOENT, "Submodule contents are not available in revision {}".format(self._commit), path)
+
+        return self._reader.read(entry[1])[2]
+
+    def _commit_tree(self, content):
+        for line in content.splitlines():
+            if line.startswith(_TYPE_TREE + " "):
+                return line[len(_TYPE_TREE) + 1:]
+        raise RuntimeError("Commit {} has no tree".format(self._commit))
+
+    # Symbolic links are followed within the revision, as they would be when
+    # opening a file in a checkout, so the entry returned is never a link
+    def _entry(self, path):
+        relpath = os.path.relpath(path, self._reader.repo_dir)
+        if relpath == os.curdir or relpath.startswith(os.pardir):
+            return None
+
+        names = relpath.split(os.sep)
+        link_count = 0
+        i = 0
+        entries = self._tree_entries("", self._tree)
+        while True:
+            entry = entries.get(names[i])
+            if entry is not None and entry[0] == _MODE_SYMLINK:
+                link_count += 1
+                if link_count > _MAX_SYMLINKS:
+                    raise IOError(errno.ELOOP, "Too many levels of symbolic links in revision {}".format(self._commit), path)
+
+                target = self._reader.read(entry[1])[2]
+                target_relpath = posixpath.normpath(posixpath.join("/".join(names[0 : i]), target))
+                if posixpath.isabs(target) or target_relpath == os.pardir or target_relpath.startswith(os.pardir + "/"):
+                    raise IOError(errno.ENOENT, "Symbolic link points outside revision {}".format(self._commit), path)
+
+                names = ([] if target_relpath == os.curdir else target_relpath.split("/")) + names[i + 1:]
+                if len(names) == 0:
+                    return _MODE_TREE, self._tree
+                i = 0
+                entries = self._tree_entries("", self._tree)
+                continue
+
+            if i == len(names) - 1:
+                return entry
+            if entry is None or entry[0] != _MODE_TREE:
+                return None
+            entries = self._tree_entries("/".join(names[0 : i + 1]), entry[1])
+            i += 1
+
+    def _tree_entries(self, relpath, hash):
+        entries = self._trees.get(relpath)
+        if entries is None:
+            entries = _parse_tree(self._reader.read(hash)[2])
+            self._trees[relpath] = entries
+        return entries
+
+_READERS = {}
+_READERS_LOCK = threading.Lock()
+
+# Readers are shared by every revision of the same repository in a process
+def git_object_reader(repo_dir):
+    with _READERS_LOCK:
+        reader = _READERS.get(repo_dir)
+        if reader is None:
+            reader = GitObjectReader(repo_dir)
+            _READERS[repo_dir] = reader
+        return reader
+
+def read_git_revision(repo_dir, rev):
+    return GitRevision(git_object_reader(repo_dir), rev)
@@ -4,27 +4,190 @@
 #
 # -----------------------------------------------------------------------------
 
+import itertools
 import os
+import stat
 
-from pyprelude.temp_util import *
-from pysimplevcs.git import *
+from ptool.util import default_dir_mode
 
-def _get_prefix(git):
-    return git.rev_parse("--show-prefix").strip()
+def _read_text_file(path):
+    with open(path, "rt") as f:
+        return f.read().strip()
 
-def _hash_object(git, content):
-    return git.hash_object("-w", "--stdin", stdin=content).strip()
+def _find_git_dirs(repo_dir):
+    git_dir = os.path.join(repo_dir, ".git")
+    if os.path.isfile(git_dir):
+        git_dir = os.path.join(repo_dir, _read_text_file(git_dir)[len("gitdir: "):])
+
+    common_dir_path = os.path.join(git_dir, "commondir")
+    common_dir = os.path.join(git_dir, _read_text_file(common_dir_path)) \
+        if os.path.isfile(common_dir_path) \
+        else git_dir
+
+    return git_dir, common_dir
+
+def _read_packed_ref(common_dir, ref):
+    packed_refs_path = os.path.join(common_dir, "packed-refs")
+    if os.path.isfile(packed_refs_path):
+        with open(packed_refs_path, "rt") as f:
+            for line in f:
+                fragments = line.split()
+                if len(fragments) == 2 and fragments[1] == ref:
+                    return fragments[0]
+
+# Resolves HEAD by reading Git's metadata files directly, which is much
+# cheaper than spawning "git rev-parse HEAD"
+def read_head_commit(repo_dir):
+    try:
+        git_dir, common_dir = _find_git_dirs(repo_dir)
+        head = _read_text_file(os.path.join(git_dir, "HEAD"))
+        if not head.startswith("ref: "):
+            return head
+
+        ref = head[len("ref: "):]
+        ref_path = os.path.join(common_dir, ref)
+        return _read_text_file(ref_path) \
+            if os.path.isfile(ref_path) \
+            else _read_packed_ref(common_dir, ref)
+    except (IOError, OSError):
+        return None
+
+def _read_config_value(config_path, section, key):
+    if not os.path.isfile(config_path):
+        return None
+
+    value = None
+    current_section = None
+    with open(config_path, "rt") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("["):
+                current_section = line[1 : line.index("]")].strip().lower()
+            elif current_section == section and "=" in line:
+                name, v = line.split("=", 1)
+                if name.strip().lower() == key:
+                    value = v.strip()
+    return value
+
+# True if the repository was cloned with limited history depth
+def is_shallow_repo(repo_dir):
+    try:
+        _, common_dir = _find_git_dirs(repo_dir)
+    except (IOError, OSError):
+        return False
+    return os.path.isfile(os.path.join(common_dir, "shallow"))
+
+# True if only some directories of the repository are checked out. Like
+# read_head_commit, this reads Git's configuration file directly.
+def is_sparse_checkout(repo_dir):
+    try:
+        git_dir, common_dir = _find_git_dirs(repo_dir)
+        value = _read_config_value(os.path.join(git_dir, "config.worktree"), "core", "sparsecheckout")
+        if value is None:
+            value = _read_config_value(os.path.join(common_dir, "config"), "core", "sparsecheckout")
+    except (IOError, OSError):
+        return False
+    return value is not None and value.lower() in ("true", "yes", "on", "1")
+
+def _hash_link_targets(git, link_targets):
+    from pyprelude.temp_util import temp_dir
+
+    # Hash all symlink blobs with a single process: hash-object only reads
+    # content from paths in batch mode, so stage each link target in a file
+    with temp_dir() as d:
+        paths = []
+        for i, link_target in enumerate(link_targets):
+            path = os.path.join(d, str(i))
+            with open(path, "wb") as f:
+                f.write(link_target)
+            paths.append(path)
+
+        output = git.hash_object("-w", "--no-filters", "--stdin-paths", stdin="".join(p + "\n" for p in paths))
+
+    return output.split()
+
+def _index_path(path):
+    return os.path.normpath(path).replace(os.sep, "/")
+
+def _read_index_entries(git, paths):
+    output = git.ls_files("-s", "-z", "--full-name", "--", *paths)
+    entries = {}
+    for record in output.split("\0"):
+        if len(record) > 0:
+            info, path = record.split("\t", 1)
+            mode, hash, _ = info.split()
+            entries[path] = mode, hash
+    return entries
+
+class GitBatch(object):
+    def __init__(self, repo_dir):
+        self._repo_dir = repo_dir
+        self._operations = []
+
+    @property
+    def has_pending_operations(self): return len(self._operations) > 0
+
+    def symlink(self, source_path, target_path):
+        self._operations.append((git_symlink, source_path, target_path))
+
+    def execute_attribute(self, path):
+        self._operations.append((git_execute_attribute, path))
+
+    # Applies all pending operations using a fixed number of Git processes,
+    # producing the same index as running each operation individually.
+    # Consecutive operations of the same kind are applied together, and runs
+    # of different kinds in the order they were queued, so that a later
+    # operation on the same path still wins.
+    def flush(self):
+        if len(self._operations) == 0:
+            return
+
+        from pysimplevcs.git import Git
+
+        operations = self._operations
+        self._operations = []
+
+        git = Git(self._repo_dir)
+        for kind, group in itertools.groupby(operations, lambda o: o[0]):
+            group = list(group)
+            if kind is git_symlink:
+                self._apply_symlinks(git, [(o[1], o[2]) for o in group])
+            else:
+                self._apply_execute_attributes(git, [_index_path(o[1]) for o in group])
+
+    def _apply_symlinks(self, git, symlinks):
+        link_hashes = _hash_link_targets(git, [
+            os.path.relpath(source_path, os.path.dirname(target_path))
+            for source_path, target_path in symlinks
+        ])
+        link_paths = [_index_path(target_path) for _, target_path in symlinks]
+        git.update_index("-z", "--index-info", stdin="".join(
+            "120000 {}\t{}\0".format(hash, path)
+            for hash, path in zip(link_hashes, link_paths)))
+        git.checkout_index("-f", "-u", "-z", "--stdin", stdin="".join(path + "\0" for path in link_paths))
+
+    def _apply_execute_attributes(self, git, executable_paths):
+        index_entries = _read_index_entries(git, executable_paths)
+        for path in executable_paths:
+            if path not in index_entries:
+                raise RuntimeError("Cannot set execute attribute on {}: path is not in Git index".format(path))
+
+        # As with "git update-index --chmod=+x PATH", each file is hashed
+        # again from the working tree, so that changes made since it was
+        # added are kept rather than replaced by a checkout
+        git.update_index("--chmod=+x", "-z", "--stdin", stdin="".join(path + "\0" for path in executable_paths))
+        execute_bits = default_dir_mode() & 0o111
+        for path in executable_paths:
+            full_path = os.path.join(self._repo_dir, *path.split("/"))
+            os.chmod(full_path, stat.S_IMODE(os.stat(full_path).st_mode) | execute_bits)
 
 # Inspired by https://coderwall.com/p/z86txw/make-symlink-on-windows-in-a-git-repo
 def git_symlink(repo_dir, source_path, target_path):
-    rel_path = os.path.relpath(source_path, os.path.dirname(target_path))
-    git = Git(repo_dir)
-    prefix = _get_prefix(git)
-    hash = _hash_object(git, rel_path)
-    git.update_index("--add", "--cacheinfo", "120000", hash, "{}{}".format(prefix, target_path))
-    git.checkout("--", target_path)
+    batch = GitBatch(repo_dir)
+    batch.symlink(source_path, target_path)
+    batch.flush()
 
 def git_execute_attribute(repo_dir, path):
-    git = Git(repo_dir)
-    git.update_index("--chmod=+x", path)
-    git.checkout("--", path)
+    batch = GitBatch(repo_dir)
+    batch.execute_attribute(path)
+    batch.flush()
@@ -0,0 +1,134 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import hashlib
+import multiprocessing
+import os
+
+from ptool.template_util import template_source_tokens, template_tokens
+
+_TEMPLATE_MARKERS = ("{{", "{%", "{#")
+
+# Jinja normalizes these line breaks when rendering, so files containing them
+# must still go through Jinja to produce identical output
+_LINE_BREAKS = ("\r", "\x0b", "\x0c", "\x1c", "\x1d", "\x1e")
+
+_KIND_TEMPLATE = "template"
+_KIND_RAW = "raw"
+
+def _is_literal(content):
+    if os.linesep != "\n":
+        return False
+    return not any(s in content for s in _TEMPLATE_MARKERS + _LINE_BREAKS)
+
+def _scan_file(task):
+    with open(task[0], "rb") as f:
+        return _scan_content(task, f.read())
+
+def _scan_content(task, content):
+    path, kind = task
+    if kind == _KIND_RAW:
+        return task, { "sha1": hashlib.sha1(content).hexdigest() }
+
+    # Rendering a file without template syntax reproduces it minus any single
+    # trailing newline, so record the number of bytes to copy instead
+    if _is_literal(content):
+        literal_size = len(content) - 1 if content.endswith("\n") else len(content)
+        return task, {
+            "keys": [],
+            "includes": [],
+            "literal_size": literal_size,
+            "sha1": hashlib.sha1(content[:literal_size]).hexdigest()
+        }
+
+    keys, includes = template_source_tokens(content, path)
+    return task, { "keys": keys, "includes": includes, "literal_size": None, "sha1": None }
+
+def resolve_include(name, loader_dirs, isfile=os.path.isfile):
+    for loader_dir in loader_dirs:
+        path = os.path.join(loader_dir, *name.split("/"))
+        if isfile(path):
+            return os.path.abspath(path)
+
+def _scan_files(tasks, scan_cache, jobs, revision):
+    entries = {}
+    missing_tasks = []
+    for task in tasks:
+        entry = None if scan_cache is None else scan_cache.get(*task)
+        if entry is None:
+            missing_tasks.append(task)
+        else:
+            entries[task] = entry
+
+    # Files in a Git revision are read through this process's object reader
+    if revision is not None:
+        results = [_scan_content(task, revision.read(task[0])) for task in missing_tasks]
+    elif jobs > 1 and len(missing_tasks) > jobs:
+        pool = multiprocessing.Pool(jobs)
+        try:
+            results = pool.map(_scan_file, missing_tasks)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    else:
+        results = map(_scan_file, missing_tasks)
+
+    for task, entry in results:
+        entries[task] = entry
+        if scan_cache is not None:
+            scan_cache.put(task[0], task[1], entry)
+
+    return entries
+
+# Returns the keys referenced by the template, marks files that contain no
+# template syntax as literal and records the content hash of copied files
+def scan_template_spec(template_spec, loader_dirs, scan_cache=None, jobs=1):
+    keys = set()
+    for file in template_spec.files:
+        keys.update(template_tokens(file.output_path_template))
+    for command in template_spec.commands:
+        keys.update(command.keys)
+
+    # The scan cache is keyed by file modification times, which files in a
+    # Git revision do not have
+    revision = template_spec.revision
+    if revision is not None:
+        scan_cache = None
+    isfile = os.path.isfile if revision is None else revision.isfile
+
+    file_tasks = [
+        (file.source_path, _KIND_TEMPLATE if file.is_template else _KIND_RAW)
+        for file in template_spec.files
+    ]
+
+    # Scan file bodies breadth-first so that included templates are scanned
+    # in the same parallel batches as the files that reference them
+    pending_tasks = set(file_tasks)
+    seen_tasks = set()
+    all_entries = {}
+    while len(pending_tasks) > 0:
+        seen_tasks.update(pending_tasks)
+        entries = _scan_files(sorted(pending_tasks), scan_cache, jobs, revision)
+        all_entries.update(entries)
+        pending_tasks = set()
+        for entry in entries.itervalues():
+            keys.update(entry.get("keys", []))
+            for name in entry.get("includes", []):
+                path = resolve_include(name, loader_dirs, isfile)
+                if path is not None and (path, _KIND_TEMPLATE) not in seen_tasks:
+                    pending_tasks.add((path, _KIND_TEMPLATE))
+
+    for file, task in zip(template_spec.files, file_tasks):
+        entry = all_entries[task]
+        file.set_scan_info(entry.get("literal_size"), entry["sha1"])
+
+    if scan_cache is not None:
+        scan_cache.save()
+
+    return sorted(keys)
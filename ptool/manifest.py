@@ -0,0 +1,98 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import hashlib
+import json
+import os
+import stat
+
+from pyprelude.file_system import *
+
+from ptool.util import atomic_write
+
+MANIFEST_FILE_NAME = ".ptool-manifest.json"
+_MANIFEST_VERSION = 1
+_CHUNK_SIZE = 1024 * 1024
+
+def manifest_relpath(output_dir, target_path):
+    return os.path.relpath(target_path, output_dir).replace(os.sep, "/")
+
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        while True:
+            buf = f.read(_CHUNK_SIZE)
+            if len(buf) == 0:
+                break
+            h.update(buf)
+    return h.hexdigest()
+
+# Returns a value that changes whenever the file at path is rewritten or
+# replaced, without reading it, or None if it is not a regular file
+def file_stat(path):
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return st.st_size, st.st_mtime, st.st_ctime, st.st_ino
+
+class Manifest(object):
+    @staticmethod
+    def try_read(output_dir):
+        path = make_path(output_dir, MANIFEST_FILE_NAME)
+        if not os.path.isfile(path):
+            return None
+
+        with open(path, "rt") as f:
+            obj = json.load(f)
+
+        if obj.get("version") != _MANIFEST_VERSION:
+            raise RuntimeError("Unsupported manifest version {} in {}".format(obj.get("version"), path))
+
+        return Manifest(obj["template"], obj["commit"], obj["values"], obj["overrides"], obj["files"])
+
+    def __init__(self, template_name, commit, values, overrides, files):
+        self._template_name = template_name
+        self._commit = commit
+        self._values = values
+        self._overrides = overrides
+        self._files = files
+
+    @property
+    def template_name(self): return self._template_name
+
+    @property
+    def commit(self): return self._commit
+
+    # All values used to render the project
+    @property
+    def values(self): return self._values
+
+    # Values that must be reused when regenerating: project values such as
+    # the copyright year and values passed on the command line
+    @property
+    def overrides(self): return self._overrides
+
+    # Map of output paths relative to the project directory to content hashes
+    @property
+    def files(self): return self._files
+
+    def dumps(self):
+        obj = {
+            "version": _MANIFEST_VERSION,
+            "template": self._template_name,
+            "commit": self._commit,
+            "values": self._values,
+            "overrides": self._overrides,
+            "files": self._files
+        }
+        return json.dumps(obj, indent=2, sort_keys=True, default=str) + "\n"
+
+    def write(self, output_dir):
+        with atomic_write(make_path(output_dir, MANIFEST_FILE_NAME), "wt") as f:
+            f.write(self.dumps())
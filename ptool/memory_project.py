@@ -0,0 +1,44 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import io
+
+# A generated project held entirely in memory. It receives files in the same
+# way as ProjectArchive, so it can stand in for one during generation.
+class MemoryProject(object):
+    def __init__(self, executable_paths, commands):
+        self._files = {}
+        self._symlinks = {}
+        self._executable_paths = executable_paths
+        self._commands = commands
+
+    # Map of paths relative to the project directory, using "/" separators,
+    # to file contents as bytes, including the manifest
+    @property
+    def files(self): return self._files
+
+    # Map of paths of symbolic links to their targets, relative to the
+    # directory containing each link
+    @property
+    def symlinks(self): return self._symlinks
+
+    # Paths of files that are executable
+    @property
+    def executable_paths(self): return self._executable_paths
+
+    # The PlannedCommand for each command that would run in the project
+    # directory once it is written, in template order
+    @property
+    def commands(self): return self._commands
+
+    def spool(self):
+        return io.BytesIO()
+
+    def add_file(self, relpath, fileobj, size):
+        self._files[relpath] = fileobj.read(size)
+
+    def add_symlink(self, relpath, link_target):
+        self._symlinks[relpath] = link_target
@@ -0,0 +1,115 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import multiprocessing
+import sys
+import traceback
+
+from ptool.bytecode_cache import BytecodeCache
+from ptool.exceptions import Informational
+from ptool.git_objects import GitObjectReader, GitRevision
+from ptool.template_archive import read_archive_section
+from ptool.template_spec import TemplateSpec
+from ptool.template_util import TemplateContext
+from ptool.trace import current_tracer, start_tracing, stop_tracing
+from ptool.yaml_cache import YamlCache
+
+# Per-process state for render workers: each worker reads the template
+# specification and builds its own template context exactly once
+_WORKER_STATE = None
+
+def _init_worker(repo_dir, template_name, values, bytecode_cache_dir, yaml_cache_path, template_archive_path, commit, scan_infos, trace):
+    global _WORKER_STATE
+
+    # Forked workers inherit the parent's tracer and its events
+    stop_tracing()
+    if trace:
+        start_tracing()
+
+    if repo_dir not in sys.path:
+        sys.path.append(repo_dir)
+
+    # Forked workers also inherit the parent's Git object reader, whose
+    # process must not be shared, so start another
+    revision = None if commit is None else GitRevision(GitObjectReader(repo_dir), commit)
+
+    # The parent process has already read the specification, so the cache is
+    # only read here and never saved
+    template_spec = TemplateSpec.read(
+        repo_dir,
+        template_name,
+        None if yaml_cache_path is None else YamlCache(yaml_cache_path),
+        revision)
+    for file, (literal_size, copy_sha1) in zip(template_spec.files, scan_infos):
+        file.set_scan_info(literal_size, copy_sha1)
+
+    ctx = TemplateContext(
+        [template_spec.template_dir, repo_dir],
+        template_spec.template_dir,
+        values,
+        bytecode_cache=None if bytecode_cache_dir is None else BytecodeCache(bytecode_cache_dir),
+        warn_missing_entrypoint=False,
+        archive_section=None
+            if template_archive_path is None
+            else read_archive_section(template_archive_path, repo_dir, template_name),
+        revision=revision)
+    _WORKER_STATE = template_spec, ctx, values
+
+def _render_worker(args):
+    index, target_path, relpath, link = args
+    template_spec, ctx, values = _WORKER_STATE
+    file = template_spec.files[index]
+    try:
+        result = file.generate(ctx, values, target_path, relpath, link=link)
+    except Informational:
+        raise
+    except Exception:
+        # Not all Jinja exceptions survive pickling, so ship the worker's
+        # traceback back to the parent process as text
+        raise RuntimeError("Failed to generate {}:\n{}".format(file.source_path, traceback.format_exc()))
+
+    # Spans recorded by the worker travel back with each result
+    tracer = current_tracer()
+    return index, result, None if tracer is None else tracer.take_events()
+
+def _generate_serial(plan, ctx, values, link):
+    return [
+        planned_file.file.generate(ctx, values, planned_file.target_path, planned_file.relpath, link=link)
+        for planned_file in plan.files
+    ]
+
+def _generate_parallel(repo_dir, template_spec, values, plan, jobs, bytecode_cache_dir, yaml_cache_path, template_archive_path, link):
+    files = template_spec.files
+    tasks = [(planned_file.index, planned_file.target_path, planned_file.relpath, link) for planned_file in plan.files]
+    chunk_size = max(1, len(tasks) // (jobs * 4))
+    scan_infos = [(file.literal_size, file.copy_sha1) for file in files]
+    commit = None if template_spec.revision is None else template_spec.revision.commit
+
+    # Workers stream rendered output straight to the target files, so only
+    # small results travel back to this process
+    pool = multiprocessing.Pool(jobs, _init_worker, (repo_dir, template_spec.name, values, bytecode_cache_dir, yaml_cache_path, template_archive_path, commit, scan_infos, current_tracer() is not None))
+    results = {}
+    try:
+        for index, result, events in pool.imap_unordered(_render_worker, tasks, chunk_size):
+            results[index] = result
+            if events is not None:
+                current_tracer().add_events(events)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    return [results[planned_file.index] for planned_file in plan.files]
+
+# Returns a GenerationResult for each file in the template specification,
+# written to the paths in plan, whose directories must already exist
+def generate_files(repo_dir, template_spec, ctx, values, plan, jobs=1, bytecode_cache_dir=None, yaml_cache_path=None, template_archive_path=None, link=False):
+    if jobs > 1 and len(plan.files) > 1:
+        return _generate_parallel(repo_dir, template_spec, values, plan, jobs, bytecode_cache_dir, yaml_cache_path, template_archive_path, link)
+    else:
+        return _generate_serial(plan, ctx, values, link)
@@ -0,0 +1,186 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import contextlib
+import os
+import stat
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+
+from ptool.exceptions import Informational
+from ptool.util import atomic_write, default_dir_mode, default_file_mode, ensure_dir
+
+ARCHIVE_STDOUT = "-"
+
+# Rendered files up to this size are held in memory until they are added to
+# an archive, and larger ones are spooled through a temporary file
+SPOOL_SIZE = 1024 * 1024
+_CHUNK_SIZE = 1024 * 1024
+
+_TAR_COMPRESSIONS = [
+    (".tar.gz", "gz"),
+    (".tgz", "gz"),
+    (".tar.bz2", "bz2"),
+    (".tar", "")
+]
+
+def _copy(source_file, target_file, size):
+    remaining = size
+    while remaining > 0:
+        buf = source_file.read(min(_CHUNK_SIZE, remaining))
+        if len(buf) == 0:
+            raise RuntimeError("File shrank while being added to archive")
+        target_file.write(buf)
+        remaining -= len(buf)
+
+class _TarWriter(object):
+    def __init__(self, f, compression):
+        # Stream mode never seeks, so the archive can be written to a pipe
+        self._tar = tarfile.open(fileobj=f, mode="w|" + compression)
+
+    def add_dir(self, name, mode, mtime):
+        info = self._info(name, mode, mtime)
+        info.type = tarfile.DIRTYPE
+        self._tar.addfile(info)
+
+    def add_file(self, name, mode, mtime, fileobj, size):
+        info = self._info(name, mode, mtime)
+        info.size = size
+        self._tar.addfile(info, fileobj)
+
+    def add_symlink(self, name, link_target, mtime):
+        info = self._info(name, 0o777, mtime)
+        info.type = tarfile.SYMTYPE
+        info.linkname = link_target
+        self._tar.addfile(info)
+
+    def close(self):
+        self._tar.close()
+
+    def _info(self, name, mode, mtime):
+        info = tarfile.TarInfo(name)
+        info.mode = mode
+        info.mtime = mtime
+        return info
+
+class _ZipWriter(object):
+    def __init__(self, f):
+        self._zip = zipfile.ZipFile(f, "w", zipfile.ZIP_DEFLATED, allowZip64=True)
+
+    def add_dir(self, name, mode, mtime):
+        info = self._info(name + "/", stat.S_IFDIR | mode, mtime, zipfile.ZIP_STORED)
+        # MS-DOS directory attribute
+        info.external_attr |= 0x10
+        self._zip.writestr(info, b"")
+
+    def add_file(self, name, mode, mtime, fileobj, size):
+        if size <= SPOOL_SIZE:
+            self._zip.writestr(self._info(name, stat.S_IFREG | mode, mtime, zipfile.ZIP_DEFLATED), fileobj.read(size))
+            return
+
+        # Python 2's zipfile can only stream an entry from a named file, which
+        # also supplies the entry's mode and time
+        with tempfile.NamedTemporaryFile() as temp:
+            _copy(fileobj, temp, size)
+            temp.flush()
+            os.chmod(temp.name, mode)
+            os.utime(temp.name, (mtime, mtime))
+            self._zip.write(temp.name, name)
+
+    def add_symlink(self, name, link_target, mtime):
+        # Info-ZIP stores the link target as the entry's content
+        self._zip.writestr(self._info(name, stat.S_IFLNK | 0o777, mtime, zipfile.ZIP_STORED), link_target)
+
+    def close(self):
+        self._zip.close()
+
+    def _info(self, name, mode, mtime, compress_type):
+        info = zipfile.ZipInfo(name, time.localtime(mtime)[:6])
+        # Unix, so that extractors apply the mode in the high bits
+        info.create_system = 3
+        info.external_attr = mode << 16
+        info.compress_type = compress_type
+        return info
+
+# Returns a function that opens a writer for the archive format of path on
+# a file object, raising an error for unsupported formats
+def archive_writer_factory(path):
+    if path == ARCHIVE_STDOUT:
+        return lambda f: _TarWriter(f, "gz")
+
+    lower = path.lower()
+    if lower.endswith(".zip"):
+        return _ZipWriter
+
+    for suffix, compression in _TAR_COMPRESSIONS:
+        if lower.endswith(suffix):
+            return lambda f, compression=compression: _TarWriter(f, compression)
+
+    raise Informational("Unsupported archive format for \"{}\": use .tar.gz, .tgz, .tar.bz2, .tar or .zip".format(path))
+
+def _encode_name(name):
+    return name.encode("utf-8") if not isinstance(name, str) else name
+
+# A generated project written as archive entries under a single top-level
+# directory instead of to the file system. Executable bits and symbolic links
+# that would otherwise be applied through the Git index of the generated
+# project are stored in the entries themselves. Parent directory entries are
+# added the first time they are needed.
+class ProjectArchive(object):
+    def __init__(self, writer, root_name, executable_paths):
+        self._writer = writer
+        self._root_name = _encode_name(root_name)
+        self._executable_paths = executable_paths
+        self._mtime = int(time.time())
+        self._file_mode = default_file_mode()
+        self._dir_mode = default_dir_mode()
+        self._dirs = set()
+
+    # relpath uses "/" separators and is relative to the project directory
+    def add_file(self, relpath, fileobj, size):
+        mode = self._file_mode | (self._dir_mode & 0o111) \
+            if relpath in self._executable_paths \
+            else self._file_mode
+        self._writer.add_file(self._entry_name(relpath), mode, self._mtime, fileobj, size)
+
+    # Returns a file for output whose size is not yet known, which is held in
+    # memory unless it grows large
+    def spool(self):
+        return tempfile.SpooledTemporaryFile(SPOOL_SIZE)
+
+    def add_symlink(self, relpath, link_target):
+        self._writer.add_symlink(self._entry_name(relpath), _encode_name(link_target), self._mtime)
+
+    def _entry_name(self, relpath):
+        fragments = [self._root_name] + _encode_name(relpath).split("/")
+        for i in range(1, len(fragments)):
+            name = "/".join(fragments[:i])
+            if name not in self._dirs:
+                self._writer.add_dir(name, self._dir_mode, self._mtime)
+                self._dirs.add(name)
+        return "/".join(fragments)
+
+# Opens an archive at path, or a gzipped tar stream on standard output if
+# path is "-", with the format chosen by the file extension. Archive files
+# are written to a temporary file and renamed into place once complete.
+@contextlib.contextmanager
+def open_project_archive(path, root_name, executable_paths):
+    writer_factory = archive_writer_factory(path)
+    if path == ARCHIVE_STDOUT:
+        writer = writer_factory(getattr(sys.stdout, "buffer", sys.stdout))
+        yield ProjectArchive(writer, root_name, executable_paths)
+        writer.close()
+        sys.stdout.flush()
+        return
+
+    ensure_dir(os.path.dirname(os.path.abspath(path)))
+    with atomic_write(os.path.abspath(path)) as f:
+        writer = writer_factory(f)
+        yield ProjectArchive(writer, root_name, executable_paths)
+        writer.close()
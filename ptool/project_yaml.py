@@ -22,25 +22,82 @@ def read_file(obj, template_dir):
     else:
         raise RuntimeError("Unsupported node type {}".format(type(obj)))
 
-def read_command(obj):
+def _read_after(o, default_after):
+    if "after" not in o:
+        return default_after
+    after = o["after"]
+    if after is None:
+        return []
+    if isinstance(after, str):
+        return [after]
+    if isinstance(after, list) and all(isinstance(name, str) for name in after):
+        return after
+    raise RuntimeError("Invalid \"after\" list {}".format(after))
+
+# Commands without an "after" list depend on every command before them, so
+# templates that do not declare dependencies run in the order listed
+def read_command(obj, index=0, default_after=None):
+    if default_after is None:
+        default_after = []
+    default_name = "#{}".format(index + 1)
     if isinstance(obj, dict):
         t = list(obj)
         if len(t) != 1:
             raise RuntimeError("Invalid command {}".format(obj))
         tool_name = t[0]
-        if tool_name == "git-execute-attribute":
-            o = obj["git-execute-attribute"]
+        o = obj[tool_name]
+        if tool_name == "run":
+            if not isinstance(o, dict):
+                o = { "command": o }
+            return SimpleCommandInfo(
+                o["command"],
+                shell=o.get("shell"),
+                timeout=o.get("timeout"),
+                name=o.get("name", default_name),
+                after=_read_after(o, default_after))
+        elif tool_name == "git-execute-attribute":
             path_template = o["path"]
-            return GitExecuteAttributeCommandInfo(path_template)
+            return GitExecuteAttributeCommandInfo(
+                path_template,
+                name=o.get("name", default_name),
+                after=_read_after(o, default_after))
         elif tool_name == "git-symlink":
-            o = obj["git-symlink"]
             source_path_template = o["source-path"]
             target_path_template = o["target-path"]
-            return GitSymlinkCommandInfo(source_path_template, target_path_template)
+            return GitSymlinkCommandInfo(
+                source_path_template,
+                target_path_template,
+                name=o.get("name", default_name),
+                after=_read_after(o, default_after))
         else:
             raise RuntimeError("Unsupported tool \"{}\"".format(tool_name))
     elif isinstance(obj, str):
-        return SimpleCommandInfo(obj)
+        return SimpleCommandInfo(obj, name=default_name, after=default_after)
     else:
         raise RuntimeError("Unsupported command type {}".format(type(obj)))
 
+# Commands in a "parallel" group do not wait for each other
+def read_commands(objs):
+    commands = []
+    for obj in objs:
+        preceding_names = [command.name for command in commands]
+        if isinstance(obj, dict) and list(obj) == ["parallel"]:
+            group = obj["parallel"]
+            if not isinstance(group, list):
+                raise RuntimeError("Invalid parallel group {}".format(group))
+            commands.extend([read_command(o, len(commands) + i, preceding_names) for i, o in enumerate(group)])
+        else:
+            commands.append(read_command(obj, len(commands), preceding_names))
+
+    names = set()
+    for command in commands:
+        if command.name in names:
+            raise RuntimeError("Duplicate command name \"{}\"".format(command.name))
+        names.add(command.name)
+
+    for command in commands:
+        for name in command.after:
+            if name not in names:
+                raise RuntimeError("Command \"{}\" depends on unknown command \"{}\"".format(command.name, name))
+
+    return commands
@@ -0,0 +1,104 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import os
+import stat
+import tempfile
+
+from ptool.manifest import file_sha1, manifest_relpath
+from ptool.util import default_file_mode, ensure_dir
+
+class RegenResult(object):
+    def __init__(self):
+        self._files = {}
+        self._updated = []
+        self._unchanged = []
+        self._conflicts = []
+        self._stale = []
+
+    # Map of output paths to content hashes for the new manifest
+    @property
+    def files(self): return self._files
+
+    @property
+    def updated(self): return self._updated
+
+    @property
+    def unchanged(self): return self._unchanged
+
+    @property
+    def conflicts(self): return self._conflicts
+
+    @property
+    def stale(self): return self._stale
+
+def _is_locally_modified(target_path, old_sha1):
+    if not os.path.isfile(target_path):
+        return False
+    return old_sha1 is None or file_sha1(target_path) != old_sha1
+
+def _replace(temp_path, target_path):
+    if os.path.exists(target_path):
+        os.chmod(temp_path, stat.S_IMODE(os.stat(target_path).st_mode))
+        if os.name == "nt":
+            os.unlink(target_path)
+    else:
+        os.chmod(temp_path, default_file_mode())
+    os.rename(temp_path, target_path)
+
+def _write_temp(file, ctx, values, target_path):
+    ensure_dir(os.path.dirname(target_path))
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target_path), prefix=".ptool-")
+    os.close(fd)
+    try:
+        _, _, sha1 = file.write(ctx, values, temp_path)
+    except:
+        os.unlink(temp_path)
+        raise
+    return temp_path, sha1
+
+# Rerenders every file and rewrites only those whose content changed since the
+# manifest was written, leaving unchanged files and their mtimes untouched
+def regenerate_files(template_spec, ctx, values, output_dir, manifest, force=False):
+    result = RegenResult()
+
+    for file in template_spec.files:
+        target_path = file.target_path(ctx, values, output_dir)
+        relpath = manifest_relpath(output_dir, target_path)
+        old_sha1 = manifest.files.get(relpath)
+
+        # Copied files have known hashes, so only render templates to disk
+        temp_path = None
+        if file.is_copied and file.copy_sha1 is not None:
+            new_sha1 = file.copy_sha1
+        else:
+            temp_path, new_sha1 = _write_temp(file, ctx, values, target_path)
+
+        try:
+            if new_sha1 == old_sha1 and os.path.isfile(target_path):
+                result.files[relpath] = new_sha1
+                result.unchanged.append(relpath)
+                continue
+
+            if not force and _is_locally_modified(target_path, old_sha1):
+                if old_sha1 is not None:
+                    result.files[relpath] = old_sha1
+                result.conflicts.append(relpath)
+                continue
+
+            if temp_path is None:
+                temp_path, new_sha1 = _write_temp(file, ctx, values, target_path)
+            _replace(temp_path, target_path)
+            temp_path = None
+
+            result.files[relpath] = new_sha1
+            result.updated.append(relpath)
+        finally:
+            if temp_path is not None:
+                os.unlink(temp_path)
+
+    result.stale.extend(sorted(set(manifest.files.keys()) - set(result.files.keys())))
+    return result
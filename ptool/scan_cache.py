@@ -0,0 +1,71 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import json
+import os
+
+from ptool.file_lock import file_lock
+from ptool.util import atomic_write
+
+_SCAN_CACHE_VERSION = 3
+
+def file_stat_key(path):
+    st = os.stat(path)
+    return [st.st_mtime, st.st_size]
+
+def _entry_key(source_path, kind):
+    return "{}:{}".format(kind, source_path)
+
+class ScanCache(object):
+    def __init__(self, path):
+        self._path = path
+        self._entries = None
+        self._dirty = False
+
+    @property
+    def path(self): return self._path
+
+    def get(self, source_path, kind):
+        entry = self._load().get(_entry_key(source_path, kind))
+        if entry is None or entry["stat_key"] != file_stat_key(source_path):
+            return None
+        return entry
+
+    def put(self, source_path, kind, entry):
+        entry = dict(entry)
+        entry["stat_key"] = file_stat_key(source_path)
+        self._load()[_entry_key(source_path, kind)] = entry
+        self._dirty = True
+
+    # Merges with entries saved by other processes since this cache was
+    # loaded instead of overwriting them
+    def save(self):
+        if not self._dirty:
+            return
+
+        with file_lock(self._path + ".lock"):
+            entries = self._read_entries()
+            entries.update(self._entries)
+            self._entries = entries
+            with atomic_write(self._path, "wt") as f:
+                json.dump({ "version": _SCAN_CACHE_VERSION, "files": self._entries }, f)
+        self._dirty = False
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = self._read_entries()
+        return self._entries
+
+    def _read_entries(self):
+        if os.path.isfile(self._path):
+            try:
+                with open(self._path, "rt") as f:
+                    obj = json.load(f)
+                if obj.get("version") == _SCAN_CACHE_VERSION:
+                    return obj["files"]
+            except ValueError:
+                pass
+        return {}
@@ -0,0 +1,167 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+# Serves generate, values and templates requests over a Unix socket. Each
+# request is a single line of JSON:
+#
+#     {"id": 1, "method": "generate", "params": {"template": "demo", "output-dir": "/abs/path"}}
+#
+# and is answered by a single line of JSON holding either "result" or
+# "error" together with the request's "id". A connection may send any number
+# of requests, and connections are handled concurrently.
+
+from __future__ import print_function
+import SocketServer
+import errno
+import json
+import os
+import signal
+import socket
+import sys
+import traceback
+
+from ptool.api import ProjectRenderer
+from ptool.catalog import merged_catalog_entries
+from ptool.exceptions import Informational
+from ptool.value_source import ValueSource
+
+def _native(obj):
+    if isinstance(obj, unicode):
+        return obj.encode("utf-8")
+    if isinstance(obj, dict):
+        return { _native(key) : _native(value) for key, value in obj.iteritems() }
+    if isinstance(obj, list):
+        return map(_native, obj)
+    return obj
+
+def _require(params, key):
+    value = params.get(key)
+    if value is None:
+        raise Informational("Missing parameter \"{}\"".format(key))
+    return value
+
+def _do_generate(state, params):
+    output_dir = _require(params, "output-dir")
+    if not os.path.isabs(output_dir):
+        raise Informational("Output directory \"{}\" must be an absolute path".format(output_dir))
+
+    generator, lock = state.generator(_require(params, "template"))
+    with lock:
+        results = generator.generate(
+            output_dir,
+            project_name=params.get("project-name"),
+            key_value_pairs=sorted(params.get("values", {}).iteritems()),
+            force_overwrite=params.get("force", False),
+            link=params.get("link", False))
+
+    return {
+        "output-dir": output_dir,
+        "files": len(results),
+        "bytes": sum(result.size for result in results)
+    }
+
+def _do_values(state, params):
+    generator, _ = state.generator(_require(params, "template"))
+    values = generator.merge_values(
+        ValueSource.project(params.get("project-name", "example-project-name-ABC")),
+        ValueSource.command_line(sorted(params.get("values", {}).iteritems())))
+    return { key : { "value" : value, "source" : source.path } for key, (value, source) in values.iteritems() }
+
+def _do_templates(state, params):
+    config = state.config()
+    return [
+        {
+            "name": entry.name,
+            "description": entry.description,
+            "value-keys": entry.value_keys,
+            "file-count": entry.file_count,
+            "repository": repository.name
+        }
+        for repository, entry in merged_catalog_entries(config.repositories, config.yaml_cache)
+    ]
+
+_METHODS = {
+    "generate": _do_generate,
+    "values": _do_values,
+    "templates": _do_templates
+}
+
+def _handle_request(state, line):
+    request_id = None
+    try:
+        request = _native(json.loads(line))
+        if not isinstance(request, dict):
+            raise Informational("Request must be a JSON object")
+
+        request_id = request.get("id")
+        method = _METHODS.get(request.get("method"))
+        if method is None:
+            raise Informational("Unsupported method \"{}\"".format(request.get("method")))
+
+        params = request.get("params", {})
+        if not isinstance(params, dict):
+            raise Informational("Parameters must be a JSON object")
+
+        result = method(state, params)
+        state.save_caches()
+        return { "id": request_id, "result": result }
+    except Informational as e:
+        return { "id": request_id, "error": str(e) }
+    except ValueError as e:
+        return { "id": request_id, "error": "Invalid request: {}".format(e) }
+    except Exception as e:
+        sys.stderr.write(traceback.format_exc())
+        return { "id": request_id, "error": str(e) }
+
+class _RequestHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        for line in iter(self.rfile.readline, ""):
+            if len(line.strip()) == 0:
+                continue
+            response = _handle_request(self.server.state, line)
+            self.wfile.write(json.dumps(response, default=str) + "\n")
+            self.wfile.flush()
+
+class _Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, state):
+        SocketServer.UnixStreamServer.__init__(self, socket_path, _RequestHandler)
+        self.state = state
+
+# A socket file left behind by a server that did not shut down cleanly is
+# removed, but one that still accepts connections belongs to a live server
+def _remove_stale_socket(socket_path):
+    if not os.path.exists(socket_path):
+        return
+
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(socket_path)
+    except socket.error as e:
+        if e.errno not in (errno.ECONNREFUSED, errno.ENOENT):
+            raise
+        os.unlink(socket_path)
+        return
+    finally:
+        s.close()
+
+    raise Informational("A ptool server is already listening on {}".format(socket_path))
+
+def serve(config, socket_path):
+    _remove_stale_socket(socket_path)
+
+    server = _Server(socket_path, ProjectRenderer(config.config_dir))
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print("Listening on {}".format(socket_path))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
@@ -0,0 +1,185 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import json
+import os
+import tempfile
+import time
+
+from pyprelude.file_system import *
+
+from ptool.file_lock import SharedFileLock, file_lock, try_file_lock
+from ptool.trace import span
+from ptool.util import ensure_dir
+
+_SNAPSHOT_INFO_FILE_NAME = ".ptool-snapshot.json"
+_TEMP_PREFIX = ".tmp-"
+
+# Snapshots of commits other than the repository's current one are removed
+# once they have not been used for this long and nothing is reading them
+_SNAPSHOT_RETENTION = 24 * 60 * 60
+
+# A snapshot directory together with a shared lock on its ".use" file that
+# stops it being pruned until released
+class Snapshot(object):
+    def __init__(self, path, use_lock):
+        self._path = path
+        self._use_lock = use_lock
+
+    @property
+    def path(self): return self._path
+
+    def release(self):
+        self._use_lock.release()
+
+def _git(repo_dir, index_path, *args, **kwargs):
+    from pyprelude.process import execute
+    env = dict(os.environ)
+    env["GIT_INDEX_FILE"] = index_path
+    return execute(["git"] + list(args), cwd=repo_dir, env=env, **kwargs)
+
+def _is_template_yaml(path):
+    fragments = path.split("/")
+    return len(fragments) == 2 and fragments[1] == "_ptool.yaml"
+
+# Immutable copies of a template repository's files, one directory per
+# commit. Directories are never changed once they are visible: each is built
+# in a temporary directory and renamed into place while holding a lock for
+# that commit. Reading a template that is already in the store therefore
+# needs no lock at all, and a concurrent "ptool update" cannot change files
+# that a running generation is reading.
+#
+# Only the files outside template directories, such as shared includes, are
+# copied when a commit's snapshot is created. Each template is added the
+# first time it is used.
+#
+# Each use of a snapshot touches its directory and holds a shared lock on
+# "<commit>.use" for as long as the snapshot is read. Pruning removes a
+# snapshot only if its directory has not been touched for a day and it can
+# take that lock exclusively.
+class SnapshotStore(object):
+    def __init__(self, repo_dir, store_dir):
+        self._repo_dir = repo_dir
+        self._store_dir = store_dir
+
+    @property
+    def store_dir(self): return self._store_dir
+
+    # Returns a Snapshot for commit containing the template, or None if
+    # there is no such template at that commit
+    def snapshot(self, commit, template_name):
+        snapshot_dir = make_path(self._store_dir, commit)
+        use_lock = SharedFileLock(snapshot_dir + ".use")
+        if not self._ensure_template(commit, snapshot_dir, template_name):
+            use_lock.release()
+            return None
+
+        os.utime(snapshot_dir, None)
+        return Snapshot(snapshot_dir, use_lock)
+
+    def _ensure_template(self, commit, snapshot_dir, template_name):
+        template_names = self._read_template_names(snapshot_dir)
+        if template_names is not None:
+            if template_name not in template_names:
+                return False
+            if os.path.isdir(make_path(snapshot_dir, template_name)):
+                return True
+
+        with file_lock(snapshot_dir + ".lock"), span("Create snapshot", commit=commit, template=template_name):
+            template_names = self._read_template_names(snapshot_dir)
+            if template_names is None:
+                template_names = self._create(commit, snapshot_dir)
+
+            if template_name not in template_names:
+                return False
+
+            if not os.path.isdir(make_path(snapshot_dir, template_name)):
+                self._add_template(commit, snapshot_dir, template_name)
+
+        return True
+
+    # Removes the snapshots of commits other than keep_commit that have not
+    # been used for a day and are not in use, and any temporary directories
+    # left by processes that died while creating a snapshot
+    def prune(self, keep_commit):
+        if not os.path.isdir(self._store_dir):
+            return
+
+        cutoff = time.time() - _SNAPSHOT_RETENTION
+        for name in os.listdir(self._store_dir):
+            path = make_path(self._store_dir, name)
+            if name == keep_commit or not os.path.isdir(path) or os.path.getmtime(path) > cutoff:
+                continue
+
+            if name.startswith(_TEMP_PREFIX):
+                remove_dir(path)
+                continue
+
+            # The lock files are left in place: a reader waiting on a removed
+            # ".use" file would hold a lock that a later prune cannot see
+            with file_lock(path + ".lock"), try_file_lock(path + ".use") as unused:
+                if unused and os.path.getmtime(path) <= cutoff:
+                    remove_dir(path)
+
+    def _read_template_names(self, snapshot_dir):
+        try:
+            with open(make_path(snapshot_dir, _SNAPSHOT_INFO_FILE_NAME), "rt") as f:
+                return set(json.load(f)["templates"])
+        except (IOError, OSError):
+            return None
+
+    # Lists the files at commit using a private index so that the
+    # repository's own index and working tree are never touched
+    def _list_files(self, commit, index_path):
+        _git(self._repo_dir, index_path, "read-tree", commit)
+        output = _git(self._repo_dir, index_path, "ls-files", "-z")
+        return [path for path in output.split("\0") if len(path) > 0]
+
+    def _check_out(self, index_path, target_dir, paths):
+        if len(paths) > 0:
+            _git(
+                self._repo_dir,
+                index_path,
+                "checkout-index", "-z", "--stdin", "--prefix={}/".format(target_dir),
+                stdin="".join(path + "\0" for path in paths))
+
+    def _create(self, commit, snapshot_dir):
+        ensure_dir(self._store_dir)
+        temp_dir = tempfile.mkdtemp(dir=self._store_dir, prefix=_TEMP_PREFIX)
+        try:
+            index_path = make_path(temp_dir, "index")
+            tree_dir = make_path(temp_dir, "tree")
+            paths = self._list_files(commit, index_path)
+            template_names = sorted(path.split("/")[0] for path in paths if _is_template_yaml(path))
+
+            os.mkdir(tree_dir)
+            self._check_out(index_path, tree_dir, [
+                path
+                for path in paths
+                if path.split("/")[0] not in template_names
+            ])
+            with open(make_path(tree_dir, _SNAPSHOT_INFO_FILE_NAME), "wt") as f:
+                json.dump({ "commit": commit, "templates": template_names }, f)
+
+            os.rename(tree_dir, snapshot_dir)
+        finally:
+            remove_dir(temp_dir)
+
+        return set(template_names)
+
+    def _add_template(self, commit, snapshot_dir, template_name):
+        temp_dir = tempfile.mkdtemp(dir=self._store_dir, prefix=_TEMP_PREFIX)
+        try:
+            index_path = make_path(temp_dir, "index")
+            paths = self._list_files(commit, index_path)
+            self._check_out(index_path, temp_dir, [
+                path
+                for path in paths
+                if path.split("/")[0] == template_name
+            ])
+            os.rename(make_path(temp_dir, template_name), make_path(snapshot_dir, template_name))
+        finally:
+            remove_dir(temp_dir)
@@ -0,0 +1,200 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import hashlib
+import jinja2
+import marshal
+import os
+import sys
+
+from ptool.catalog import TemplateCatalog
+from ptool.git_util import read_head_commit
+from ptool.key_scanner import resolve_include
+from ptool.template_spec import TemplateSpec, template_yaml_path
+from ptool.template_util import TemplateContext, template_source_tokens
+from ptool.util import atomic_write, ensure_dir
+
+_ARCHIVE_VERSION = 1
+
+def _stat_key(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime, st.st_size
+
+def _string_key(s):
+    return "string:" + hashlib.sha1(unicode(s).encode("utf-8")).hexdigest()
+
+def _file_key(repo_dir, path):
+    return "file:" + os.path.relpath(path, repo_dir).replace(os.sep, "/")
+
+def _name_key(name):
+    return "name:" + name
+
+# The compiled code of every template, include and string template used by
+# one template specification. Entries compiled from files record the size and
+# modification time of their source so that edits made since the archive was
+# built are picked up from the file system instead.
+class TemplateArchiveSection(object):
+    def __init__(self, repo_dir, entries):
+        self._repo_dir = repo_dir
+        self._entries = entries
+
+    def string_code(self, s):
+        entry = self._entries.get(_string_key(s))
+        return None if entry is None else entry[2]
+
+    def file_code(self, path):
+        return self._file_entry_code(_file_key(self._repo_dir, path))
+
+    def name_code(self, name):
+        return self._file_entry_code(_name_key(name))
+
+    def _file_entry_code(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        relpath, stat_key, code = entry
+        path = os.path.join(self._repo_dir, *relpath.split("/"))
+        return code if _stat_key(path) == stat_key else None
+
+# Serves includes from an archive section, so that Jinja neither searches the
+# loader directories nor parses their source
+class ArchiveLoader(jinja2.BaseLoader):
+    def __init__(self, section):
+        self._section = section
+
+    def load(self, environment, name, globals=None):
+        code = self._section.name_code(name)
+        if code is None:
+            raise jinja2.TemplateNotFound(name)
+        return environment.template_class.from_code(environment, code, environment.make_globals(globals), None)
+
+# Precompiled templates for every template specification in a repository at
+# one commit. Sections are decoded only when a template is used.
+class TemplateArchive(object):
+    @staticmethod
+    def try_read(path, repo_dir):
+        try:
+            with open(path, "rb") as f:
+                obj = marshal.load(f)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return None
+
+        if obj.get("version") != _ARCHIVE_VERSION or \
+            obj.get("python") != sys.version or \
+            obj.get("jinja2") != jinja2.__version__ or \
+            obj.get("commit") != read_head_commit(repo_dir):
+            return None
+
+        return TemplateArchive(repo_dir, obj["commit"], obj["templates"])
+
+    def __init__(self, repo_dir, commit, templates):
+        self._repo_dir = repo_dir
+        self._commit = commit
+        self._templates = templates
+
+    @property
+    def commit(self): return self._commit
+
+    @property
+    def template_names(self): return sorted(self._templates.keys())
+
+    def section(self, template_name):
+        data = self._templates.get(template_name)
+        return None if data is None else TemplateArchiveSection(self._repo_dir, marshal.loads(data))
+
+# Returns the archive section for a template, or None if there is no archive
+# or it was built for a different commit
+def read_archive_section(path, repo_dir, template_name):
+    archive = TemplateArchive.try_read(path, repo_dir)
+    return None if archive is None else archive.section(template_name)
+
+def _read_source(path):
+    with open(path, "rt") as f:
+        return unicode(f.read())
+
+# Compiles the files, includes, output paths and commands of one template
+# specification using a context with the template's extensions registered
+def compile_template_spec(repo_dir, template_spec, ctx):
+    loader_dirs = [template_spec.template_dir, repo_dir]
+    entries = {}
+
+    def add_file(key, path, code):
+        relpath = os.path.relpath(path, repo_dir).replace(os.sep, "/")
+        entries[key] = relpath, _stat_key(path), code
+
+    pending = []
+    for file in template_spec.files:
+        entries[_string_key(file.output_path_template)] = None, None, ctx.compile(file.output_path_template)
+        if file.is_template:
+            source = _read_source(file.source_path)
+            add_file(_file_key(repo_dir, file.source_path), file.source_path, ctx.compile(source, None, file.source_path))
+            pending.extend(template_source_tokens(source, file.source_path)[1])
+
+    for command in template_spec.commands:
+        for s in command.templates:
+            entries[_string_key(s)] = None, None, ctx.compile(s)
+
+    seen = set()
+    while len(pending) > 0:
+        name = pending.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+
+        path = resolve_include(name, loader_dirs)
+        if path is None:
+            continue
+
+        source = _read_source(path)
+        add_file(_name_key(name), path, ctx.compile(source, name, path))
+        pending.extend(template_source_tokens(source, path)[1])
+
+    return marshal.dumps(entries)
+
+def write_template_archive(path, repo_dir, commit, templates):
+    ensure_dir(os.path.dirname(path))
+    with atomic_write(path) as f:
+        marshal.dump({
+            "version": _ARCHIVE_VERSION,
+            "python": sys.version,
+            "jinja2": jinja2.__version__,
+            "commit": commit,
+            "templates": templates
+        }, f)
+
+# Compiles every template in a repository into a single archive and returns
+# the names of the templates compiled together with the errors for those that
+# could not be
+def compile_template_repo(repository, yaml_cache=None):
+    repo_dir = repository.repo_dir
+    commit = read_head_commit(repo_dir)
+    if repo_dir not in sys.path:
+        sys.path.append(repo_dir)
+
+    templates = {}
+    errors = {}
+    for entry in TemplateCatalog(repo_dir, repository.catalog_path, yaml_cache).entries():
+        # Templates outside a sparse checkout are compiled once checked out
+        if not os.path.isfile(template_yaml_path(repo_dir, entry.name)):
+            continue
+
+        try:
+            template_spec = TemplateSpec.read(repo_dir, entry.name, yaml_cache)
+            ctx = TemplateContext(
+                [template_spec.template_dir, repo_dir],
+                template_spec.template_dir,
+                {},
+                warn_missing_entrypoint=False)
+            templates[entry.name] = compile_template_spec(repo_dir, template_spec, ctx)
+        except Exception as e:
+            errors[entry.name] = str(e)
+
+    write_template_archive(repository.template_archive_path, repo_dir, commit, templates)
+    return sorted(templates.keys()), errors
@@ -0,0 +1,340 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import os
+import re
+import tempfile
+import time
+
+from pyprelude.file_system import *
+
+from ptool.commands import CommandProcess
+from ptool.exceptions import Informational
+from ptool.file_lock import file_lock
+from ptool.git_objects import read_git_revision
+from ptool.git_util import is_shallow_repo, is_sparse_checkout
+from ptool.snapshot_store import SnapshotStore
+from ptool.template_spec import template_yaml_path
+from ptool.util import ensure_dir
+
+CLONE_FULL = "full"
+CLONE_SHALLOW = "shallow"
+CLONE_PARTIAL = "partial"
+
+_CLONE_ARGS = {
+    CLONE_FULL: [],
+    # Only the latest commit
+    CLONE_SHALLOW: ["--depth", "1"],
+    # Full history, but file contents are fetched only when checked out
+    CLONE_PARTIAL: ["--filter=blob:none"]
+}
+
+_NAME_PATTERN = re.compile("^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+
+# How a template repository is cloned and updated, from an entry in the
+# "template-repositories" list or the "template-repository" section of
+# config.yaml
+class RepositorySettings(object):
+    @staticmethod
+    def from_obj(obj, default_name=None, default_url=None):
+        if obj is None:
+            obj = {}
+        if not isinstance(obj, dict):
+            raise Informational("Template repository settings must be a dictionary")
+
+        name = obj.get("name", default_name)
+        if name is None or not _NAME_PATTERN.match(str(name)):
+            raise Informational("Template repository name \"{}\" must consist of letters, digits, \".\", \"_\" and \"-\"".format(name))
+
+        url = obj.get("url", default_url)
+        if url is None:
+            raise Informational("Template repository \"{}\" has no URL".format(name))
+
+        clone = obj.get("clone", CLONE_FULL)
+        if clone not in _CLONE_ARGS:
+            raise Informational("Unsupported clone type \"{}\": must be one of {}".format(
+                clone,
+                ", ".join(sorted(_CLONE_ARGS.keys()))))
+
+        timeout = obj.get("timeout")
+        if timeout is not None and (not isinstance(timeout, (int, float)) or timeout <= 0):
+            raise Informational("Timeout for template repository \"{}\" must be a positive number of seconds".format(name))
+
+        return RepositorySettings(
+            str(name),
+            url,
+            clone,
+            bool(obj.get("sparse", False)),
+            timeout,
+            bool(obj.get("snapshots", False)))
+
+    def __init__(self, name, url, clone, sparse, timeout, snapshots):
+        self._name = name
+        self._url = url
+        self._clone = clone
+        self._sparse = sparse
+        self._timeout = timeout
+        self._snapshots = snapshots
+
+    @property
+    def name(self): return self._name
+
+    # A URL or the path of a local, possibly bare, repository
+    @property
+    def url(self): return self._url
+
+    @property
+    def clone(self): return self._clone
+
+    # Check out only the templates that have been used on this machine
+    @property
+    def sparse(self): return self._sparse
+
+    # Seconds allowed for updating the repository, or None
+    @property
+    def timeout(self): return self._timeout
+
+    # Read templates from immutable per-commit snapshots instead of the
+    # working tree
+    @property
+    def snapshots(self): return self._snapshots
+
+# A local clone of a template repository, together with the caches and
+# snapshots that belong to it. The clone is made when the repository is first
+# needed. Cloning, updating and changing the sparse checkout hold the
+# repository's lock.
+class TemplateRepository(object):
+    def __init__(self, settings, repo_dir, cache_dir, snapshot_dir, lock_path):
+        self._settings = settings
+        self._repo_dir = repo_dir
+        self._cache_dir = cache_dir
+        self._snapshot_dir = snapshot_dir
+        self._lock_path = lock_path
+        self._repo_checked = False
+
+    @property
+    def name(self): return self._settings.name
+
+    @property
+    def settings(self): return self._settings
+
+    @property
+    def is_cloned(self): return os.path.isdir(self._repo_dir)
+
+    @property
+    def repo_dir(self):
+        if not self._repo_checked:
+            if not self.is_cloned:
+                with file_lock(self._lock_path):
+                    if not self.is_cloned:
+                        clone_template_repo(self._settings, self._repo_dir)
+            self._repo_checked = True
+        return self._repo_dir
+
+    @property
+    def lock_path(self): return self._lock_path
+
+    @property
+    def snapshot_store(self): return SnapshotStore(self.repo_dir, self._snapshot_dir)
+
+    # Where the repository is or will be cloned, without cloning it
+    @property
+    def clone_dir(self): return self._repo_dir
+
+    @property
+    def catalog_path(self): return make_path(self._cache_dir, "catalog.json")
+
+    @property
+    def template_archive_path(self): return make_path(self._cache_dir, "templates.archive")
+
+class UpdateResult(object):
+    def __init__(self, repository, old_commit, new_commit, objects_fetched, bytes_fetched, elapsed, error=None):
+        self._repository = repository
+        self._old_commit = old_commit
+        self._new_commit = new_commit
+        self._objects_fetched = objects_fetched
+        self._bytes_fetched = bytes_fetched
+        self._elapsed = elapsed
+        self._error = error
+
+    @property
+    def repository(self): return self._repository
+
+    # None if the repository was cloned by this update
+    @property
+    def old_commit(self): return self._old_commit
+
+    @property
+    def new_commit(self): return self._new_commit
+
+    @property
+    def is_changed(self): return self._error is None and self._old_commit != self._new_commit
+
+    @property
+    def objects_fetched(self): return self._objects_fetched
+
+    @property
+    def bytes_fetched(self): return self._bytes_fetched
+
+    @property
+    def elapsed(self): return self._elapsed
+
+    # Message describing why the update failed, or None
+    @property
+    def error(self): return self._error
+
+# Runs Git with whatever remains of the time allowed by deadline
+def _git(cwd, deadline, *args):
+    timeout = None if deadline is None else max(0, deadline - time.time())
+    result = CommandProcess(["git"] + list(args), False, timeout).run(cwd)
+    if result.timed_out:
+        raise RuntimeError("Timed out running \"git {}\"".format(args[0]))
+    if result.returncode != 0:
+        raise RuntimeError("Command \"git {}\" failed with status {}: {}".format(
+            " ".join(args),
+            result.returncode,
+            result.output.strip()))
+    return result.output
+
+# Directories at HEAD that are not templates, such as shared includes, which
+# a sparse checkout must always contain
+def _shared_dirs(repo_dir):
+    revision = read_git_revision(repo_dir, "HEAD")
+    return [
+        name
+        for name in revision.listdir(repo_dir)
+        if revision.isdir(os.path.join(repo_dir, name)) and not revision.isfile(template_yaml_path(repo_dir, name))
+    ]
+
+def _add_sparse_dirs(repo_dir, names, deadline=None):
+    if len(names) > 0:
+        _git(repo_dir, deadline, "sparse-checkout", "add", "--", *names)
+
+# Clones into a temporary directory that is renamed into place once
+# complete, so that other processes never see a partial clone
+def clone_template_repo(settings, repo_dir, deadline=None):
+    parent_dir = os.path.dirname(repo_dir)
+    ensure_dir(parent_dir)
+    temp_dir = tempfile.mkdtemp(dir=parent_dir, prefix=".clone-")
+    try:
+        temp_repo_dir = make_path(temp_dir, "repo")
+        _git(temp_dir, deadline, *(
+            ["clone", "-q"] +
+            _CLONE_ARGS[settings.clone] +
+            (["--sparse"] if settings.sparse else []) +
+            [settings.url, temp_repo_dir]))
+
+        if settings.sparse:
+            _add_sparse_dirs(temp_repo_dir, _shared_dirs(temp_repo_dir), deadline)
+
+        os.rename(temp_repo_dir, repo_dir)
+    finally:
+        remove_dir(temp_dir)
+
+# Adds a template to a sparse checkout the first time it is used, returning
+# True if the template was checked out
+def check_out_template(repository, template_name):
+    repo_dir = repository.repo_dir
+    if not is_sparse_checkout(repo_dir):
+        return False
+
+    with file_lock(repository.lock_path):
+        revision = read_git_revision(repo_dir, "HEAD")
+        if not revision.isfile(template_yaml_path(repo_dir, template_name)):
+            return False
+
+        if not os.path.isdir(make_path(repo_dir, template_name)):
+            _add_sparse_dirs(repo_dir, [template_name])
+    return True
+
+# Returns the number of objects and bytes in the object database
+def _count_objects(repo_dir, deadline):
+    counts = {}
+    for line in _git(repo_dir, deadline, "count-objects", "-v").splitlines():
+        key, value = line.split(":", 1)
+        counts[key.strip()] = value.strip()
+
+    objects = int(counts.get("count", 0)) + int(counts.get("in-pack", 0))
+    size_kb = int(counts.get("size", 0)) + int(counts.get("size-pack", 0))
+    return objects, size_kb * 1024
+
+def _head_commit(repo_dir, deadline):
+    return _git(repo_dir, deadline, "rev-parse", "HEAD").strip()
+
+# Fetches and checks out the latest commit of the upstream branch, cloning
+# the repository if there is no clone yet. A shallow clone stays shallow, and
+# a partial clone fetches only the contents of the files that are checked
+# out. Objects and bytes fetched are measured as the growth of the object
+# database.
+def update_template_repo(repository, timeout=None):
+    start = time.time()
+    deadline = None if timeout is None else start + timeout
+    with file_lock(repository.lock_path, deadline):
+        result = _update_locked(repository, start, deadline)
+
+    # Running generations keep reading from the snapshot they started with
+    if result.is_changed and repository.settings.snapshots:
+        repository.snapshot_store.prune(result.new_commit)
+
+    return result
+
+def _update_locked(repository, start, deadline):
+    repo_dir = repository.clone_dir if repository.is_cloned else None
+
+    if repo_dir is None:
+        repo_dir = repository.clone_dir
+        clone_template_repo(repository.settings, repo_dir, deadline)
+        objects, size = _count_objects(repo_dir, deadline)
+        return UpdateResult(repository, None, _head_commit(repo_dir, deadline), objects, size, time.time() - start)
+
+    objects_before, bytes_before = _count_objects(repo_dir, deadline)
+    old_commit = _head_commit(repo_dir, deadline)
+
+    # Only fetching is limited by the deadline. Killing Git while it updates
+    # the index or working tree would leave index.lock or a rebase in
+    # progress behind, breaking every later update.
+    if is_shallow_repo(repo_dir):
+        # Rebasing needs history that a shallow clone does not have
+        _git(repo_dir, deadline, "fetch", "-q", "--depth", "1")
+        _git(repo_dir, None, "reset", "-q", "--keep", "@{upstream}")
+    else:
+        _git(repo_dir, deadline, "fetch", "-q")
+        _git(repo_dir, None, "rebase", "-q", "@{upstream}")
+
+    new_commit = _head_commit(repo_dir, deadline)
+    if new_commit != old_commit and is_sparse_checkout(repo_dir):
+        _add_sparse_dirs(repo_dir, _shared_dirs(repo_dir))
+
+    objects_after, bytes_after = _count_objects(repo_dir, deadline)
+    return UpdateResult(
+        repository,
+        old_commit,
+        new_commit,
+        max(0, objects_after - objects_before),
+        max(0, bytes_after - bytes_before),
+        time.time() - start)
+
+# Updates repositories concurrently on at most jobs threads. Each repository
+# is allowed its own timeout, or default_timeout if it has none. Failures are
+# reported in the results rather than raised, so that one unreachable
+# repository does not prevent the others from being updated.
+def update_template_repos(repositories, jobs, default_timeout=None):
+    from multiprocessing.pool import ThreadPool
+
+    def update(repository):
+        timeout = repository.settings.timeout or default_timeout
+        start = time.time()
+        try:
+            return update_template_repo(repository, timeout)
+        except Exception as e:
+            return UpdateResult(repository, None, None, 0, 0, time.time() - start, str(e))
+
+    pool = ThreadPool(max(1, min(jobs, len(repositories))))
+    try:
+        return pool.map(update, repositories)
+    finally:
+        pool.close()
+        pool.join()
@@ -8,36 +8,49 @@ import os
 
 from pyprelude.file_system import *
 
-from ptool.project_yaml import read_command, read_file
-from ptool.util import read_yaml_file
+from ptool.exceptions import Informational
+from ptool.project_yaml import read_commands, read_file
+from ptool.util import parse_yaml
 from ptool.value_source import ValueSource
+from ptool.yaml_cache import read_yaml_file_cached
 
 _PTOOL_YAML_FILE_NAME = "_ptool.yaml"
 
+def template_yaml_path(repo_dir, template_name):
+    return make_path(repo_dir, template_name, _PTOOL_YAML_FILE_NAME)
+
 class TemplateSpec(object):
     @staticmethod
-    def read(repo_dir, template_name):
-        template_spec = TemplateSpec.try_read(repo_dir, template_name)
+    def read(repo_dir, template_name, yaml_cache=None, revision=None, commit=None):
+        template_spec = TemplateSpec.try_read(repo_dir, template_name, yaml_cache, revision, commit)
         if template_spec is not None:
             return template_spec
 
         raise RuntimeError("No template \"{}\" directory found under {}".format(template_name, repo_dir))
 
     @staticmethod
-    def try_read(repo_dir, template_name):
+    def try_read(repo_dir, template_name, yaml_cache=None, revision=None, commit=None):
         template_dir = make_path(repo_dir, template_name)
-        template_yaml_path = make_path(template_dir, _PTOOL_YAML_FILE_NAME)
+        path = template_yaml_path(repo_dir, template_name)
+
+        if revision is not None:
+            if not revision.isfile(path):
+                return
+            obj = parse_yaml(revision.read(path), path)
+            return TemplateSpec(path, template_dir, obj, revision)
 
-        if not os.path.isfile(template_yaml_path):
+        if not os.path.isfile(path):
             return
 
-        obj = read_yaml_file(template_yaml_path)
-        return TemplateSpec(template_yaml_path, template_dir, obj)
+        obj = read_yaml_file_cached(path, yaml_cache)
+        return TemplateSpec(path, template_dir, obj, commit=commit)
 
-    def __init__(self, path, template_dir, obj):
+    def __init__(self, path, template_dir, obj, revision=None, commit=None):
         self._path = path
         self._template_dir = template_dir
         self._obj = obj
+        self._revision = revision
+        self._commit = revision.commit if revision is not None else commit
 
         self._name = os.path.basename(self._template_dir)
         self._description = self._obj.get("description", "(no description)")
@@ -46,6 +59,10 @@ class TemplateSpec(object):
         self._globals = None
         self._files = None
         self._commands = None
+        self._snapshot = None
+
+    @property
+    def repo_dir(self): return os.path.dirname(self._template_dir)
 
     @property
     def template_dir(self): return self._template_dir
@@ -53,6 +70,21 @@ class TemplateSpec(object):
     @property
     def name(self): return self._name
 
+    # The Git revision the template was read from, or None for the working
+    # tree
+    @property
+    def revision(self): return self._revision
+
+    # The commit the template was read from if it was read from Git objects
+    # or a snapshot, otherwise None
+    @property
+    def commit(self): return self._commit
+
+    # Keeps the snapshot the template was read from in use, so that it is not
+    # pruned, for as long as this specification exists
+    def hold_snapshot(self, snapshot):
+        self._snapshot = snapshot
+
     @property
     def description(self): return self._description
 
@@ -72,5 +104,58 @@ class TemplateSpec(object):
     @property
     def commands(self):
         if self._commands is None:
-            self._commands = map(lambda o: read_command(o), self._obj.get("commands", []))
+            self._commands = read_commands(self._obj.get("commands", []))
         return self._commands
+
+def _try_read_from_repository(repository, template_name, yaml_cache, rev):
+    repo_dir = repository.repo_dir
+    if rev is not None:
+        from ptool.git_objects import read_git_revision
+        try:
+            revision = read_git_revision(repo_dir, rev)
+        except Informational:
+            return None
+        return TemplateSpec.try_read(repo_dir, template_name, revision=revision)
+
+    # Snapshots are immutable, so a concurrent update cannot change the
+    # templates while they are being read
+    if repository.settings.snapshots:
+        from ptool.git_util import read_head_commit
+        commit = read_head_commit(repo_dir)
+        snapshot = repository.snapshot_store.snapshot(commit, template_name)
+        if snapshot is None:
+            return None
+
+        template_spec = TemplateSpec.try_read(snapshot.path, template_name, yaml_cache, commit=commit)
+        if template_spec is None:
+            snapshot.release()
+        else:
+            template_spec.hold_snapshot(snapshot)
+        return template_spec
+
+    template_spec = TemplateSpec.try_read(repo_dir, template_name, yaml_cache)
+
+    # A sparse checkout grows to include each template when it is first used
+    if template_spec is None:
+        from ptool.template_repo import check_out_template
+        if check_out_template(repository, template_name):
+            template_spec = TemplateSpec.try_read(repo_dir, template_name, yaml_cache)
+
+    return template_spec
+
+# Returns the first repository, in priority order, containing the template
+# together with its specification. With rev, templates are read from the Git
+# objects of that commit instead of the working tree.
+def find_template(config, template_name, rev=None):
+    for repository in config.repositories:
+        template_spec = _try_read_from_repository(repository, template_name, config.yaml_cache, rev)
+        if template_spec is not None:
+            return repository, template_spec
+
+    raise Informational("No template \"{}\" found in {}{}".format(
+        template_name,
+        ", ".join(repository.repo_dir for repository in config.repositories),
+        "" if rev is None else " at revision {}".format(rev)))
+
+def read_template_spec(config, template_name, rev=None):
+    return find_template(config, template_name, rev)[1]
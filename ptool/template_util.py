@@ -5,72 +5,82 @@
 # -----------------------------------------------------------------------------
 
 from __future__ import print_function
+import hashlib
 import imp
-import inflection
 import jinja2
+import jinja2.meta
 import string
 import sys
 
 from pyprelude.file_system import *
 
+from ptool.filters import clear_filter_caches, filter_registry
 from ptool.lang_util import TokenList
+from ptool.trace import span
 
 _EXTENSION_FILE_NAME = "_ptool.py"
 _REGISTER_ENTRYPOINT_NAME = "ptool_register"
 
-def load_template_module(template_dir, module_name=None):
+def _load_module_from_revision(module_name, path, revision):
+    module = imp.new_module(module_name)
+    module.__file__ = path
+    sys.modules[module_name] = module
+    exec(compile(revision.read(path), path, "exec"), module.__dict__)
+    return module
+
+def load_template_module(template_dir, module_name=None, revision=None):
     template_module_path = make_path(template_dir, _EXTENSION_FILE_NAME)
 
     module_name = os.path.basename(template_dir) \
         if module_name is None \
         else module_name
 
+    if revision is not None:
+        return _load_module_from_revision(module_name, template_module_path, revision) \
+            if revision.isfile(template_module_path) \
+            else None
+
     return imp.load_source(module_name, template_module_path) \
         if os.path.isfile(template_module_path) \
         else None
 
-def register_template_module(ctx, template_dir):
-    module = load_template_module(template_dir)
-    if module is None:
-        return False
-
-    func = getattr(module, _REGISTER_ENTRYPOINT_NAME, None)
-    if func is None:
-        return False
-
-    func(ctx)
-    return True
-
-def _public_callable_attrs(cls):
-    for f in dir(cls):
-        attr = getattr(cls, f)
-        if not f.startswith("_") and callable(attr):
-            yield attr
-
-def _git_clone_url_filter(project_name, git_server):
-    protocol = git_server["protocol"]
-    if protocol == "https":
-        host = git_server["host"]
-        group = git_server["group"]
-        return "{}://{}/{}/{}.git".format(protocol, host, group, project_name)
-    else:
-        raise RuntimeError("Unsupported Git protocol {}".format(protocol))
-
-def _git_url_filter(project_name, git_server):
-    protocol = git_server["protocol"]
-    if protocol == "https":
-        host = git_server["host"]
-        group = git_server["group"]
-        return "{}://{}/{}/{}".format(protocol, host, group, project_name)
-    else:
-        raise RuntimeError("Unsupported Git protocol {}".format(protocol))
-
-def _git_group_filter(git_server):
-    return git_server["group"]
-
-def _make_template(env, s):
+def register_template_module(ctx, template_dir, revision=None):
+    with span("Register template module", template_dir=template_dir):
+        module = load_template_module(template_dir, revision=revision)
+        if module is None:
+            return False
+
+        func = getattr(module, _REGISTER_ENTRYPOINT_NAME, None)
+        if func is None:
+            return False
+
+        func(ctx)
+        clear_filter_caches()
+        return True
+
+def _compile_template(env, s, name):
+    if env.bytecode_cache is None:
+        with span("Compile template", "compile", template=name, cached=False):
+            return env.from_string(s)
+
+    # Templates compiled from strings have no name, so key them by content
+    if name is None:
+        name = "<string:{}>".format(hashlib.sha1(s.encode("utf-8")).hexdigest())
+
+    with span("Compile template", "compile", template=name) as sp:
+        bucket = env.bytecode_cache.get_bucket(env, name, None, s)
+        code = bucket.code
+        sp.set("cached", code is not None)
+        if code is None:
+            code = env.compile(s)
+            bucket.code = code
+            env.bytecode_cache.set_bucket(bucket)
+
+        return env.template_class.from_code(env, code, env.make_globals(None), None)
+
+def _make_template(env, s, name=None):
     try:
-        return env.from_string(unicode(s))
+        return _compile_template(env, unicode(s), name)
     except jinja2.exceptions.TemplateSyntaxError as e:
         sys.stderr.write("Syntax error \"{}\" in {} at line {}:\n".format(
             e.message,
@@ -88,31 +98,53 @@ class _Template(object):
     def render(self, globals):
         return self._template.render(globals)
 
+    def generate(self, globals):
+        return self._template.generate(globals)
+
+# Loads includes from a Git revision, searching directories in the same order
+# as FileSystemLoader
+class _RevisionLoader(jinja2.BaseLoader):
+    def __init__(self, loader_dirs, revision):
+        self._loader_dirs = loader_dirs
+        self._revision = revision
+
+    def get_source(self, environment, template):
+        for loader_dir in self._loader_dirs:
+            path = os.path.join(loader_dir, *template.split("/"))
+            if self._revision.isfile(path):
+                return self._revision.read(path).decode("utf-8"), path, lambda: True
+        raise jinja2.TemplateNotFound(template)
+
 def _make_filter(ctx, body):
     b = eval(body)
     return lambda *args, **kwargs: b(ctx, *args, **kwargs)
 
 class TemplateContext(object):
-    def __init__(self, loader_dirs, template_dir, globals):
-        self._env = jinja2.Environment(
-            loader=jinja2.FileSystemLoader(loader_dirs),
-            undefined=jinja2.StrictUndefined)
+    def __init__(self, loader_dirs, template_dir, globals, bytecode_cache=None, warn_missing_entrypoint=True, archive_section=None, revision=None):
+        loader = jinja2.FileSystemLoader(loader_dirs) \
+            if revision is None \
+            else _RevisionLoader(loader_dirs, revision)
+        if archive_section is not None:
+            from ptool.template_archive import ArchiveLoader
+            loader = jinja2.ChoiceLoader([ArchiveLoader(archive_section), loader])
 
-        self._env.filters["git_clone_url"] = _git_clone_url_filter
-        self._env.filters["git_url"] = _git_url_filter
-        self._env.filters["git_group"] = _git_group_filter
+        self._env = jinja2.Environment(
+            loader=loader,
+            undefined=jinja2.StrictUndefined,
+            bytecode_cache=bytecode_cache)
+        self._archive_section = archive_section
+        self._revision = revision
 
-        for f in _public_callable_attrs(inflection):
-            self._env.filters[f.__name__] = f
+        self._env.filters.update(filter_registry())
 
         self._globals = globals
         self._templates_from_strings = {}
         self._templates_from_files = {}
         self._token_lists = {}
-        if not register_template_module(self, template_dir):
+        if not register_template_module(self, template_dir, revision) and warn_missing_entrypoint:
             print("WARNING: Template in directory {} has no ptool entrypoint {}".format(
                 template_dir,
-                _REGISTER_ENTRYPOINT_NAME))
+                _REGISTER_ENTRYPOINT_NAME), file=sys.stderr)
 
     @property
     def filters(self): return self._env.filters
@@ -120,6 +152,15 @@ class TemplateContext(object):
     @property
     def globals(self): return self._globals
 
+    # The Git revision templates are read from, or None for the working tree
+    @property
+    def revision(self): return self._revision
+
+    # Allows the context and its compiled templates to be reused for another
+    # project
+    def set_globals(self, globals):
+        self._globals = globals
+
     def render_from_template_string(self, s, globals):
         template = self._template_from_string(s)
         return template.render(globals)
@@ -128,6 +169,15 @@ class TemplateContext(object):
         template = self._template_from_file(path)
         return template.render(globals)
 
+    def generate_from_template_file(self, path, globals):
+        template = self._template_from_file(path)
+        return template.generate(globals)
+
+    # Returns the code object for a template without loading it, so that it
+    # can be stored and later loaded without parsing its source
+    def compile(self, s, name=None, filename=None):
+        return self._env.compile(unicode(s), name, filename)
+
     def tokenize(self, s):
         token_list = self._token_lists.get(s)
         if token_list is None:
@@ -147,18 +197,81 @@ class TemplateContext(object):
     def _template_from_string(self, s):
         template = self._templates_from_strings.get(s)
         if template is None:
-            template = _Template(_make_template(self._env, s))
+            code = None if self._archive_section is None else self._archive_section.string_code(s)
+            template = _Template(_make_template(self._env, s) if code is None else self._template_from_code(code))
             self._templates_from_strings[s] = template
         return template
 
     def _template_from_file(self, path):
         template = self._templates_from_files.get(path)
         if template is None:
-            with open(path, "rt") as f:
-                template = _Template(_make_template(self._env, unicode(f.read())))
+            code = None if self._archive_section is None else self._archive_section.file_code(path)
+            if code is None and self._revision is not None:
+                template = _Template(_make_template(self._env, unicode(self._revision.read(path)), path))
+            elif code is None:
+                with open(path, "rt") as f:
+                    template = _Template(_make_template(self._env, unicode(f.read()), path))
+            else:
+                template = _Template(self._template_from_code(code))
             self._templates_from_files[path] = template
         return template
 
-# TODO: Remove this!
+    def _template_from_code(self, code):
+        return self._env.template_class.from_code(self._env, code, self._env.make_globals(None), None)
+
+# Names guarded by these tests or filters may legitimately be left undefined
+_GUARD_TESTS = ("defined", "undefined")
+_GUARD_FILTERS = ("default", "d")
+
+_TOKEN_ENV = None
+
+# Static analysis happens before template extensions are registered, so
+# accept any filter or test name
+class _AnyCallableDict(dict):
+    def __contains__(self, key): return True
+
+    def get(self, key, default=None):
+        return dict.get(self, key, _identity)
+
+def _identity(value, *args, **kwargs):
+    return value
+
+def _token_env():
+    global _TOKEN_ENV
+    if _TOKEN_ENV is None:
+        _TOKEN_ENV = jinja2.Environment(optimized=False)
+        _TOKEN_ENV.filters = _AnyCallableDict(_TOKEN_ENV.filters)
+        _TOKEN_ENV.tests = _AnyCallableDict(_TOKEN_ENV.tests)
+    return _TOKEN_ENV
+
+def _guarded_names(ast):
+    names = set()
+    for node in ast.find_all((jinja2.nodes.Test, jinja2.nodes.Filter)):
+        guards = _GUARD_TESTS if isinstance(node, jinja2.nodes.Test) else _GUARD_FILTERS
+        if node.name in guards and isinstance(node.node, jinja2.nodes.Name):
+            names.add(node.node.name)
+    return names
+
+def _parse_tokens(s, filename=None):
+    env = _token_env()
+    try:
+        ast = env.parse(unicode(s), filename=filename)
+    except jinja2.exceptions.TemplateSyntaxError as e:
+        raise RuntimeError("Syntax error \"{}\" in {} at line {}".format(
+            e.message,
+            "(unknown)" if filename is None else filename,
+            e.lineno))
+
+    keys = jinja2.meta.find_undeclared_variables(ast) - _guarded_names(ast) - set(env.globals)
+    includes = [name for name in jinja2.meta.find_referenced_templates(ast) if name is not None]
+    return keys, includes
+
 def template_tokens(*args):
-    return []
+    keys = set()
+    for s in args:
+        keys.update(_parse_tokens(s)[0])
+    return sorted(keys)
+
+def template_source_tokens(s, filename=None):
+    keys, includes = _parse_tokens(s, filename)
+    return sorted(keys), includes
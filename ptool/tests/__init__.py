@@ -7,6 +7,7 @@
 from __future__ import print_function
 import doctest
 import importlib
+import os
 import pkgutil
 import unittest
 
@@ -26,6 +27,9 @@ def suite():
         if tests:
             suite.addTests(tests)
 
+    tests_dir = os.path.dirname(os.path.abspath(__file__))
+    suite.addTests(unittest.defaultTestLoader.discover(tests_dir, top_level_dir=os.path.dirname(os.path.dirname(tests_dir))))
+
     return suite
 
 if __name__ == "__main__":
@@ -0,0 +1,108 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+def git(cwd, *args):
+    return subprocess.check_output(
+        ["git", "-c", "user.name=ptool", "-c", "user.email=ptool@example.com"] + list(args),
+        cwd=cwd,
+        stderr=subprocess.STDOUT)
+
+def write_file(path, content):
+    parent_dir = os.path.dirname(path)
+    if not os.path.isdir(parent_dir):
+        os.makedirs(parent_dir)
+    with open(path, "wb") as f:
+        f.write(content)
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+class TempDirTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix="ptool-test-")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def path(self, *fragments):
+        return os.path.join(self.temp_dir, *fragments)
+
+    # Writes a template repository from a map of paths, using "/"
+    # separators, to contents and returns its directory
+    def make_repo(self, files, name="templates"):
+        repo_dir = self.path(name)
+        os.makedirs(repo_dir)
+        for relpath, content in files.items():
+            write_file(os.path.join(repo_dir, *relpath.split("/")), content)
+        return repo_dir
+
+    # Creates a ptool directory whose template repository has the given
+    # files, returning its path
+    def make_ptool_dir(self, files):
+        ptool_dir = self.path("ptool")
+        repo_dir = self.make_repo(files, os.path.join("ptool", "ptool-templates"))
+        git(repo_dir, "init", "-q")
+        git(repo_dir, "add", "-A")
+        git(repo_dir, "commit", "-q", "-m", "Templates")
+        write_file(os.path.join(ptool_dir, "config.yaml"), "author: Some Author\n")
+        return ptool_dir
+
+    # Creates a committed upstream template repository with the given files
+    # and a ptool directory that clones it with the given
+    # "template-repository" settings, returning its Config
+    def make_config(self, files, **repository_settings):
+        import yaml
+        from ptool.config import Config
+
+        repo_dir = self.make_repo(files)
+        git(repo_dir, "init", "-q")
+        git(repo_dir, "add", "-A")
+        git(repo_dir, "commit", "-q", "-m", "Templates")
+
+        # A file URL, since Git ignores --depth when cloning a local path
+        repository_settings["url"] = "file://" + repo_dir
+        config_dir = self.path("ptool")
+        write_file(os.path.join(config_dir, "config.yaml"), yaml.dump({
+            "author": "Some Author",
+            "template-repository": repository_settings
+        }))
+        return Config(config_dir)
+
+    # Runs ptool with the ptool directory created by make_ptool_dir,
+    # returning its output
+    def run_ptool(self, *args):
+        return subprocess.check_output(
+            [sys.executable, "-m", "ptool"] + list(args),
+            stderr=subprocess.STDOUT,
+            **self._ptool_kwargs())
+
+    # Starts ptool as run_ptool does, returning the process with its output
+    # available from stdout
+    def start_ptool(self, *args):
+        process = subprocess.Popen(
+            [sys.executable, "-m", "ptool"] + list(args),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            **self._ptool_kwargs())
+        self.addCleanup(process.wait)
+        self.addCleanup(lambda: process.poll() is None and process.terminate())
+        return process
+
+    def _ptool_kwargs(self):
+        env = dict(os.environ)
+        env["PTOOL_DIR"] = self.path("ptool")
+        return {
+            "cwd": os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+            "env": env
+        }
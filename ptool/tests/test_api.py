@@ -0,0 +1,72 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import os
+import unittest
+
+from ptool.api import ProjectRenderer, render_project
+from ptool.manifest import MANIFEST_FILE_NAME
+from ptool.tests.helpers import TempDirTestCase, git, write_file
+
+_TEMPLATE_FILES = {
+    "tool/_ptool.yaml":
+        "template-values:\n"
+        "  colour: red\n"
+        "files:\n"
+        "  - README.md\n"
+        "  - path: run.sh\n"
+        "    output-path: \"bin/{{ project_name }}.sh\"\n"
+        "commands:\n"
+        "  - git-execute-attribute:\n"
+        "      path: \"bin/{{ project_name }}.sh\"\n"
+        "  - git-symlink:\n"
+        "      source-path: \"bin/{{ project_name }}.sh\"\n"
+        "      target-path: run\n"
+        "  - \"echo {{ project_name }}\"\n",
+    "tool/README.md": "{{ project_name }} by {{ author }} in {{ colour }}",
+    "tool/run.sh": "echo {{ project_name }}\n"
+}
+
+class ProjectRendererTests(TempDirTestCase):
+    def setUp(self):
+        super(ProjectRendererTests, self).setUp()
+        self.make_ptool_dir(_TEMPLATE_FILES)
+        self.renderer = ProjectRenderer(self.path("ptool"))
+
+    def test_render(self):
+        project = self.renderer.render("tool", "proj")
+
+        self.assertEqual(b"proj by Some Author in red", project.files["README.md"])
+        self.assertEqual(b"echo proj", project.files["bin/proj.sh"])
+        self.assertIn(MANIFEST_FILE_NAME, project.files)
+        self.assertEqual({ "run": "bin/proj.sh" }, project.symlinks)
+        self.assertEqual(set(["bin/proj.sh"]), set(project.executable_paths))
+        self.assertEqual(["echo proj"], [command.display for command in project.commands])
+        self.assertNotIn("run", project.files)
+
+    def test_values_override_config(self):
+        project = self.renderer.render("tool", "proj", { "author": "Other Author", "colour": "blue" })
+        self.assertEqual(b"proj by Other Author in blue", project.files["README.md"])
+
+    def test_refresh_after_head_change(self):
+        self.renderer.render("tool", "proj")
+        generator = self.renderer.generator("tool")
+        self.assertIs(generator, self.renderer.generator("tool"))
+
+        repo_dir = self.path("ptool", "ptool-templates")
+        write_file(os.path.join(repo_dir, "tool", "README.md"), "{{ project_name }} changed")
+        git(repo_dir, "commit", "-q", "-a", "-m", "Change README")
+
+        project = self.renderer.render("tool", "proj")
+        self.assertEqual(b"proj changed", project.files["README.md"])
+        self.assertIsNot(generator, self.renderer.generator("tool"))
+
+    def test_render_project(self):
+        project = render_project("tool", "proj", config_dir=self.path("ptool"))
+        self.assertEqual(b"proj by Some Author in red", project.files["README.md"])
+
+if __name__ == "__main__":
+    unittest.main()
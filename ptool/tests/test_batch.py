@@ -0,0 +1,91 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import os
+import subprocess
+import unittest
+
+from ptool.batch import read_batch_manifest
+from ptool.exceptions import Informational
+from ptool.tests.helpers import TempDirTestCase, read_file, write_file
+
+class BatchManifestTests(TempDirTestCase):
+    def test_yaml_and_json(self):
+        yaml_path = self.path("batch.yaml")
+        write_file(yaml_path, """- template: tool
+  output-dir: out/a
+  values:
+    b: 2
+    a: 1
+  project-name: proj
+  force: true
+- template: other
+  output-dir: out/b
+""")
+        json_path = self.path("batch.json")
+        write_file(json_path, '[{ "template": "tool", "output-dir": "out/a", "values": { "b": 2, "a": 1 }, "project-name": "proj", "force": true }, { "template": "other", "output-dir": "out/b" }]')
+
+        for path in [yaml_path, json_path]:
+            entries = read_batch_manifest(path)
+            self.assertEqual(2, len(entries))
+            self.assertEqual("tool", entries[0].template_name)
+            self.assertEqual(os.path.abspath("out/a"), entries[0].output_dir)
+            self.assertEqual([("a", 1), ("b", 2)], entries[0].key_value_pairs)
+            self.assertEqual("proj", entries[0].project_name)
+            self.assertTrue(entries[0].force_overwrite)
+            self.assertEqual([], entries[1].key_value_pairs)
+            self.assertIsNone(entries[1].project_name)
+            self.assertFalse(entries[1].force_overwrite)
+
+    def test_invalid(self):
+        path = self.path("batch.yaml")
+        for content in [
+            "template: tool\n",
+            "- tool\n",
+            "- output-dir: out\n",
+            "- template: tool\n",
+            "- template: tool\n  output-dir: out\n  values: [1]\n"]:
+            write_file(path, content)
+            with self.assertRaises(Informational):
+                read_batch_manifest(path)
+
+class BatchTests(TempDirTestCase):
+    def test_failed_entry_does_not_stop_batch(self):
+        self.make_ptool_dir({
+            "tool/_ptool.yaml": "files:\n  - README.md\n",
+            "tool/README.md": "{{ project_name }} {{ colour }}\n"
+        })
+        os.makedirs(self.path("exists"))
+        path = self.path("batch.yaml")
+        write_file(path, """- template: tool
+  output-dir: {0}/a
+  values:
+    colour: red
+- template: tool
+  output-dir: {0}/exists
+  values:
+    colour: blue
+- template: tool
+  output-dir: {0}/b
+  project-name: other
+  values:
+    colour: green
+""".format(self.path()))
+
+        for jobs in ["1", "2"]:
+            with self.assertRaises(subprocess.CalledProcessError) as cm:
+                self.run_ptool("batch", "-j", jobs, path)
+            self.assertIn("2 project(s) generated, 1 failed", cm.exception.output)
+            self.assertEqual("a red", read_file(self.path("a", "README.md")))
+            self.assertEqual("other green", read_file(self.path("b", "README.md")))
+            self.assertEqual([], os.listdir(self.path("exists")))
+            for name in ["a", "b"]:
+                os.remove(self.path(name, "README.md"))
+                os.remove(self.path(name, ".ptool-manifest.json"))
+                os.rmdir(self.path(name))
+
+if __name__ == "__main__":
+    unittest.main()
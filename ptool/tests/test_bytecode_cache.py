@@ -0,0 +1,58 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import os
+import unittest
+
+from ptool.bytecode_cache import BytecodeCache
+from ptool.template_util import TemplateContext
+from ptool.tests.helpers import TempDirTestCase, write_file
+
+class BytecodeCacheTests(TempDirTestCase):
+    def context(self):
+        template_dir = self.path("templates", "tool")
+        if not os.path.isdir(template_dir):
+            os.makedirs(template_dir)
+        return TemplateContext(
+            [template_dir],
+            template_dir,
+            {},
+            bytecode_cache=BytecodeCache(self.path("cache")),
+            warn_missing_entrypoint=False)
+
+    def cache(self):
+        return BytecodeCache(self.path("cache"))
+
+    def test_string_templates_keyed_by_content(self):
+        self.assertEqual("a", self.context().render_from_template_string("{{ x }}", { "x": "a" }))
+        self.assertEqual(1, self.cache().stats()[0])
+
+        # The same source in a new context reuses the entry
+        self.assertEqual("b", self.context().render_from_template_string("{{ x }}", { "x": "b" }))
+        self.assertEqual(1, self.cache().stats()[0])
+
+        self.assertEqual("c!", self.context().render_from_template_string("{{ x }}!", { "x": "c" }))
+        self.assertEqual(2, self.cache().stats()[0])
+
+    def test_changed_file_template_is_recompiled(self):
+        path = self.path("templates", "tool", "README.md")
+        write_file(path, "one {{ x }}")
+        self.assertEqual("one a", self.context().render_from_template_file(path, { "x": "a" }))
+
+        # Same key, so the entry is replaced rather than added
+        write_file(path, "two {{ x }}")
+        self.assertEqual("two a", self.context().render_from_template_file(path, { "x": "a" }))
+        self.assertEqual(1, self.cache().stats()[0])
+
+    def test_corrupt_entry_is_a_miss(self):
+        self.context().render_from_template_string("{{ x }}", { "x": "a" })
+        for path in self.cache().entries():
+            write_file(path, "garbage")
+
+        self.assertEqual("b", self.context().render_from_template_string("{{ x }}", { "x": "b" }))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import os
+import unittest
+
+import ptool.catalog
+from ptool.catalog import TemplateCatalog
+from ptool.git_util import read_head_commit
+from ptool.tests.helpers import TempDirTestCase, git, write_file
+from ptool.yaml_cache import YamlCache
+
+class TemplateCatalogTests(TempDirTestCase):
+    def setUp(self):
+        super(TemplateCatalogTests, self).setUp()
+        self.repo_dir = self.make_repo({
+            "one/_ptool.yaml": "description: One\nfiles:\n  - a.txt\n",
+            "one/a.txt": "a\n",
+            "two/_ptool.yaml": "description: Two\ntemplate-values:\n  x: 1\nfiles: []\n",
+            "shared/include.txt": "shared\n"
+        })
+        git(self.repo_dir, "init", "-q")
+        self.commit_all("Templates")
+        self.catalog = TemplateCatalog(self.repo_dir, self.path("cache", "catalog.json"))
+
+        # Records the templates read from _ptool.yaml rather than the index
+        self.read_names = []
+        try_read = ptool.catalog.TemplateSpec.try_read
+        def counting_try_read(repo_dir, name, *args, **kwargs):
+            self.read_names.append(name)
+            return try_read(repo_dir, name, *args, **kwargs)
+        ptool.catalog.TemplateSpec.try_read = staticmethod(counting_try_read)
+        self.addCleanup(setattr, ptool.catalog.TemplateSpec, "try_read", staticmethod(try_read))
+
+    def commit_all(self, message):
+        git(self.repo_dir, "add", "-A")
+        git(self.repo_dir, "commit", "-q", "-m", message)
+
+    def entries(self):
+        self.read_names = []
+        return { entry.name : entry for entry in self.catalog.entries() }
+
+    def test_index_is_reused(self):
+        entries = self.entries()
+        self.assertEqual(["one", "two"], sorted(entries.keys()))
+        self.assertEqual("One", entries["one"].description)
+        self.assertEqual(1, entries["one"].file_count)
+        self.assertEqual(["x"], entries["two"].value_keys)
+        self.assertEqual(["one", "two"], self.read_names)
+
+        self.assertEqual(["one", "two"], sorted(self.entries().keys()))
+        self.assertEqual([], self.read_names)
+
+    def test_changed_yaml_is_reread(self):
+        self.entries()
+        write_file(os.path.join(self.repo_dir, "two", "_ptool.yaml"), "description: Two changed\nfiles: []\n")
+
+        entries = self.entries()
+        self.assertEqual(["two"], self.read_names)
+        self.assertEqual("Two changed", entries["two"].description)
+
+    def test_head_change_rereads_changed_templates(self):
+        self.entries()
+        write_file(os.path.join(self.repo_dir, "one", "b.txt"), "b\n")
+        self.commit_all("Change one")
+
+        # The _ptool.yaml of "one" is unchanged, but the commit touched it
+        self.entries()
+        self.assertEqual(["one"], self.read_names)
+
+    def test_removed_template_is_dropped(self):
+        self.entries()
+        git(self.repo_dir, "rm", "-q", "-r", "two")
+        self.commit_all("Remove two")
+
+        self.assertEqual(["one"], sorted(self.entries().keys()))
+        self.assertEqual(["one"], sorted(self.entries().keys()))
+
+    def test_uses_yaml_cache(self):
+        yaml_cache = YamlCache(self.path("cache", "yaml.pickle"))
+        TemplateCatalog(self.repo_dir, self.path("cache", "other.json"), yaml_cache).entries()
+        yaml_cache.save()
+
+        yaml_cache = YamlCache(self.path("cache", "yaml.pickle"))
+        yaml_path = os.path.join(self.repo_dir, "one", "_ptool.yaml")
+        self.assertIn(yaml_path, yaml_cache._load())
+
+class ReadHeadCommitTests(TempDirTestCase):
+    def test_read_head_commit(self):
+        repo_dir = self.make_repo({ "README.md": "readme\n" })
+        git(repo_dir, "init", "-q")
+        git(repo_dir, "add", "-A")
+        git(repo_dir, "commit", "-q", "-m", "Initial")
+        commit = git(repo_dir, "rev-parse", "HEAD").strip()
+
+        self.assertEqual(commit, read_head_commit(repo_dir))
+
+        git(repo_dir, "pack-refs", "--all")
+        self.assertEqual(commit, read_head_commit(repo_dir))
+
+        git(repo_dir, "checkout", "-q", "--detach")
+        self.assertEqual(commit, read_head_commit(repo_dir))
+
+    def test_not_a_repository(self):
+        self.assertIsNone(read_head_commit(self.temp_dir))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import errno
+import os
+import time
+import unittest
+
+from ptool.command_runner import run_commands
+from ptool.commands import SimpleCommandInfo
+from ptool.tests.helpers import TempDirTestCase, read_file
+
+class _Context(object):
+    def render_from_template_string(self, template, values):
+        return template
+
+class _GitBatch(object):
+    def __init__(self, on_flush=None):
+        self._operations = []
+        self._on_flush = on_flush
+
+    @property
+    def has_pending_operations(self): return len(self._operations) > 0
+
+    def queue(self, operation):
+        self._operations.append(operation)
+
+    def flush(self):
+        if len(self._operations) > 0 and self._on_flush is not None:
+            self._on_flush()
+        self._operations = []
+
+class _QueueGitOperation(object):
+    TOOL_NAME = "queue"
+
+    def __init__(self, name, after):
+        self._name = name
+        self._after = after
+
+    @property
+    def name(self): return self._name
+
+    @property
+    def after(self): return self._after
+
+    def run(self, ctx, values, git_batch):
+        git_batch.queue(self._name)
+
+class _InterruptingOutput(object):
+    def write(self, s):
+        raise KeyboardInterrupt()
+
+    def flush(self):
+        pass
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError as e:
+        if e.errno != errno.ESRCH:
+            raise
+        return False
+
+@unittest.skipUnless(os.name == "posix", "Requires process groups")
+class RunCommandsTests(TempDirTestCase):
+    def test_interrupt_kills_running_commands(self):
+        pid_path = self.path("pid")
+        commands = [
+            SimpleCommandInfo("sleep 30 & echo $! > {}.tmp && mv {}.tmp {}; wait".format(pid_path, pid_path, pid_path), name="slow", after=[]),
+            SimpleCommandInfo("while [ ! -f {} ]; do sleep 0.05; done; echo done".format(pid_path), name="fast", after=[])
+        ]
+
+        with self.assertRaises(KeyboardInterrupt):
+            run_commands(commands, _Context(), {}, _GitBatch(), jobs=2, cwd=self.temp_dir, output=_InterruptingOutput())
+
+        pid = int(read_file(pid_path))
+        deadline = time.time() + 5
+        while _is_running(pid) and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertFalse(_is_running(pid))
+
+    def test_git_operations_wait_for_running_commands(self):
+        done_path = self.path("done")
+        flushed_while_running = []
+        git_batch = _GitBatch(lambda: flushed_while_running.append(not os.path.exists(done_path)))
+        commands = [
+            SimpleCommandInfo("sleep 0.3; touch {}".format(done_path), name="slow", after=[]),
+            _QueueGitOperation("git", []),
+            SimpleCommandInfo("true", name="next", after=["git"])
+        ]
+
+        run_commands(commands, _Context(), {}, git_batch, jobs=2, cwd=self.temp_dir, output=_InterruptingOutput())
+        self.assertEqual([False], flushed_while_running)
+
+if __name__ == "__main__":
+    unittest.main()
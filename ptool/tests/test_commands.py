@@ -0,0 +1,38 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import os
+import unittest
+
+from ptool.commands import SimpleCommandInfo
+from ptool.template_util import TemplateContext
+from ptool.tests.helpers import TempDirTestCase
+
+class SimpleCommandInfoTests(TempDirTestCase):
+    def setUp(self):
+        super(SimpleCommandInfoTests, self).setUp()
+        template_dir = self.path("templates", "tool")
+        os.makedirs(template_dir)
+        self.values = { "name": "proj" }
+        self.ctx = TemplateContext([template_dir], template_dir, self.values, warn_missing_entrypoint=False)
+
+    def test_display(self):
+        shell_process = SimpleCommandInfo("echo {{ name }} > out.txt").prepare(self.ctx, self.values)
+        self.assertEqual("echo proj > out.txt", shell_process.display)
+
+        split_process = SimpleCommandInfo("echo {{ name }}").prepare(self.ctx, self.values)
+        self.assertEqual("echo proj", split_process.display)
+
+        list_process = SimpleCommandInfo(["echo", "{{ name }}"]).prepare(self.ctx, self.values)
+        self.assertEqual("echo proj", list_process.display)
+
+    def test_run(self):
+        result = SimpleCommandInfo("echo {{ name }} && echo done").prepare(self.ctx, self.values).run()
+        self.assertEqual(0, result.returncode)
+        self.assertEqual("proj\ndone\n", result.output)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import errno
+import os
+import unittest
+
+from ptool.copy_util import COPY_METHOD_BUFFERED, COPY_METHOD_HARDLINK, CopyStats, _try_kernel_copy, copy_file
+from ptool.tests.helpers import TempDirTestCase, read_file, write_file
+
+class CopyFileTests(TempDirTestCase):
+    def setUp(self):
+        super(CopyFileTests, self).setUp()
+        self.source_path = self.path("source.bin")
+        self.content = b"".join(chr(i % 256) for i in range(1024 * 1024 + 17))
+        write_file(self.source_path, self.content)
+
+    def test_copy(self):
+        target_path = self.path("target.bin")
+        method, size = copy_file(self.source_path, target_path)
+        self.assertNotEqual(COPY_METHOD_HARDLINK, method)
+        self.assertEqual(len(self.content), size)
+        self.assertEqual(self.content, read_file(target_path))
+        self.assertNotEqual(os.stat(self.source_path).st_ino, os.stat(target_path).st_ino)
+
+    @unittest.skipUnless(hasattr(os, "link"), "Requires hard links")
+    def test_link(self):
+        target_path = self.path("target.bin")
+        method, size = copy_file(self.source_path, target_path, link=True)
+        self.assertEqual(COPY_METHOD_HARDLINK, method)
+        self.assertEqual(len(self.content), size)
+        self.assertEqual(os.stat(self.source_path).st_ino, os.stat(target_path).st_ino)
+
+    def test_unsupported_kernel_copy_falls_back(self):
+        def unsupported(source_fd, target_fd, offset, count):
+            raise OSError(errno.EXDEV, "Cross-device copy")
+        self.assertFalse(_try_kernel_copy(unsupported, 0, 0, 10))
+        self.assertFalse(_try_kernel_copy(None, 0, 0, 10))
+
+    def test_kernel_copy_failure_after_writing_raises(self):
+        calls = []
+        def partial(source_fd, target_fd, offset, count):
+            if len(calls) > 0:
+                raise OSError(errno.EXDEV, "Cross-device copy")
+            calls.append(count)
+            return 4
+        with self.assertRaises(OSError):
+            _try_kernel_copy(partial, 0, 0, 10)
+
+class CopyStatsTests(unittest.TestCase):
+    def test_method_totals(self):
+        stats = CopyStats()
+        stats.record("a", COPY_METHOD_BUFFERED, 10)
+        stats.record("b", COPY_METHOD_BUFFERED, 5)
+        stats.record("c", COPY_METHOD_HARDLINK, 7)
+        self.assertEqual(22, stats.total_bytes)
+        self.assertEqual({ COPY_METHOD_BUFFERED: (2, 15), COPY_METHOD_HARDLINK: (1, 7) }, stats.method_totals())
+
+if __name__ == "__main__":
+    unittest.main()
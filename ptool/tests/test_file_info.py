@@ -0,0 +1,75 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import hashlib
+import os
+import types
+import unittest
+
+from ptool.file_info import FileInfo
+from ptool.template_util import TemplateContext
+from ptool.tests.helpers import TempDirTestCase, read_file, write_file
+from ptool.util import ensure_dir
+
+_LOOP_TEMPLATE = "{% for i in range(count) %}line {{ i }} of {{ name }}\n{% endfor %}end"
+
+class FileInfoTests(TempDirTestCase):
+    def setUp(self):
+        super(FileInfoTests, self).setUp()
+        self.template_dir = self.path("templates", "tool")
+        os.makedirs(self.template_dir)
+        self.ctx = TemplateContext([self.template_dir], self.template_dir, {}, warn_missing_entrypoint=False)
+        self.output_dir = self.path("out")
+
+    def generate(self, file, values):
+        target_path = file.target_path(self.ctx, values, self.output_dir)
+        ensure_dir(os.path.dirname(target_path))
+        return file.generate(self.ctx, values, target_path, os.path.relpath(target_path, self.output_dir))
+
+    def test_generate_streams_rendered_output(self):
+        source_path = os.path.join(self.template_dir, "big.txt")
+        write_file(source_path, _LOOP_TEMPLATE)
+        values = { "count": 5000, "name": "proj" }
+
+        chunks = self.ctx.generate_from_template_file(source_path, values)
+        self.assertIsInstance(chunks, types.GeneratorType)
+
+        result = self.generate(FileInfo(source_path, "sub/{{ name }}.txt", True), values)
+        target_path = result.target_path
+        self.assertEqual(os.path.join(self.output_dir, "sub", "proj.txt"), target_path)
+        self.assertIsNone(result.copy_method)
+        self.assertEqual(os.path.getsize(target_path), result.size)
+        self.assertEqual(hashlib.sha1(read_file(target_path)).hexdigest(), result.sha1)
+        self.assertEqual(self.ctx.render_from_template_file(source_path, values), read_file(target_path))
+        self.assertTrue(read_file(target_path).startswith("line 0 of proj\nline 1 of proj\n"))
+
+    def test_generate_copies_non_template(self):
+        source_path = os.path.join(self.template_dir, "raw.txt")
+        write_file(source_path, "{{ raw }}\n")
+
+        result = self.generate(FileInfo(source_path, "raw.txt", False), {})
+        self.assertEqual("{{ raw }}\n", read_file(result.target_path))
+        self.assertEqual(10, result.size)
+
+    def test_literal_copy_matches_rendering(self):
+        for i, content in enumerate(["text\n", "text\n\n", "text", "", "\n"]):
+            source_path = os.path.join(self.template_dir, "{}.txt".format(i))
+            write_file(source_path, content)
+            file = FileInfo(source_path, "{}.txt".format(i), True)
+            file.set_scan_info(len(content) - 1 if content.endswith("\n") else len(content), None)
+
+            result = self.generate(file, {})
+            self.assertIsNotNone(result.copy_method)
+            self.assertEqual(self.ctx.render_from_template_file(source_path, {}), read_file(result.target_path))
+
+    def test_out_of_tree_output_path(self):
+        source_path = os.path.join(self.template_dir, "a.txt")
+        write_file(source_path, "a")
+        with self.assertRaises(RuntimeError):
+            FileInfo(source_path, "../a.txt", True).target_path(self.ctx, {}, self.output_dir)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import os
+import unittest
+
+import inflection
+
+import ptool.filters
+from ptool.filters import MemoizedFilter, filter_registry
+from ptool.template_util import TemplateContext
+from ptool.tests.helpers import TempDirTestCase, write_file
+
+_TEMPLATE_MODULE = """import inflection
+
+def ptool_register(ctx):
+    inflection.PLURALS.insert(0, (r"(?i)(octop)us$", r"\\1odes"))
+"""
+
+class FilterRegistryTests(TempDirTestCase):
+    def setUp(self):
+        super(FilterRegistryTests, self).setUp()
+        self.reset_registry()
+        self.addCleanup(self.reset_registry)
+
+    def reset_registry(self):
+        ptool.filters._FILTER_REGISTRY = None
+
+    def test_only_pure_inflections_memoized(self):
+        def plural(rule, replacement):
+            inflection.PLURALS.insert(0, (rule, replacement))
+        inflection.plural = plural
+        self.addCleanup(delattr, inflection, "plural")
+
+        filters = filter_registry()
+        self.assertIsInstance(filters["pluralize"], MemoizedFilter)
+        self.assertIsInstance(filters["underscore"], MemoizedFilter)
+        self.assertIs(plural, filters["plural"])
+        self.assertNotIsInstance(filters["git_url"], MemoizedFilter)
+
+    def test_registering_template_module_clears_caches(self):
+        plurals = list(inflection.PLURALS)
+        self.addCleanup(setattr, inflection, "PLURALS", plurals)
+        inflection.PLURALS = list(plurals)
+
+        pluralize = filter_registry()["pluralize"]
+        self.assertEqual("octopi", pluralize("octopus"))
+        self.assertEqual(1, pluralize.size)
+
+        template_dir = self.path("templates", "tool")
+        os.makedirs(template_dir)
+        write_file(os.path.join(template_dir, "_ptool.py"), _TEMPLATE_MODULE)
+        ctx = TemplateContext([template_dir], template_dir, {})
+        self.assertEqual("octopodes", ctx.render_from_template_string("{{ 'octopus' | pluralize }}", {}))
+
+if __name__ == "__main__":
+    unittest.main()
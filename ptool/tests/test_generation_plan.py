@@ -0,0 +1,87 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import os
+import unittest
+
+from ptool.exceptions import Informational
+from ptool.generation_plan import plan_generation
+from ptool.template_spec import TemplateSpec
+from ptool.template_util import TemplateContext
+from ptool.tests.helpers import TempDirTestCase
+
+_VALUES = { "project_name": "proj" }
+
+class PlanGenerationTests(TempDirTestCase):
+    def plan(self, yaml, files=()):
+        repo_files = { "tool/_ptool.yaml": yaml }
+        for name in files:
+            repo_files["tool/" + name] = name
+        repo_dir = self.make_repo(repo_files)
+        template_spec = TemplateSpec.read(repo_dir, "tool")
+        ctx = TemplateContext([template_spec.template_dir], template_spec.template_dir, _VALUES, warn_missing_entrypoint=False)
+        return plan_generation(template_spec, ctx, _VALUES, self.path("out"))
+
+    def test_dirs_and_commands(self):
+        plan = self.plan(
+            "files:\n"
+            "  - path: a.txt\n"
+            "    output-path: \"src/{{ project_name }}/a.txt\"\n"
+            "  - b.txt\n"
+            "commands:\n"
+            "  - git-execute-attribute:\n"
+            "      path: b.txt\n"
+            "  - \"echo {{ project_name }}\"\n",
+            ["a.txt", "b.txt"])
+
+        self.assertEqual(["src/proj/a.txt", "b.txt"], [planned_file.relpath for planned_file in plan.files])
+        self.assertEqual(os.path.join(self.path("out"), "src", "proj", "a.txt"), plan.files[0].target_path)
+        self.assertEqual(["src", "src/proj"], plan.dirs)
+        self.assertEqual(set(["b.txt"]), plan.executable_paths)
+        self.assertEqual(["echo proj"], [command.display for command in plan.commands])
+        self.assertEqual(10, plan.estimated_bytes)
+        self.assertEqual([], plan.problems)
+        plan.check()
+
+        plan.create_dirs()
+        self.assertTrue(os.path.isdir(self.path("out", "src", "proj")))
+
+    def test_problems(self):
+        plan = self.plan(
+            "files:\n"
+            "  - path: a.txt\n"
+            "    output-path: same.txt\n"
+            "  - path: b.txt\n"
+            "    output-path: same.txt\n"
+            "  - path: c.txt\n"
+            "    output-path: \"../c.txt\"\n"
+            "  - path: d.txt\n"
+            "    output-path: same.txt/d.txt\n",
+            ["a.txt", "b.txt", "c.txt", "d.txt"])
+
+        self.assertEqual(3, len(plan.problems))
+        self.assertIn("../c.txt", plan.problems[0])
+        with self.assertRaises(Informational):
+            plan.check()
+        self.assertFalse(os.path.exists(self.path("out")))
+
+    def test_executable_path_not_generated(self):
+        plan = self.plan(
+            "files: []\n"
+            "commands:\n"
+            "  - git-execute-attribute:\n"
+            "      path: gen.sh\n")
+
+        # Commands may create the file in a project directory, but never in
+        # an archive
+        self.assertEqual([], plan.problems)
+        self.assertEqual(1, len(plan.warnings))
+        plan.check()
+        with self.assertRaises(Informational):
+            plan.check(commands_run=False)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import os
+import stat
+import unittest
+
+from ptool.exceptions import Informational
+from ptool.generator import ProjectGenerator
+from ptool.tests.helpers import TempDirTestCase, git, read_file
+
+_COMMAND_CREATED_EXECUTABLE = """description: Command-created executable
+files:
+  - README.md
+commands:
+  - "git init -q . && printf 'echo hi' > gen.sh && git add ."
+  - git-execute-attribute:
+      path: gen.sh
+"""
+
+class GeneratorTests(TempDirTestCase):
+    def test_execute_attribute_on_command_created_file(self):
+        config = self.make_config({
+            "tool/_ptool.yaml": _COMMAND_CREATED_EXECUTABLE,
+            "tool/README.md": "{{ project_name }}\n"
+        })
+        output_dir = self.path("out")
+
+        generator = ProjectGenerator(config, "tool")
+        self.assertEqual(1, len(generator.plan(output_dir).warnings))
+
+        generator.generate(output_dir)
+
+        self.assertEqual("echo hi", read_file(os.path.join(output_dir, "gen.sh")))
+        self.assertTrue(os.stat(os.path.join(output_dir, "gen.sh")).st_mode & stat.S_IXUSR)
+        self.assertTrue(git(output_dir, "ls-files", "-s", "gen.sh").startswith("100755 "))
+
+    def test_execute_attribute_on_command_created_file_in_memory(self):
+        config = self.make_config({
+            "tool/_ptool.yaml": _COMMAND_CREATED_EXECUTABLE,
+            "tool/README.md": "{{ project_name }}\n"
+        })
+
+        # Commands do not run, so gen.sh can never exist
+        with self.assertRaises(Informational):
+            ProjectGenerator(config, "tool").generate_in_memory(self.path("out"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import errno
+import os
+import unittest
+
+from ptool.exceptions import Informational
+from ptool.git_objects import GitObjectReader, GitRevision, _parse_tree
+from ptool.tests.helpers import TempDirTestCase, git, read_file, write_file
+
+class GitObjectReaderTests(TempDirTestCase):
+    def setUp(self):
+        super(GitObjectReaderTests, self).setUp()
+        self.repo_dir = self.make_repo({})
+        git(self.repo_dir, "init", "-q")
+
+    def hash_object(self, content):
+        path = self.path("object")
+        write_file(path, content)
+        return git(self.repo_dir, "hash-object", "-w", path).strip()
+
+    def test_parse_tree(self):
+        os.makedirs(os.path.join(self.repo_dir, "dir"))
+        write_file(os.path.join(self.repo_dir, "dir", "a.txt"), "a\n")
+        write_file(os.path.join(self.repo_dir, "b.sh"), "b\n")
+        os.chmod(os.path.join(self.repo_dir, "b.sh"), 0o755)
+        os.symlink("b.sh", os.path.join(self.repo_dir, "link"))
+        git(self.repo_dir, "add", "-A")
+        tree = git(self.repo_dir, "write-tree").strip()
+
+        reader = GitObjectReader(self.repo_dir)
+        self.addCleanup(reader.close)
+        hash, object_type, content = reader.read(tree)
+        self.assertEqual((tree, "tree"), (hash, object_type))
+
+        expected = {}
+        for line in git(self.repo_dir, "ls-tree", tree).splitlines():
+            mode_type_hash, name = line.split("\t")
+            mode, _, object_hash = mode_type_hash.split()
+            expected[name] = mode.lstrip("0"), object_hash
+        self.assertEqual(expected, _parse_tree(content))
+        self.assertEqual("120000", _parse_tree(content)["link"][0])
+        self.assertEqual("40000", _parse_tree(content)["dir"][0])
+
+    def test_cache_bytes(self):
+        hashes = [self.hash_object(c * 4) for c in "abc"]
+        large_hash = self.hash_object("d" * 11)
+
+        reader = GitObjectReader(self.repo_dir, max_cache_bytes=10)
+        self.addCleanup(reader.close)
+        reader.read(hashes[0])
+        reader.read(hashes[1])
+        self.assertEqual(8, reader.cache_bytes)
+
+        # Reading an object again neither counts it twice nor lets it be the
+        # next to be evicted
+        reader.read(hashes[0])
+        reader._put(hashes[0], "blob", "aaaa")
+        self.assertEqual(8, reader.cache_bytes)
+        reader.read(hashes[2])
+        self.assertEqual(8, reader.cache_bytes)
+        self.assertEqual([hashes[0], hashes[2]], list(reader._cache.keys()))
+
+        # Objects larger than the cache are not cached
+        self.assertEqual("d" * 11, reader.read(large_hash)[2])
+        self.assertEqual(8, reader.cache_bytes)
+
+        self.assertIsNone(reader.read("0" * 40))
+
+class GitRevisionTests(TempDirTestCase):
+    def setUp(self):
+        super(GitRevisionTests, self).setUp()
+        self.repo_dir = self.make_repo({
+            "a.txt": "a\n",
+            "dir/b.txt": "b\n"
+        })
+        git(self.repo_dir, "init", "-q")
+        for name, target in [
+            ("link.txt", "a.txt"),
+            ("dirlink", "dir"),
+            ("dir/up.txt", "../a.txt"),
+            ("outside.txt", "../outside.txt"),
+            ("loop.txt", "loop.txt")]:
+            os.symlink(target, os.path.join(self.repo_dir, name))
+        git(self.repo_dir, "add", "-A")
+        git(self.repo_dir, "update-index", "--add", "--cacheinfo", "160000,{},sub".format("1" * 40))
+        git(self.repo_dir, "commit", "-q", "-m", "Initial")
+
+        # The working tree no longer matches the revision
+        write_file(os.path.join(self.repo_dir, "a.txt"), "changed\n")
+
+        self.reader = GitObjectReader(self.repo_dir)
+        self.addCleanup(self.reader.close)
+        self.revision = GitRevision(self.reader, "HEAD")
+
+    def repo_path(self, *fragments):
+        return os.path.join(self.repo_dir, *fragments)
+
+    def test_read(self):
+        self.assertEqual(git(self.repo_dir, "rev-parse", "HEAD").strip(), self.revision.commit)
+        self.assertEqual("a\n", self.revision.read(self.repo_path("a.txt")))
+        self.assertEqual("b\n", self.revision.read(self.repo_path("dir", "b.txt")))
+        self.assertTrue(self.revision.isfile(self.repo_path("a.txt")))
+        self.assertFalse(self.revision.isfile(self.repo_path("dir")))
+        self.assertFalse(self.revision.isfile(self.repo_path("missing.txt")))
+        self.assertFalse(self.revision.isfile(os.path.dirname(self.repo_dir)))
+
+        for path in [self.repo_path("dir"), self.repo_path("missing.txt"), self.repo_path("a.txt", "x")]:
+            with self.assertRaises(IOError):
+                self.revision.read(path)
+
+    def test_symlinks_are_followed(self):
+        self.assertEqual("a\n", self.revision.read(self.repo_path("link.txt")))
+        self.assertEqual("a\n", self.revision.read(self.repo_path("dir", "up.txt")))
+        self.assertEqual("b\n", self.revision.read(self.repo_path("dirlink", "b.txt")))
+        self.assertTrue(self.revision.isfile(self.repo_path("link.txt")))
+        self.assertFalse(self.revision.isfile(self.repo_path("dirlink")))
+
+        with self.assertRaises(IOError):
+            self.revision.read(self.repo_path("outside.txt"))
+
+        with self.assertRaises(IOError) as cm:
+            self.revision.read(self.repo_path("loop.txt"))
+        self.assertEqual(errno.ELOOP, cm.exception.errno)
+
+    def test_submodule(self):
+        self.assertFalse(self.revision.isfile(self.repo_path("sub")))
+        with self.assertRaises(IOError) as cm:
+            self.revision.read(self.repo_path("sub"))
+        self.assertIn("Submodule", str(cm.exception))
+
+    def test_missing_revision(self):
+        with self.assertRaises(Informational):
+            GitRevision(self.reader, "no-such-branch")
+
+class NewRevisionTests(TempDirTestCase):
+    def test_link_with_rev(self):
+        self.make_ptool_dir({
+            "tool/_ptool.yaml": "files:\n  - path: raw.txt\n    preprocess: false\n",
+            "tool/raw.txt": "raw\n"
+        })
+        write_file(self.path("ptool", "ptool-templates", "tool", "raw.txt"), "changed\n")
+
+        output = self.run_ptool("new", "--rev", "HEAD", "--link", "tool", self.path("out"))
+        self.assertIn("WARNING: --link has no effect with --rev", output)
+        self.assertEqual("raw\n", read_file(self.path("out", "raw.txt")))
+        self.assertEqual(1, os.stat(self.path("out", "raw.txt")).st_nlink)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import os
+import stat
+import unittest
+
+from ptool.git_util import GitBatch
+from ptool.tests.helpers import TempDirTestCase, git, read_file, write_file
+
+class GitBatchTests(TempDirTestCase):
+    def setUp(self):
+        super(GitBatchTests, self).setUp()
+        self.repo_dir = self.path("repo")
+        os.makedirs(self.repo_dir)
+        git(self.repo_dir, "init", "-q")
+
+    def test_execute_attribute_keeps_edits_made_after_add(self):
+        run_path = os.path.join(self.repo_dir, "run.sh")
+        write_file(run_path, "old\n")
+        git(self.repo_dir, "add", "run.sh")
+        write_file(run_path, "new-edit\n")
+
+        batch = GitBatch(self.repo_dir)
+        batch.execute_attribute("run.sh")
+        batch.flush()
+
+        self.assertEqual("new-edit\n", read_file(run_path))
+        self.assertTrue(os.stat(run_path).st_mode & stat.S_IXUSR)
+        mode, hash, _ = git(self.repo_dir, "ls-files", "-s", "run.sh").split()[:3]
+        self.assertEqual("100755", mode)
+        self.assertEqual("new-edit\n", git(self.repo_dir, "cat-file", "blob", hash))
+
+    def test_symlink(self):
+        write_file(os.path.join(self.repo_dir, "README.md"), "readme\n")
+        git(self.repo_dir, "add", "README.md")
+
+        batch = GitBatch(self.repo_dir)
+        batch.symlink("README.md", "sub/README-link.md")
+        batch.flush()
+
+        link_path = os.path.join(self.repo_dir, "sub", "README-link.md")
+        self.assertEqual("../README.md", os.readlink(link_path))
+        self.assertTrue(git(self.repo_dir, "ls-files", "-s", "sub/README-link.md").startswith("120000 "))
+
+    def test_operations_apply_in_order(self):
+        write_file(os.path.join(self.repo_dir, "a.sh"), "a\n")
+        write_file(os.path.join(self.repo_dir, "b.sh"), "b\n")
+        git(self.repo_dir, "add", "a.sh", "b.sh")
+
+        # a.sh is replaced by a link after being made executable, then the
+        # file the link points to is made executable
+        batch = GitBatch(self.repo_dir)
+        batch.execute_attribute("a.sh")
+        batch.symlink("b.sh", "a.sh")
+        batch.execute_attribute("b.sh")
+        batch.flush()
+
+        self.assertEqual("b.sh", os.readlink(os.path.join(self.repo_dir, "a.sh")))
+        self.assertTrue(git(self.repo_dir, "ls-files", "-s", "a.sh").startswith("120000 "))
+        self.assertTrue(git(self.repo_dir, "ls-files", "-s", "b.sh").startswith("100755 "))
+
+    def test_execute_attribute_requires_indexed_path(self):
+        write_file(os.path.join(self.repo_dir, "untracked.sh"), "echo\n")
+
+        batch = GitBatch(self.repo_dir)
+        batch.execute_attribute("untracked.sh")
+        with self.assertRaises(RuntimeError):
+            batch.flush()
+
+if __name__ == "__main__":
+    unittest.main()
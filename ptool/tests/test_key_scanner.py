@@ -0,0 +1,149 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import os
+import unittest
+
+from ptool.key_scanner import _is_literal, scan_template_spec
+from ptool.scan_cache import ScanCache
+from ptool.template_spec import TemplateSpec
+from ptool.template_util import template_source_tokens, template_tokens
+from ptool.tests.helpers import TempDirTestCase, write_file
+
+class TemplateTokensTests(unittest.TestCase):
+    def test_undeclared_variables(self):
+        self.assertEqual(["items", "name"], template_tokens(
+            "{{ name }}{% for item in items %}{{ item }}{% endfor %}{% set local = 1 %}{{ local }}{{ range(3) }}"))
+
+    def test_several_templates(self):
+        self.assertEqual(["a", "b"], template_tokens("{{ b }}", "{{ a }}/{{ b }}"))
+
+    def test_guarded_names(self):
+        self.assertEqual(["name"], template_tokens(
+            "{% if optional is defined %}{{ optional }}{% endif %}"
+            "{% if other is undefined %}none{% endif %}"
+            "{{ fallback | default('x') }}{{ short | d('y') }}{{ name }}"))
+
+    def test_default_argument_is_not_guarded(self):
+        self.assertEqual(["value"], template_tokens("{{ name | default(value) }}"))
+
+    def test_unknown_filters_and_tests(self):
+        # Filters and tests registered by _ptool.py are not known yet
+        self.assertEqual(["flag", "name"], template_tokens(
+            "{{ name | my_filter(1) | underscore }}{% if flag is my_test %}x{% endif %}"))
+
+    def test_syntax_error(self):
+        with self.assertRaises(RuntimeError):
+            template_tokens("{{ name ")
+
+class FindTemplateKeysTests(TempDirTestCase):
+    def test_nested_includes(self):
+        repo_dir = self.make_repo({
+            "tool/_ptool.yaml":
+                "files:\n"
+                "  - path: README.md\n"
+                "    output-path: \"{{ project_name }}/README.md\"\n"
+                "  - path: raw.txt\n"
+                "    preprocess: false\n"
+                "commands:\n"
+                "  - git-execute-attribute:\n"
+                "      path: \"{{ script_name }}\"\n",
+            "tool/README.md": "{{ title }}{% include 'header.txt' %}",
+            "tool/raw.txt": "{{ not_a_key }}",
+            "shared/header.txt": "{{ header }}{% import 'macros.txt' as m %}",
+            "shared/macros.txt": "{% macro f() %}{{ footer }}{% endmacro %}{% include 'missing.txt' %}"
+        })
+        template_spec = TemplateSpec.read(repo_dir, "tool")
+        loader_dirs = [template_spec.template_dir, os.path.join(repo_dir, "shared")]
+
+        self.assertEqual(
+            ["footer", "header", "project_name", "script_name", "title"],
+            scan_template_spec(template_spec, loader_dirs))
+
+    def test_include_cycle(self):
+        repo_dir = self.make_repo({
+            "tool/_ptool.yaml": "files:\n  - a.txt\n",
+            "tool/a.txt": "{{ a }}{% include 'b.txt' %}",
+            "tool/b.txt": "{{ b }}{% include 'a.txt' %}"
+        })
+        template_spec = TemplateSpec.read(repo_dir, "tool")
+        self.assertEqual(["a", "b"], scan_template_spec(template_spec, [template_spec.template_dir]))
+
+    def test_parallel_scan(self):
+        files = { "tool/_ptool.yaml": "files:\n" + "".join("  - f{}.txt\n".format(i) for i in range(6)) }
+        for i in range(6):
+            files["tool/f{}.txt".format(i)] = "{{{{ k{} }}}}".format(i)
+        template_spec = TemplateSpec.read(self.make_repo(files), "tool")
+        self.assertEqual(["k{}".format(i) for i in range(6)], scan_template_spec(template_spec, [template_spec.template_dir], jobs=2))
+
+    def test_source_tokens(self):
+        self.assertEqual((["a", "name"], ["b.txt"]), template_source_tokens("{{ a }}{% include 'b.txt' %}{% include name %}"))
+
+class LiteralFileTests(TempDirTestCase):
+    def test_is_literal(self):
+        self.assertTrue(_is_literal("plain text\n"))
+        self.assertTrue(_is_literal("braces { } and % signs\n"))
+        self.assertFalse(_is_literal("{{ x }}"))
+        self.assertFalse(_is_literal("{% raw %}"))
+        self.assertFalse(_is_literal("{# comment #}"))
+        self.assertFalse(_is_literal("windows\r\nline"))
+        self.assertFalse(_is_literal("form\x0cfeed"))
+
+    def test_literal_size(self):
+        repo_dir = self.make_repo({
+            "tool/_ptool.yaml": "files:\n  - one.txt\n  - two.txt\n  - none.txt\n  - empty.txt\n  - rendered.txt\n",
+            "tool/one.txt": "text\n",
+            "tool/two.txt": "text\n\n",
+            "tool/none.txt": "text",
+            "tool/empty.txt": "",
+            "tool/rendered.txt": "{{ x }}\n"
+        })
+        template_spec = TemplateSpec.read(repo_dir, "tool")
+        scan_template_spec(template_spec, [template_spec.template_dir])
+
+        # Rendering drops exactly one trailing newline
+        self.assertEqual([4, 5, 4, 0, None], [file.literal_size for file in template_spec.files])
+
+class ScanCacheTests(TempDirTestCase):
+    def test_invalidated_by_mtime(self):
+        source_path = self.path("a.txt")
+        write_file(source_path, "{{ a }}")
+        cache = ScanCache(self.path("cache", "scan.json"))
+        self.assertIsNone(cache.get(source_path, "template"))
+
+        cache.put(source_path, "template", { "keys": ["a"], "includes": [], "literal_size": None, "sha1": None })
+        cache.save()
+
+        cache = ScanCache(self.path("cache", "scan.json"))
+        self.assertEqual(["a"], cache.get(source_path, "template")["keys"])
+
+        st = os.stat(source_path)
+        os.utime(source_path, (st.st_atime, st.st_mtime + 10))
+        self.assertIsNone(cache.get(source_path, "template"))
+
+    def test_scan_uses_cache(self):
+        repo_dir = self.make_repo({
+            "tool/_ptool.yaml": "files:\n  - a.txt\n",
+            "tool/a.txt": "{{ a }}"
+        })
+        template_spec = TemplateSpec.read(repo_dir, "tool")
+        cache_path = self.path("cache", "scan.json")
+        self.assertEqual(["a"], scan_template_spec(template_spec, [template_spec.template_dir], ScanCache(cache_path)))
+
+        # A cached entry is used while the file's mtime and size match
+        source_path = os.path.join(repo_dir, "tool", "a.txt")
+        cache = ScanCache(cache_path)
+        cache.put(source_path, "template", { "keys": ["cached"], "includes": [], "literal_size": None, "sha1": None })
+        cache.save()
+        self.assertEqual(["cached"], scan_template_spec(template_spec, [template_spec.template_dir], ScanCache(cache_path)))
+
+        write_file(source_path, "{{ b }}")
+        st = os.stat(source_path)
+        os.utime(source_path, (st.st_atime, st.st_mtime + 10))
+        self.assertEqual(["b"], scan_template_spec(template_spec, [template_spec.template_dir], ScanCache(cache_path)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import os
+import unittest
+
+from ptool.generation_plan import plan_generation
+from ptool.pipeline import generate_files
+from ptool.template_spec import TemplateSpec
+from ptool.template_util import TemplateContext
+from ptool.tests.helpers import TempDirTestCase, read_file
+
+_VALUES = { "project_name": "my-proj" }
+
+class GenerateFilesTests(TempDirTestCase):
+    def generate(self, files, jobs):
+        repo_dir = self.make_repo(files)
+        template_spec = TemplateSpec.read(repo_dir, "tool")
+        ctx = TemplateContext(
+            [template_spec.template_dir, repo_dir],
+            template_spec.template_dir,
+            _VALUES,
+            warn_missing_entrypoint=False)
+        output_dir = self.path("out-{}".format(jobs))
+        plan = plan_generation(template_spec, ctx, _VALUES, output_dir)
+        plan.create_dirs()
+        generate_files(repo_dir, template_spec, ctx, _VALUES, plan, jobs)
+        return output_dir
+
+    def test_parallel_matches_serial(self):
+        files = {
+            "tool/_ptool.yaml": "files:\n" + "".join("  - f{}.txt\n".format(i) for i in range(10)) + "  - path: raw.txt\n    output-path: \"{{ project_name }}/raw.txt\"\n    preprocess: false\n",
+            "tool/raw.txt": "{{ not rendered }}\n"
+        }
+        for i in range(10):
+            files["tool/f{}.txt".format(i)] = "{}: {{{{ project_name | underscore }}}}\n".format(i)
+
+        serial_dir = self.generate(files, 1)
+        os.rename(self.path("templates"), self.path("templates-serial"))
+        parallel_dir = self.generate(files, 4)
+
+        for i in range(10):
+            name = "f{}.txt".format(i)
+            # Jinja drops the final newline
+            self.assertEqual("{}: my_proj".format(i), read_file(os.path.join(parallel_dir, name)))
+            self.assertEqual(read_file(os.path.join(serial_dir, name)), read_file(os.path.join(parallel_dir, name)))
+        self.assertEqual("{{ not rendered }}\n", read_file(os.path.join(parallel_dir, "my-proj", "raw.txt")))
+
+    def test_parallel_error_names_file(self):
+        files = {
+            "tool/_ptool.yaml": "files:\n  - good.txt\n  - bad.txt\n",
+            "tool/good.txt": "good\n",
+            "tool/bad.txt": "{{ missing_value }}\n"
+        }
+        with self.assertRaises(RuntimeError) as cm:
+            self.generate(files, 2)
+        self.assertIn("bad.txt", str(cm.exception))
+
+if __name__ == "__main__":
+    unittest.main()
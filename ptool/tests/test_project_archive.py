@@ -0,0 +1,137 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import io
+import os
+import stat
+import subprocess
+import sys
+import tarfile
+import unittest
+import zipfile
+
+from ptool.exceptions import Informational
+from ptool.manifest import MANIFEST_FILE_NAME
+from ptool.project_archive import SPOOL_SIZE, archive_writer_factory, open_project_archive
+from ptool.tests.helpers import TempDirTestCase
+
+_LARGE_CONTENT = b"x" * (SPOOL_SIZE + 100)
+
+_TEMPLATE_FILES = {
+    "tool/_ptool.yaml":
+        "files:\n"
+        "  - README.md\n"
+        "  - path: run.sh\n"
+        "    output-path: \"bin/{{ project_name }}.sh\"\n"
+        "commands:\n"
+        "  - git-execute-attribute:\n"
+        "      path: \"bin/{{ project_name }}.sh\"\n"
+        "  - git-symlink:\n"
+        "      source-path: \"bin/{{ project_name }}.sh\"\n"
+        "      target-path: run\n"
+        "  - \"echo {{ project_name }}\"\n",
+    "tool/README.md": "# {{ project_name }}\n",
+    "tool/run.sh": "echo {{ project_name }}\n"
+}
+
+def _add_entries(archive):
+    archive.add_file("README.md", io.BytesIO(b"readme\n"), 7)
+    archive.add_file("bin/run.sh", io.BytesIO(b"run\n"), 4)
+    archive.add_file("data/large.bin", io.BytesIO(_LARGE_CONTENT), len(_LARGE_CONTENT))
+    archive.add_symlink("run", "bin/run.sh")
+
+class ProjectArchiveTests(TempDirTestCase):
+    def test_tar_gz(self):
+        path = self.path("out.tar.gz")
+        with open_project_archive(path, "proj", set(["bin/run.sh"])) as archive:
+            _add_entries(archive)
+
+        with tarfile.open(path, "r:gz") as tar:
+            self.assertEqual(
+                ["proj", "proj/README.md", "proj/bin", "proj/bin/run.sh", "proj/data", "proj/data/large.bin", "proj/run"],
+                tar.getnames())
+            self.assertTrue(tar.getmember("proj/bin").isdir())
+            self.assertEqual(b"readme\n", tar.extractfile("proj/README.md").read())
+            self.assertEqual(_LARGE_CONTENT, tar.extractfile("proj/data/large.bin").read())
+            self.assertFalse(tar.getmember("proj/README.md").mode & stat.S_IXUSR)
+            self.assertTrue(tar.getmember("proj/bin/run.sh").mode & stat.S_IXUSR)
+            link = tar.getmember("proj/run")
+            self.assertTrue(link.issym())
+            self.assertEqual("bin/run.sh", link.linkname)
+
+    def test_zip(self):
+        path = self.path("out.zip")
+        with open_project_archive(path, "proj", set(["bin/run.sh"])) as archive:
+            _add_entries(archive)
+
+        with zipfile.ZipFile(path) as z:
+            self.assertEqual(
+                ["proj/", "proj/README.md", "proj/bin/", "proj/bin/run.sh", "proj/data/", "proj/data/large.bin", "proj/run"],
+                z.namelist())
+            modes = { info.filename : info.external_attr >> 16 for info in z.infolist() }
+            self.assertTrue(stat.S_ISDIR(modes["proj/bin/"]))
+            self.assertTrue(stat.S_ISREG(modes["proj/README.md"]))
+            self.assertFalse(modes["proj/README.md"] & stat.S_IXUSR)
+            self.assertTrue(modes["proj/bin/run.sh"] & stat.S_IXUSR)
+            self.assertTrue(stat.S_ISLNK(modes["proj/run"]))
+            self.assertEqual(b"bin/run.sh", z.read("proj/run"))
+            self.assertEqual(b"readme\n", z.read("proj/README.md"))
+
+            # Spooled through a temporary file, which must not lend the entry
+            # its own name, mode or time
+            self.assertEqual(_LARGE_CONTENT, z.read("proj/data/large.bin"))
+            self.assertTrue(stat.S_ISREG(modes["proj/data/large.bin"]))
+            self.assertEqual(
+                z.getinfo("proj/README.md").date_time,
+                z.getinfo("proj/data/large.bin").date_time)
+
+    def test_unsupported_format(self):
+        with self.assertRaises(Informational):
+            archive_writer_factory(self.path("out.rar"))
+        self.assertFalse(os.path.exists(self.path("out.rar")))
+
+class NewArchiveTests(TempDirTestCase):
+    def test_new_tar_gz(self):
+        self.make_ptool_dir(_TEMPLATE_FILES)
+        path = self.path("proj.tar.gz")
+        output = self.run_ptool("new", "--archive", path, "tool", self.path("proj"))
+
+        self.assertIn("Skipping command \"echo proj\"", output)
+        self.assertFalse(os.path.exists(self.path("proj")))
+        with tarfile.open(path, "r:gz") as tar:
+            self.assertEqual(b"# proj", tar.extractfile("proj/README.md").read())
+            self.assertTrue(tar.getmember("proj/bin/proj.sh").mode & stat.S_IXUSR)
+            self.assertEqual("bin/proj.sh", tar.getmember("proj/run").linkname)
+            self.assertIn("proj/" + MANIFEST_FILE_NAME, tar.getnames())
+
+    def test_new_zip(self):
+        self.make_ptool_dir(_TEMPLATE_FILES)
+        path = self.path("proj.zip")
+        self.run_ptool("new", "--archive", path, "tool", self.path("proj"))
+
+        with zipfile.ZipFile(path) as z:
+            self.assertEqual(b"# proj", z.read("proj/README.md"))
+            self.assertTrue((z.getinfo("proj/bin/proj.sh").external_attr >> 16) & stat.S_IXUSR)
+            self.assertEqual(b"bin/proj.sh", z.read("proj/run"))
+
+    def test_new_stdout(self):
+        self.make_ptool_dir(_TEMPLATE_FILES)
+        process = subprocess.Popen(
+            [sys.executable, "-m", "ptool", "new", "--archive", "-", "tool", self.path("proj")],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            **self._ptool_kwargs())
+        stdout, stderr = process.communicate()
+        self.assertEqual(0, process.returncode)
+
+        # Messages go to standard error so that the stream stays intact
+        self.assertIn("Skipping command \"echo proj\"", stderr)
+        with tarfile.open(fileobj=io.BytesIO(stdout), mode="r:gz") as tar:
+            self.assertEqual(b"# proj", tar.extractfile("proj/README.md").read())
+            self.assertEqual("bin/proj.sh", tar.getmember("proj/run").linkname)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import unittest
+
+from ptool.project_yaml import read_command
+
+class _Context(object):
+    def render_from_template_string(self, template, values):
+        return template
+
+class ReadCommandTests(unittest.TestCase):
+    def test_run_uses_shell_for_shell_syntax(self):
+        process = read_command({ "run": "git init -q . && git add ." }).prepare(_Context(), {})
+        self.assertTrue(process.shell)
+        self.assertEqual("git init -q . && git add .", process.args)
+
+    def test_run_splits_plain_command(self):
+        process = read_command({ "run": { "command": "git init -q ." } }).prepare(_Context(), {})
+        self.assertFalse(process.shell)
+        self.assertEqual(["git", "init", "-q", "."], process.args)
+
+    def test_run_shell_false(self):
+        process = read_command({ "run": { "command": "echo a>b", "shell": False } }).prepare(_Context(), {})
+        self.assertFalse(process.shell)
+        self.assertEqual(["echo", "a>b"], process.args)
+
+    def test_default_after_not_shared(self):
+        command = read_command("echo hi")
+        command.after.append("other")
+        self.assertEqual([], read_command("echo hi").after)
+
+if __name__ == "__main__":
+    unittest.main()
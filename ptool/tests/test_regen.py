@@ -0,0 +1,59 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import os
+import unittest
+
+from ptool.manifest import Manifest, file_sha1
+from ptool.tests.helpers import TempDirTestCase, git, read_file, write_file
+
+_TEMPLATE_YAML = """description: Tool
+files:
+  - README.md
+  - NOTES.md
+commands:
+  - "git init -q . && git add ."
+  - "printf changed > README.md"
+"""
+
+class RegenTests(TempDirTestCase):
+    def setUp(self):
+        super(RegenTests, self).setUp()
+        self.make_ptool_dir({
+            "tool/_ptool.yaml": _TEMPLATE_YAML,
+            "tool/README.md": "{{ project_name }}\n",
+            "tool/NOTES.md": "notes for {{ project_name }}\n"
+        })
+        self.output_dir = self.path("out")
+        self.run_ptool("new", "-n", "proj", "tool", self.output_dir)
+
+    def test_manifest_records_files_changed_by_commands(self):
+        manifest = Manifest.try_read(self.output_dir)
+        self.assertEqual("tool", manifest.template_name)
+        self.assertEqual(file_sha1(os.path.join(self.output_dir, "README.md")), manifest.files["README.md"])
+        self.assertEqual(file_sha1(os.path.join(self.output_dir, "NOTES.md")), manifest.files["NOTES.md"])
+
+        # Commands still see the manifest
+        self.assertTrue(len(git(self.output_dir, "ls-files", ".ptool-manifest.json")) > 0)
+
+    def test_regen_updates_only_changed_files(self):
+        # The file changed by a command is not reported as a local edit
+        self.assertIn("1 file(s) updated, 1 unchanged, 0 conflict(s)", self.run_ptool("regen", self.output_dir))
+        self.assertEqual("proj", read_file(os.path.join(self.output_dir, "README.md")))
+        self.assertIn("0 file(s) updated, 2 unchanged, 0 conflict(s)", self.run_ptool("regen", self.output_dir))
+
+        # A local edit is kept and reported while other files are updated
+        write_file(os.path.join(self.output_dir, "NOTES.md"), "local edit\n")
+        template_dir = self.path("ptool", "ptool-templates", "tool")
+        write_file(os.path.join(template_dir, "README.md"), "new {{ project_name }}\n")
+        write_file(os.path.join(template_dir, "NOTES.md"), "new notes\n")
+        output = self.run_ptool("regen", self.output_dir)
+        self.assertIn("1 file(s) updated, 0 unchanged, 1 conflict(s)", output)
+        self.assertEqual("new proj", read_file(os.path.join(self.output_dir, "README.md")))
+        self.assertEqual("local edit\n", read_file(os.path.join(self.output_dir, "NOTES.md")))
+
+if __name__ == "__main__":
+    unittest.main()
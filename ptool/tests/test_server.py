@@ -0,0 +1,74 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import json
+import os
+import socket
+import unittest
+
+from ptool.tests.helpers import TempDirTestCase, git, read_file, write_file
+
+class ServerTests(TempDirTestCase):
+    def setUp(self):
+        super(ServerTests, self).setUp()
+        self.make_ptool_dir({
+            "tool/_ptool.yaml": "description: Tool\ntemplate-values:\n  colour: red\nfiles:\n  - README.md\n",
+            "tool/README.md": "{{ project_name }} {{ colour }}\n"
+        })
+        socket_path = self.path("serve.sock")
+        process = self.start_ptool("serve", "--socket", socket_path)
+        self.assertIn("Listening on", process.stdout.readline())
+
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(socket_path)
+        self.addCleanup(self.socket.close)
+        self.responses = self.socket.makefile("rb")
+        self.addCleanup(self.responses.close)
+
+    def request(self, line):
+        self.socket.sendall(line + "\n")
+        return json.loads(self.responses.readline())
+
+    def call(self, request_id, method, **params):
+        return self.request(json.dumps({ "id": request_id, "method": method, "params": params }))
+
+    def test_requests_on_one_connection(self):
+        response = self.call(1, "templates")
+        self.assertEqual(1, response["id"])
+        self.assertEqual([{ "name": "tool", "repository": "default", "description": "Tool", "value-keys": ["colour"], "file-count": 1 }], response["result"])
+
+        response = self.call(2, "values", template="tool", values={ "colour": "blue" })
+        self.assertEqual("blue", response["result"]["colour"]["value"])
+        self.assertEqual("example-project-name-ABC", response["result"]["project_name"]["value"])
+
+        output_dir = self.path("out")
+        response = self.call(3, "generate", template="tool", **{ "output-dir": output_dir, "project-name": "proj" })
+        self.assertEqual({ "output-dir": output_dir, "files": 1, "bytes": 8 }, response["result"])
+        self.assertEqual("proj red", read_file(os.path.join(output_dir, "README.md")))
+
+        response = self.call(4, "generate", template="tool", **{ "output-dir": output_dir })
+        self.assertEqual(4, response["id"])
+        self.assertIn("already exists", response["error"])
+
+    def test_errors(self):
+        self.assertEqual(1, self.call(1, "unknown")["id"])
+        self.assertIn("Unsupported method", self.call(1, "unknown")["error"])
+        self.assertIn("Missing parameter \"template\"", self.call(2, "values")["error"])
+        self.assertIn("must be an absolute path", self.call(3, "generate", template="tool", **{ "output-dir": "out" })["error"])
+        self.assertIn("No template \"other\"", self.call(4, "values", template="other")["error"])
+        self.assertIn("Invalid request", self.request("{")["error"])
+        self.assertIn("must be a JSON object", self.request("[]")["error"])
+
+    def test_refreshes_after_head_change(self):
+        self.assertEqual("red", self.call(1, "values", template="tool")["result"]["colour"]["value"])
+
+        repo_dir = self.path("ptool", "ptool-templates")
+        write_file(os.path.join(repo_dir, "tool", "_ptool.yaml"), "description: Tool\ntemplate-values:\n  colour: green\nfiles:\n  - README.md\n")
+        git(repo_dir, "commit", "-q", "-a", "-m", "Change colour")
+        self.assertEqual("green", self.call(2, "values", template="tool")["result"]["colour"]["value"])
+
+if __name__ == "__main__":
+    unittest.main()
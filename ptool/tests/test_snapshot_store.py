@@ -0,0 +1,52 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import os
+import unittest
+
+from ptool.snapshot_store import SnapshotStore
+from ptool.tests.helpers import TempDirTestCase, git, write_file
+
+_LONG_AGO = 1000000000
+
+class TestSnapshotStore(TempDirTestCase):
+    def setUp(self):
+        super(TestSnapshotStore, self).setUp()
+        self.repo_dir = self.path("templates")
+        os.makedirs(self.repo_dir)
+        git(self.repo_dir, "init", "-q")
+        write_file(self.path("templates", "demo", "_ptool.yaml"), b"files: []\n")
+        git(self.repo_dir, "add", "-A")
+        git(self.repo_dir, "commit", "-q", "-m", "Templates")
+        self.commit = git(self.repo_dir, "rev-parse", "HEAD").strip().decode("ascii")
+        self.store = SnapshotStore(self.repo_dir, self.path("snapshots"))
+
+    def test_prune_keeps_snapshot_in_use(self):
+        snapshot = self.store.snapshot(self.commit, "demo")
+        os.utime(snapshot.path, (_LONG_AGO, _LONG_AGO))
+
+        self.store.prune("other")
+        self.assertTrue(os.path.isdir(snapshot.path))
+
+        snapshot.release()
+        self.store.prune("other")
+        self.assertFalse(os.path.isdir(snapshot.path))
+
+    def test_use_defers_prune(self):
+        snapshot = self.store.snapshot(self.commit, "demo")
+        snapshot.release()
+        os.utime(snapshot.path, (_LONG_AGO, _LONG_AGO))
+
+        # Reading the snapshot again counts as a use
+        self.store.snapshot(self.commit, "demo").release()
+        self.store.prune("other")
+        self.assertTrue(os.path.isdir(snapshot.path))
+
+    def test_missing_template(self):
+        self.assertIsNone(self.store.snapshot(self.commit, "missing"))
+
+if __name__ == "__main__":
+    unittest.main()
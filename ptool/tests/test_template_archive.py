@@ -0,0 +1,77 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import marshal
+import os
+import traceback
+import unittest
+
+import jinja2
+
+from ptool.template_archive import TemplateArchiveSection, compile_template_spec
+from ptool.template_spec import TemplateSpec
+from ptool.template_util import TemplateContext
+from ptool.tests.helpers import TempDirTestCase, read_file, write_file
+
+class CompileTemplateSpecTests(TempDirTestCase):
+    def setUp(self):
+        super(CompileTemplateSpecTests, self).setUp()
+        self.repo_dir = self.make_repo({
+            "tool/_ptool.yaml": "files:\n  - path: a.txt\n    output-path: \"{{ name }}.txt\"\ncommands:\n  - \"echo {{ name }}\"\n",
+            "tool/a.txt": "first\n{% include 'shared/b.txt' %}\n{{ name.missing }}\n",
+            "shared/b.txt": "{{ name }}"
+        })
+        self.template_spec = TemplateSpec.read(self.repo_dir, "tool")
+        self.source_path = os.path.join(self.repo_dir, "tool", "a.txt")
+
+    def context(self, archive_section=None):
+        return TemplateContext(
+            [self.template_spec.template_dir, self.repo_dir],
+            self.template_spec.template_dir,
+            {},
+            warn_missing_entrypoint=False,
+            archive_section=archive_section)
+
+    def section(self):
+        data = compile_template_spec(self.repo_dir, self.template_spec, self.context())
+        return TemplateArchiveSection(self.repo_dir, marshal.loads(data))
+
+    def test_entries(self):
+        section = self.section()
+        self.assertIsNotNone(section.file_code(self.source_path))
+        self.assertIsNotNone(section.name_code("shared/b.txt"))
+        self.assertIsNotNone(section.string_code("{{ name }}.txt"))
+        self.assertIsNotNone(section.string_code("echo {{ name }}"))
+
+        # Edited sources are read from the file system instead
+        write_file(self.source_path, "changed\n")
+        st = os.stat(self.source_path)
+        os.utime(self.source_path, (st.st_atime, st.st_mtime + 10))
+        self.assertIsNone(section.file_code(self.source_path))
+
+    def test_errors_name_source_file(self):
+        ctx = self.context(self.section())
+        with self.assertRaises(jinja2.exceptions.UndefinedError):
+            try:
+                ctx.render_from_template_file(self.source_path, { "name": "proj" })
+            except jinja2.exceptions.UndefinedError:
+                self.assertIn("File \"{}\", line 3".format(self.source_path), traceback.format_exc())
+                raise
+
+class CompileTests(TempDirTestCase):
+    def test_new_uses_archive(self):
+        self.make_ptool_dir({
+            "tool/_ptool.yaml": "files:\n  - README.md\n",
+            "tool/README.md": "{% include 'shared/title.txt' %} {{ colour }}\n",
+            "shared/title.txt": "{{ project_name }}"
+        })
+        self.assertIn("Compiled 1 template(s)", self.run_ptool("compile"))
+
+        self.run_ptool("new", "tool", self.path("out"), "colour=red")
+        self.assertEqual("out red", read_file(self.path("out", "README.md")))
+
+if __name__ == "__main__":
+    unittest.main()
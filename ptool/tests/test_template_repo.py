@@ -0,0 +1,116 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import os
+import unittest
+
+from ptool.catalog import TemplateCatalog
+from ptool.git_util import is_shallow_repo, is_sparse_checkout
+from ptool.template_repo import check_out_template, update_template_repo
+from ptool.template_spec import find_template
+from ptool.tests.helpers import TempDirTestCase, git, read_file, write_file
+
+_FILES = {
+    "one/_ptool.yaml": "description: One\nfiles:\n  - README.md\n",
+    "one/README.md": "one\n",
+    "two/_ptool.yaml": "description: Two\nfiles: []\n",
+    "shared/include.txt": "shared\n"
+}
+
+class TemplateRepoTests(TempDirTestCase):
+    def commit_upstream(self, relpath, content):
+        upstream_dir = self.path("templates")
+        write_file(os.path.join(upstream_dir, *relpath.split("/")), content)
+        git(upstream_dir, "add", "-A")
+        git(upstream_dir, "commit", "-q", "-m", "Change {}".format(relpath))
+        return git(upstream_dir, "rev-parse", "HEAD").strip()
+
+    def test_shallow_update(self):
+        config = self.make_config(_FILES, clone="shallow")
+        self.commit_upstream("one/README.md", "one again\n")
+        repository = config.repositories[0]
+        repo_dir = repository.repo_dir
+        self.assertTrue(is_shallow_repo(repo_dir))
+        self.assertEqual("1", git(repo_dir, "rev-list", "--count", "HEAD").strip())
+
+        new_commit = self.commit_upstream("one/README.md", "changed\n")
+        result = update_template_repo(repository)
+        self.assertEqual(new_commit, result.new_commit)
+        self.assertNotEqual(result.old_commit, result.new_commit)
+        self.assertTrue(result.objects_fetched > 0)
+        self.assertEqual("changed\n", read_file(os.path.join(repo_dir, "one", "README.md")))
+
+        # The clone stays shallow
+        self.assertTrue(is_shallow_repo(repo_dir))
+        self.assertEqual("1", git(repo_dir, "rev-list", "--count", "HEAD").strip())
+
+        result = update_template_repo(repository)
+        self.assertEqual(result.old_commit, result.new_commit)
+
+    def test_sparse_checkout(self):
+        config = self.make_config(_FILES, sparse=True)
+        repository = config.repositories[0]
+        repo_dir = repository.repo_dir
+        self.assertTrue(is_sparse_checkout(repo_dir))
+        self.assertTrue(os.path.isfile(os.path.join(repo_dir, "shared", "include.txt")))
+        self.assertFalse(os.path.exists(os.path.join(repo_dir, "one")))
+
+        # Templates that are not checked out are listed from Git objects
+        catalog = TemplateCatalog(repo_dir, repository.catalog_path)
+        self.assertEqual(["One", "Two"], [entry.description for entry in catalog.entries()])
+
+        self.assertTrue(check_out_template(repository, "one"))
+        self.assertFalse(check_out_template(repository, "missing"))
+        self.assertEqual("one\n", read_file(os.path.join(repo_dir, "one", "README.md")))
+        self.assertFalse(os.path.exists(os.path.join(repo_dir, "two")))
+
+    def test_sparse_update(self):
+        config = self.make_config(_FILES, sparse=True)
+        repository = config.repositories[0]
+        repo_dir = repository.repo_dir
+        check_out_template(repository, "one")
+
+        self.commit_upstream("one/README.md", "changed\n")
+        self.commit_upstream("two/README.md", "two\n")
+        self.commit_upstream("shared2/include.txt", "shared2\n")
+        update_template_repo(repository)
+
+        # Checked-out templates are updated and new shared directories added,
+        # but other templates stay out of the working tree
+        self.assertEqual("changed\n", read_file(os.path.join(repo_dir, "one", "README.md")))
+        self.assertEqual("shared2\n", read_file(os.path.join(repo_dir, "shared2", "include.txt")))
+        self.assertFalse(os.path.exists(os.path.join(repo_dir, "two")))
+
+    def test_update_checks_out_new_commits(self):
+        config = self.make_config(_FILES)
+        repository = config.repositories[0]
+        update_template_repo(repository, 60)
+
+        new_commit = self.commit_upstream("one/README.md", "changed\n")
+        result = update_template_repo(repository, 60)
+        self.assertTrue(result.is_changed)
+        self.assertEqual(new_commit, result.new_commit)
+        self.assertEqual("changed\n", read_file(os.path.join(repository.clone_dir, "one", "README.md")))
+        self.assertFalse(os.path.exists(os.path.join(repository.clone_dir, ".git", "index.lock")))
+
+    def test_snapshots(self):
+        config = self.make_config(_FILES, snapshots=True)
+        repository, template_spec = find_template(config, "one")
+        readme_path = os.path.join(template_spec.template_dir, "README.md")
+        self.assertTrue(template_spec.template_dir.startswith(self.path("ptool", "snapshots")))
+        self.assertEqual("one\n", read_file(readme_path))
+
+        # An update does not change the templates of a generation in progress
+        new_commit = self.commit_upstream("one/README.md", "changed\n")
+        update_template_repo(repository)
+        self.assertEqual("one\n", read_file(readme_path))
+
+        _, new_template_spec = find_template(config, "one")
+        self.assertEqual(new_commit, new_template_spec.commit)
+        self.assertEqual("changed\n", read_file(os.path.join(new_template_spec.template_dir, "README.md")))
+
+if __name__ == "__main__":
+    unittest.main()
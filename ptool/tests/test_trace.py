@@ -0,0 +1,64 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import json
+import unittest
+
+from ptool.trace import SPAN_FILE, SPAN_PHASE, Tracer, span, start_tracing, stop_tracing
+from ptool.tests.helpers import TempDirTestCase, read_file
+
+class TraceTests(unittest.TestCase):
+    def test_disabled_span_is_shared(self):
+        self.assertIs(span("a"), span("b"))
+        with span("a") as s:
+            s.set("bytes", 1)
+
+    def test_spans_recorded_while_tracing(self):
+        tracer = start_tracing()
+        self.addCleanup(stop_tracing)
+        with span("Render", SPAN_PHASE):
+            with span("a.txt", SPAN_FILE) as s:
+                s.set("bytes", 10)
+        self.assertIs(tracer, stop_tracing())
+        with span("Ignored"):
+            pass
+
+        self.assertEqual(["a.txt", "Render"], [e["name"] for e in tracer.events])
+        self.assertEqual({ "bytes": 10 }, tracer.events[0]["args"])
+        self.assertTrue(all(e["ph"] == "X" for e in tracer.events))
+
+    def test_summary_combines_phases(self):
+        tracer = Tracer()
+        tracer.add_events([
+            { "name": "Render", "cat": SPAN_PHASE, "ts": 0, "dur": 1000, "args": { "bytes": 1 } },
+            { "name": "Scan", "cat": SPAN_PHASE, "ts": 1, "dur": 500, "args": {} },
+            { "name": "Render", "cat": SPAN_PHASE, "ts": 2, "dur": 2000, "args": { "bytes": 2 } }
+        ])
+        lines = tracer.summary_lines()
+        self.assertEqual("Phases", lines[0])
+        self.assertTrue(lines[1].endswith("Render (x2)"))
+        self.assertIn("3.0 ms", lines[1])
+        self.assertIn("3 B", lines[1])
+        self.assertTrue(lines[2].endswith("Scan"))
+
+class TraceOptionTests(TempDirTestCase):
+    def test_trace_new(self):
+        self.make_ptool_dir({
+            "tool/_ptool.yaml": "files:\n  - README.md\ncommands:\n  - \"echo {{ project_name }}\"\n",
+            "tool/README.md": "{{ project_name }}\n"
+        })
+        trace_path = self.path("trace.json")
+        output = self.run_ptool("--trace", trace_path, "--timings", "new", "tool", self.path("out"))
+        self.assertIn("Phases", output)
+
+        events = json.loads(read_file(trace_path))["traceEvents"]
+        names = [e["name"] for e in events]
+        for name in ["ptool new", "Generate files", "Write manifest", "Run commands", "echo out"]:
+            self.assertIn(name, names)
+        self.assertIn(self.path("ptool", "ptool-templates", "tool", "README.md"), [e["name"] for e in events if e["cat"] == SPAN_FILE])
+
+if __name__ == "__main__":
+    unittest.main()
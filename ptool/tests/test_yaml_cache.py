@@ -0,0 +1,68 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import os
+import unittest
+
+import ptool.yaml_cache
+from ptool.tests.helpers import TempDirTestCase, write_file
+from ptool.yaml_cache import YamlCache
+
+class YamlCacheTests(TempDirTestCase):
+    def setUp(self):
+        super(YamlCacheTests, self).setUp()
+        self.cache_path = self.path("cache", "yaml.pickle")
+
+        # Records the files parsed rather than read from the cache
+        self.parsed_paths = []
+        read_yaml_file = ptool.yaml_cache.read_yaml_file
+        def counting_read_yaml_file(path):
+            self.parsed_paths.append(path)
+            return read_yaml_file(path)
+        ptool.yaml_cache.read_yaml_file = counting_read_yaml_file
+        self.addCleanup(setattr, ptool.yaml_cache, "read_yaml_file", read_yaml_file)
+
+    def test_saved_once(self):
+        paths = [self.path("{}.yaml".format(i)) for i in range(3)]
+        for i, path in enumerate(paths):
+            write_file(path, "value: {}\n".format(i))
+
+        cache = YamlCache(self.cache_path)
+        self.assertEqual([{ "value": i } for i in range(3)], [cache.read(path) for path in paths])
+        self.assertFalse(os.path.exists(self.cache_path))
+
+        cache.save()
+        os.utime(self.cache_path, (1000, 1000))
+
+        # Hits leave nothing to save
+        cache = YamlCache(self.cache_path)
+        self.assertEqual([{ "value": i } for i in range(3)], [cache.read(path) for path in paths])
+        cache.save()
+        self.assertEqual(1000, os.path.getmtime(self.cache_path))
+        self.assertEqual(paths, self.parsed_paths)
+
+    def test_invalidated_by_mtime(self):
+        path = self.path("a.yaml")
+        write_file(path, "value: 1\n")
+        cache = YamlCache(self.cache_path)
+        cache.read(path)
+        cache.save()
+
+        write_file(path, "value: 2\n")
+        st = os.stat(path)
+        os.utime(path, (st.st_atime, st.st_mtime + 10))
+        self.assertEqual({ "value": 2 }, YamlCache(self.cache_path).read(path))
+        self.assertEqual([path, path], self.parsed_paths)
+
+    def test_returns_copies(self):
+        path = self.path("a.yaml")
+        write_file(path, "values:\n  a: 1\n")
+        cache = YamlCache(self.cache_path)
+        cache.read(path)["values"]["a"] = 2
+        self.assertEqual({ "values": { "a": 1 } }, cache.read(path))
+
+if __name__ == "__main__":
+    unittest.main()
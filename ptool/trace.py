@@ -0,0 +1,144 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+SPAN_PHASE = "phase"
+SPAN_FILE = "file"
+SPAN_COMMAND = "command"
+
+# The active tracer for this process, or None when tracing is disabled so
+# that spans cost a single check
+_TRACER = None
+
+class _Span(object):
+    def __init__(self):
+        self._args = {}
+
+    @property
+    def args(self): return self._args
+
+    def set(self, key, value):
+        self._args[key] = value
+
+# Also its own context manager, so that a disabled span creates nothing
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set(self, key, value):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+# Records complete events in Chrome trace-event format: timestamps are wall
+# clock microseconds so that events from worker processes line up
+class Tracer(object):
+    def __init__(self):
+        self._events = []
+
+    @property
+    def events(self): return self._events
+
+    @contextlib.contextmanager
+    def span(self, name, category, **args):
+        span = _Span()
+        span.args.update(args)
+        start = time.time()
+        try:
+            yield span
+        finally:
+            end = time.time()
+            self._events.append({
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": int(start * 1000000),
+                "dur": int((end - start) * 1000000),
+                "pid": os.getpid(),
+                "tid": threading.current_thread().ident,
+                "args": span.args
+            })
+
+    def take_events(self):
+        events = self._events
+        self._events = []
+        return events
+
+    def add_events(self, events):
+        self._events.extend(events)
+
+    def write(self, path):
+        with open(path, "wt") as f:
+            json.dump({ "traceEvents": self._events, "displayTimeUnit": "ms" }, f)
+
+    def summary_lines(self, limit=10):
+        lines = []
+        for category, title in [(SPAN_PHASE, "Phases"), (SPAN_FILE, "Slowest files"), (SPAN_COMMAND, "Slowest commands")]:
+            events = [e for e in self._events if e["cat"] == category]
+            if len(events) == 0:
+                continue
+
+            if category == SPAN_PHASE:
+                rows = _phase_rows(events)
+            else:
+                rows = [
+                    (e["name"], 1, e["dur"], e["args"].get("bytes"))
+                    for e in sorted(events, key=lambda e: e["dur"], reverse=True)[0 : limit]
+                ]
+
+            lines.append(title)
+            for name, count, duration, size in rows:
+                lines.append("  {:>10.1f} ms  {:>12}  {}{}".format(
+                    duration / 1000.0,
+                    "" if size is None else "{} B".format(size),
+                    name,
+                    "" if count == 1 else " (x{})".format(count)))
+        return lines
+
+# Phases with the same name, such as those recorded by each worker process,
+# are combined into a single row in order of first appearance
+def _phase_rows(events):
+    rows = {}
+    names = []
+    for e in sorted(events, key=lambda e: e["ts"]):
+        row = rows.get(e["name"])
+        if row is None:
+            names.append(e["name"])
+            row = rows[e["name"]] = [e["name"], 0, 0, None]
+        row[1] += 1
+        row[2] += e["dur"]
+        size = e["args"].get("bytes")
+        if size is not None:
+            row[3] = (row[3] or 0) + size
+    return [tuple(rows[name]) for name in names]
+
+def start_tracing():
+    global _TRACER
+    if _TRACER is None:
+        _TRACER = Tracer()
+    return _TRACER
+
+def stop_tracing():
+    global _TRACER
+    tracer = _TRACER
+    _TRACER = None
+    return tracer
+
+def current_tracer():
+    return _TRACER
+
+def span(name, category=SPAN_PHASE, **args):
+    if _TRACER is None:
+        return _NULL_SPAN
+    return _TRACER.span(name, category, **args)
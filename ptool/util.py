@@ -4,8 +4,66 @@
 #
 # -----------------------------------------------------------------------------
 
-import yaml
+import contextlib
+import os
+import tempfile
+
+from ptool.trace import span
+
+# Uses the libyaml-backed loader when PyYAML was built with it
+def _yaml_loader():
+    import yaml
+    return getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
 def read_yaml_file(path):
-    with open(path, "rt") as f:
-        return yaml.load(f)
+    import yaml
+    with span("Parse YAML", "yaml", path=path), open(path, "rt") as f:
+        return yaml.load(f, Loader=_yaml_loader())
+
+# Parses YAML read from somewhere other than the file system, such as a Git
+# object, with path used only to identify it
+def parse_yaml(s, path):
+    import yaml
+    with span("Parse YAML", "yaml", path=path):
+        return yaml.load(s, Loader=_yaml_loader())
+
+def ensure_dir(path):
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+
+_UMASK = None
+
+# Reading the umask requires temporarily changing it, so only do it once
+def _get_umask():
+    global _UMASK
+    if _UMASK is None:
+        _UMASK = os.umask(0)
+        os.umask(_UMASK)
+    return _UMASK
+
+def default_file_mode():
+    return 0o666 & ~_get_umask()
+
+def default_dir_mode():
+    return 0o777 & ~_get_umask()
+
+@contextlib.contextmanager
+def atomic_write(path, mode="wb"):
+    # Write to a temporary file and rename so that concurrent readers never
+    # observe a partially written file
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.chmod(temp_path, default_file_mode())
+        if os.name == "nt" and os.path.exists(path):
+            os.unlink(path)
+        os.rename(temp_path, path)
+    except:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
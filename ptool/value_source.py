@@ -37,3 +37,6 @@ class ValueSource(object):
 
     @property
     def values(self): return self._values
+
+def without_sources(values):
+    return { key : value for key, (value, _) in values.iteritems() }
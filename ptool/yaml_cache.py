@@ -0,0 +1,85 @@
+# -----------------------------------------------------------------------------
+#
+# Copyright (C) 2017, Richard Cook. All rights reserved.
+#
+# -----------------------------------------------------------------------------
+
+import copy
+import os
+import threading
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from ptool.file_lock import file_lock
+from ptool.util import atomic_write, read_yaml_file
+
+_YAML_CACHE_VERSION = 1
+
+def _stat_key(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime
+
+# Parsed YAML documents keyed by path and validated against file size and
+# modification time, so unchanged files are loaded without parsing YAML; new
+# entries are only written to disk by save. The server reads and saves from
+# several threads, so entries are only accessed while holding the lock.
+class YamlCache(object):
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._entries = None
+        self._dirty = False
+
+    @property
+    def path(self): return self._path
+
+    # Returns a copy so that callers may modify the document without changing
+    # the cached entry
+    def read(self, path):
+        stat_key = _stat_key(path)
+        with self._lock:
+            entry = self._load().get(path)
+        if entry is None or entry[0] != stat_key:
+            entry = stat_key, read_yaml_file(path)
+            with self._lock:
+                self._entries[path] = entry
+                self._dirty = True
+        return copy.deepcopy(entry[1])
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+
+            # Entries written by other processes since this cache was loaded
+            # are kept, so that concurrent processes do not discard each
+            # other's work
+            with file_lock(self._path + ".lock"):
+                entries = self._read_entries()
+                entries.update(self._entries)
+                self._entries = entries
+                with atomic_write(self._path) as f:
+                    pickle.dump((_YAML_CACHE_VERSION, self._entries), f, pickle.HIGHEST_PROTOCOL)
+            self._dirty = False
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = self._read_entries()
+        return self._entries
+
+    def _read_entries(self):
+        if os.path.isfile(self._path):
+            try:
+                with open(self._path, "rb") as f:
+                    version, entries = pickle.load(f)
+                if version == _YAML_CACHE_VERSION:
+                    return entries
+            except Exception:
+                pass
+        return {}
+
+def read_yaml_file_cached(path, yaml_cache=None):
+    return read_yaml_file(path) if yaml_cache is None else yaml_cache.read(path)